@@ -43,16 +43,28 @@ def lambda_handler(event, context):
             message="Invalid 'limit' or 'page' parameter",
             error_code=ErrorCode.VALIDATION_ERROR,
         )
+    cursor = query_params.get("cursor")
+    exact_total = query_params.get("exact_total", "false").lower() == "true"
 
     try:
-        tasks, total = vector_db_service.fetch_tasks(page=page, limit=limit)
+        tasks, total, next_cursor = vector_db_service.fetch_tasks(
+            page=page, limit=limit, cursor=cursor, exact_total=exact_total
+        )
         logger.info(f"{len(tasks)} tasks successfully fetched")
 
-        return build_success_response(
-            tasks,
-            metadata={"limit": limit, "page": page, "total": total},
-        )
+        metadata = {"limit": limit, "total": total, "next_cursor": next_cursor}
+        # A cursor, not the page number, positions a cursor request
+        if cursor is None:
+            metadata["page"] = page
+        return build_success_response(tasks, metadata=metadata)
 
+    except ValueError as e:
+        logger.error(f"Invalid pagination cursor: {e}")
+        return build_error_response(
+            status_code=400,
+            message="Invalid 'cursor' parameter",
+            error_code=ErrorCode.VALIDATION_ERROR,
+        )
     except Exception as e:
         logger.exception(f"Unhandled error in lambda_handler: {e}")
         return build_error_response(500, "Internal server error")
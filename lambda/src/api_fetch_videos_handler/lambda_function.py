@@ -24,17 +24,23 @@ def lambda_handler(event, context):
         query_params = event.get("queryStringParameters") or {}
         limit = int(query_params.get("limit", 12))
         page = int(query_params.get("page", 0))
+        cursor = query_params.get("cursor")
+        exact_total = query_params.get("exact_total", "false").lower() == "true"
 
         logger.info("Fetching videos...")
-        videos_data, total = vector_db.fetch_videos(page=page, limit=limit)
+        videos_data, total, next_cursor = vector_db.fetch_videos(
+            page=page, limit=limit, cursor=cursor, exact_total=exact_total
+        )
 
         logger.debug(f"Adding presigned URLs to videos: {videos_data}")
         add_presigned_urls(videos_data, PRESIGNED_URL_EXPIRY)
 
         logger.debug(f"Successfully added presigned urls: {videos_data}")
-        return build_success_response(
-            data=videos_data, metadata={"total": total, "limit": limit, "page": page}
-        )
+        metadata = {"total": total, "limit": limit, "next_cursor": next_cursor}
+        # A cursor, not the page number, positions a cursor request
+        if cursor is None:
+            metadata["page"] = page
+        return build_success_response(data=videos_data, metadata=metadata)
 
     except ValueError as e:
         logger.error(f"Error in lambda: {e}")
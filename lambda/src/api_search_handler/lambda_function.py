@@ -1,6 +1,7 @@
 import os
 from embed_service import EmbedService
 from vector_db_service import VectorDBService
+from snapshot_search import SnapshotSearchEngine
 from search_controller import SearchController
 from search_errors import (
     SearchError,
@@ -24,6 +25,8 @@ EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "Marengo-retrieval-2.7"
 DEFAULT_CLIP_LENGTH = int(os.getenv("DEFAULT_CLIP_LENGTH", "6"))
 QUERY_MEDIA_FILE_SIZE_LIMIT = int(os.getenv("QUERY_MEDIA_FILE_SIZE_LIMIT", "6000000"))
 EMBEDDING_CACHE_TABLE_NAME = os.getenv("EMBEDDING_CACHE_TABLE_NAME")
+# "memory" ranks new sessions over an in-process embedding snapshot
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "database")
 
 SECRET = get_secret(SECRET_NAME)
 DB_CONFIG = get_db_config(SECRET)
@@ -38,11 +41,17 @@ embed_service = EmbedService(
     cache_table_name=EMBEDDING_CACHE_TABLE_NAME,
 )
 vector_db_service = VectorDBService(db_params=DB_CONFIG, logger=logger)
+search_engine = (
+    SnapshotSearchEngine(vector_db_service, logger=logger)
+    if SEARCH_ENGINE == "memory"
+    else None
+)
 search_controller = SearchController(
     embed_service=embed_service,
     vector_db_service=vector_db_service,
     query_media_file_size_limit=QUERY_MEDIA_FILE_SIZE_LIMIT,
     logger=logger,
+    search_engine=search_engine,
 )
 
 
@@ -2,8 +2,14 @@ import json
 import base64
 import multipart
 import io
+from uuid import UUID
 from embed_service import EmbedService
-from vector_db_service import VectorDBService
+from vector_db_service import (
+    SEGMENT_MODALITIES,
+    SEGMENT_SCOPES,
+    SessionOptions,
+    VectorDBService,
+)
 from logging import getLogger, Logger
 from typing import Dict, List, Any, Optional, Union, Literal
 from s3_utils import add_presigned_urls
@@ -17,14 +23,33 @@ from search_errors import (
 from pydantic import BaseModel, Field, field_validator, ValidationError
 
 DEFAULT_PAGE_LIMIT = 10
+# Search parameters and SessionOptions only the database search implements; a
+# search that sets one is ranked by the database even with a search engine
+DATABASE_ONLY_PARAMS = [
+    "search_mode",
+    "oversample",
+    "nprobe",
+    "strategy",
+    "group_by",
+    "diversity",
+    "fuse_modalities",
+    "query_text",
+]
 DEFAULT_QUERY_MODALITY: List[Literal["visual-text", "audio"]] = ["visual-text"]
 DEFAULT_MIN_SIMILARITY = 0.2
+# Form fields sent as JSON text
+JSON_FIELDS = ["filter", "query_modality", "modality_weights"]
 
 
 class SearchRequest(BaseModel):
     query_type: Literal["text", "image", "video", "audio"] = "text"
+    session_token: Optional[UUID] = None
     query_text: Optional[str] = None
+    page: int = Field(0, ge=0, description="Must be non-negative")
     page_limit: int = Field(DEFAULT_PAGE_LIMIT, gt=0, description="Must be positive")
+    # Applied to the nearest segments after they are ranked: a search holds
+    # fewer than page_limit results per page only once fewer segments meet it,
+    # so a short page is the last one
     min_similarity: Optional[float] = Field(
         DEFAULT_MIN_SIMILARITY, ge=0, le=1, description="Must be between 0 and 1"
     )
@@ -32,12 +57,54 @@ class SearchRequest(BaseModel):
     query_media_url: Optional[str] = None
     query_modality: List[Literal["visual-text", "audio"]] = DEFAULT_QUERY_MODALITY
     filter: Optional[dict[str, Any]] = None
+    search_mode: Optional[
+        Literal["hnsw", "binary", "coarse", "hierarchical", "ivf"]
+    ] = None
+    oversample: Optional[int] = Field(None, gt=0, description="Must be positive")
+    nprobe: Optional[int] = Field(None, gt=0, description="Must be positive")
+    group_by: Optional[Literal["video"]] = None
+    segments_per_video: Optional[int] = Field(
+        None, gt=0, description="Must be positive"
+    )
+    video_score: Literal["max", "mean"] = "max"
+    merge_adjacent: bool = False
+    diversity: Optional[float] = Field(
+        None, ge=0, le=1, description="Must be between 0 and 1"
+    )
+    # Text search only: also match query_text against video filenames and keys
+    hybrid: bool = False
+    # Force an exact scan or an ANN index search instead of choosing per query
+    search_strategy: Optional[Literal["auto", "exact", "ann"]] = None
+    fuse_modalities: bool = False
+    modality_weights: Optional[Dict[Literal["visual-text", "audio"], float]] = None
+
+    @field_validator("modality_weights")
+    @classmethod
+    def validate_modality_weights(cls, value):
+        if value and any(weight < 0 for weight in value.values()):
+            raise ValueError("modality_weights must be non-negative")
+        return value
+
+    @field_validator("filter")
+    @classmethod
+    def validate_filter(cls, value):
+        # Searches scan one index per (modality, scope) partition, so any other
+        # value could never match a segment
+        partition_keys = [("modality", SEGMENT_MODALITIES), ("scope", SEGMENT_SCOPES)]
+        for key, allowed in partition_keys:
+            values = (value or {}).get(key, [])
+            values = values if isinstance(values, list) else [values]
+            unknown = [item for item in values if item not in allowed]
+            if unknown:
+                raise ValueError(f"filter {key} must be one of {allowed}: {unknown}")
+        return value
 
     @field_validator("query_text")
     @classmethod
     def validate_text_query(cls, value, info):
         query_type = info.data.get("query_type")
-        if query_type == "text" and not value:
+        session_token = info.data.get("session_token")
+        if query_type == "text" and not value and not session_token:
             raise ValueError("query_text is required for text search")
         return value
 
@@ -45,7 +112,8 @@ class SearchRequest(BaseModel):
     @classmethod
     def validate_media_query(cls, value, info):
         query_type = info.data.get("query_type")
-        if query_type in ["image", "video", "audio"]:
+        session_token = info.data.get("session_token")
+        if query_type in ["image", "video", "audio"] and not session_token:
             query_media_file = info.data.get("query_media_file")
             if value is None and query_media_file is None:
                 raise ValueError(
@@ -54,12 +122,27 @@ class SearchRequest(BaseModel):
         return value
 
     def get_search_params(self) -> Dict[str, Any]:
-        """Extract search parameters for vector database"""
+        """Extract parameters for creating a search session in the vector database"""
         return {
             "filter": self.filter,
-            "limit": self.page_limit,
-            "page": 0,
             "min_similarity": self.min_similarity,
+            "search_mode": self.search_mode,
+            "oversample": self.oversample,
+            "nprobe": self.nprobe,
+            "strategy": self.search_strategy,
+            "options": SessionOptions(
+                group_by=self.group_by,
+                segments_per_video=self.segments_per_video,
+                video_score=self.video_score,
+                diversity=self.diversity,
+                query_text=(
+                    self.query_text
+                    if self.hybrid and self.query_type == "text"
+                    else None
+                ),
+                fuse_modalities=self.fuse_modalities,
+                modality_weights=self.modality_weights,
+            ),
         }
 
     def get_query_media_file_bytestream(self):
@@ -75,11 +158,16 @@ class SearchController:
         vector_db_service: VectorDBService,
         query_media_file_size_limit: int = 6000000,
         logger: Logger = getLogger(),
+        search_engine=None,
     ):
         self.embed_service = embed_service
         self.vector_db_service = vector_db_service
         self.query_media_file_size_limit = query_media_file_size_limit
         self.logger = logger
+        # Optional in-process engine (snapshot_search.SnapshotSearchEngine) that
+        # ranks new sessions instead of the database
+        self.search_engine = search_engine
+        self.last_search_plan = None
 
     def parse_lambda_event(self, event) -> SearchRequest:
         # Lambda event body must be passed as binary data
@@ -158,7 +246,7 @@ class SearchController:
                         else:  # Text field
                             try:
                                 value = part.value
-                                if field_name in ["filter", "query_modality"] and value:
+                                if field_name in JSON_FIELDS and value:
                                     value = json.loads(value)
                                 search_request[field_name] = value
                                 self.logger.debug(f"Processed text field: {field_name}")
@@ -204,22 +292,42 @@ class SearchController:
             self.logger.error(f"Unexpected error in parse_form_data: {str(e)}")
             raise SearchRequestError(f"Failed to parse request: {str(e)}")
 
-    def process_search_request(self, event) -> tuple[List[Any], dict[str, int]]:
-        """Parse event to SearchRequest and execute the search request"""
+    def process_search_request(self, event) -> tuple[List[Any], dict[str, Any]]:
+        """
+        Parse event to SearchRequest and serve the requested page of its search
+        session. A request without a session_token runs the search and opens a
+        new session; later pages reuse its token and skip the embedding and
+        vector search entirely.
+        """
         try:
             self.logger.debug("Processing search request")
             search_request = self.parse_lambda_event(event)
             query_type = search_request.query_type
 
-            match query_type:
-                case "text":
-                    results = self.text_search(search_request=search_request)
-                case "image" | "audio" | "video":
-                    results = self.media_search(
-                        search_request=search_request, media_type=query_type
-                    )
-                case _:
-                    raise SearchRequestError(f"Unsupported query_type: {query_type}")
+            search_plan = None
+            if search_request.session_token:
+                session_token = str(search_request.session_token)
+                self.logger.debug(f"Continuing search session {session_token}")
+            else:
+                match query_type:
+                    case "text":
+                        session_token = self.text_search(search_request=search_request)
+                    case "image" | "audio" | "video":
+                        session_token = self.media_search(
+                            search_request=search_request, media_type=query_type
+                        )
+                    case _:
+                        raise SearchRequestError(
+                            f"Unsupported query_type: {query_type}"
+                        )
+                search_plan = self.last_search_plan
+
+            results, total = self._fetch_session_page(
+                session_token,
+                search_request.page,
+                search_request.page_limit,
+                search_request.merge_adjacent,
+            )
 
             # Add presigned url to each result
             try:
@@ -228,10 +336,13 @@ class SearchController:
                     f"Successfully processed search request, returning {len(results)} results"
                 )
                 metadata = {
-                    "page": 0,
+                    "page": search_request.page,
                     "limit": search_request.page_limit,
-                    "total": len(results),
+                    "total": total,
+                    "session_token": session_token,
                 }
+                if search_plan:
+                    metadata["search_plan"] = search_plan
                 return results, metadata
             except Exception as e:
                 self.logger.exception(f"Error adding URLs to results: {str(e)}")
@@ -245,13 +356,33 @@ class SearchController:
             )
             raise SearchError(f"Search request processing failed: {str(e)}")
 
+    def _fetch_session_page(
+        self, session_token: str, page: int, limit: int, merge_adjacent=False
+    ) -> tuple[List[Any], int]:
+        """Fetch one page of stored search session results"""
+        try:
+            session_page = self.vector_db_service.fetch_search_session_page(
+                session_token=session_token,
+                page=page,
+                limit=limit,
+                merge_adjacent=merge_adjacent,
+            )
+        except Exception as e:
+            self.logger.exception(f"Error fetching search session page: {str(e)}")
+            raise DatabaseError(f"Failed to fetch search results: {str(e)}")
+
+        if session_page is None:
+            raise SearchRequestError("Search session not found or expired")
+
+        return session_page.items, session_page.total
+
     def _perform_vector_search(
         self,
         embedding: Union[List[float], List[List[float]]],
         search_params: Dict[str, Any],
         use_batch: bool = False,
-    ) -> List[Any]:
-        """Perform vector database search with given embedding(s)"""
+    ) -> str:
+        """Rank candidates for the given embedding(s) and store them as a search session"""
         try:
             self.logger.debug(
                 f"Performing {'batch' if use_batch else 'single'} vector search"
@@ -262,26 +393,34 @@ class SearchController:
                     isinstance(emb, list) for emb in embedding
                 ):
                     raise DatabaseError("Batch search requires list of embeddings")
-                results = self.vector_db_service.find_similar_batch(
-                    embeddings=embedding, **search_params
-                )
+                embedding_args = {"embeddings": embedding}
             else:
                 if not isinstance(embedding, list) or any(
                     isinstance(item, list) for item in embedding
                 ):
                     raise DatabaseError("Single search requires flat embedding list")
-                results = self.vector_db_service.find_similar(
-                    embedding=embedding, **search_params
-                )
+                embedding_args = {"embedding": embedding}
 
-            if results is None:
-                self.logger.warning(
-                    "Vector search returned None, treating as empty results"
+            if self._uses_search_engine(search_params):
+                ranked = self.search_engine.rank(
+                    **embedding_args,
+                    filter=search_params["filter"],
+                    min_similarity=search_params["min_similarity"],
+                )
+                session_token, total = self.vector_db_service.store_search_session(
+                    **ranked
                 )
-                return []
+                self.last_search_plan = self.search_engine.last_search_plan
+            else:
+                session_token, total = self.vector_db_service.create_search_session(
+                    **embedding_args, **search_params
+                )
+                self.last_search_plan = self.vector_db_service.last_search_plan
 
-            self.logger.debug(f"Vector search returned {len(results)} results")
-            return results
+            self.logger.debug(
+                f"Vector search stored {total} candidates in session {session_token}"
+            )
+            return session_token
 
         except DatabaseError:
             raise
@@ -296,6 +435,14 @@ class SearchController:
             )
             raise DatabaseError(f"Vector database search failed: {str(e)}")
 
+    def _uses_search_engine(self, search_params: Dict[str, Any]) -> bool:
+        """Whether the in-process engine can rank a search with these parameters"""
+        options = search_params["options"]
+        return self.search_engine is not None and not any(
+            search_params.get(param, getattr(options, param, None)) not in (None, False)
+            for param in DATABASE_ONLY_PARAMS
+        )
+
     def _extract_text_embedding(self, query_text: str) -> List[float]:
         """Extract text embedding with error handling"""
         try:
@@ -411,7 +558,7 @@ class SearchController:
             self.logger.exception(f"Error extracting {media_type} embedding: {str(e)}")
             raise EmbeddingError(f"{media_type.title()} embedding failed: {str(e)}")
 
-    def text_search(self, search_request: SearchRequest) -> List[Any]:
+    def text_search(self, search_request: SearchRequest) -> str:
         try:
             self.logger.debug("Starting text search")
 
@@ -419,10 +566,10 @@ class SearchController:
                 raise SearchRequestError("query_text is required for text search")
             embedding = self._extract_text_embedding(search_request.query_text)
             search_params = search_request.get_search_params()
-            results = self._perform_vector_search(embedding, search_params)
+            session_token = self._perform_vector_search(embedding, search_params)
 
-            self.logger.debug(f"Text search completed, found {len(results)} results")
-            return results
+            self.logger.debug("Text search completed")
+            return session_token
 
         except (SearchRequestError, EmbeddingError, DatabaseError):
             raise
@@ -434,7 +581,7 @@ class SearchController:
         self,
         search_request: SearchRequest,
         media_type: Literal["image", "audio", "video"],
-    ) -> List[Any]:
+    ) -> str:
         try:
             self.logger.debug(f"Starting {media_type} search")
             embedding = self._extract_media_embedding(search_request, media_type)
@@ -451,13 +598,11 @@ class SearchController:
                 else:
                     self.logger.debug("Using single search for one embedding")
 
-            results = self._perform_vector_search(
+            session_token = self._perform_vector_search(
                 embedding, search_params, use_batch=use_batch
             )
-            self.logger.debug(
-                f"{media_type.title()} search completed, found {len(results)} results"
-            )
-            return results
+            self.logger.debug(f"{media_type.title()} search completed")
+            return session_token
 
         except (
             SearchRequestError,
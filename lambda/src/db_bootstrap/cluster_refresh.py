@@ -0,0 +1,227 @@
+"""
+Fit and roll out the k-means clustering behind video_segments.cluster_id, in
+db_bootstrap invocations:
+
+    clustering_fit       fit a new clustering version on sampled clip embeddings
+    clustering_backfill  assign segments to a version's clusters in id-ordered
+                         batches
+    clustering_activate  make a version the one ingest and search use
+
+Backfill writes a version's assignments to the staging columns, which
+searches never read, so the active version keeps serving meanwhile. Activation
+assigns the segments stored since the backfill and moves every staged row into
+cluster_id in one transaction.
+"""
+
+import numpy as np
+from logging import getLogger
+from typing import Any
+from psycopg2.extensions import connection
+from psycopg2.extras import execute_values
+from projection_refresh import sample_embeddings
+from vector_adapter import parse_vector
+from vector_store import minibatch_kmeans
+
+CLUSTERS = 256
+
+logger = getLogger()
+
+
+def fit(
+    conn: connection,
+    clusters=CLUSTERS,
+    sample_size=50000,
+    iterations=100,
+    batch_size=1024,
+) -> dict[str, Any]:
+    """
+    Cluster a random sample of clip embeddings and store the centroids as a
+    new, inactive version. Returns the version, the mean similarity of the
+    sample to its centroid and the sizes of the smallest and largest cluster.
+    """
+    sample = sample_embeddings(conn, sample_size, scope="clip")
+    if len(sample) < clusters:
+        raise ValueError(
+            f"Need at least {clusters} clip embeddings to fit {clusters} clusters, "
+            f"found {len(sample)}"
+        )
+
+    centroids = minibatch_kmeans(sample, clusters, iterations, batch_size)
+    similarities = sample @ centroids.T
+    sizes = np.bincount(np.argmax(similarities, axis=1), minlength=clusters)
+    mean_similarity = float(similarities.max(axis=1).mean())
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO embedding_clusterings (
+                clusters, centroids, mean_similarity, sample_size
+            ) VALUES (%s, %s, %s, %s)
+            RETURNING version
+            """,
+            (clusters, centroids.tolist(), mean_similarity, len(sample)),
+        )
+        version = cursor.fetchone()[0]
+    conn.commit()
+
+    logger.info(
+        f"Fitted clustering version {version}: {clusters} clusters, mean "
+        f"similarity to centroid {mean_similarity:.3f}"
+    )
+    return {
+        "version": version,
+        "clusters": clusters,
+        "mean_similarity": mean_similarity,
+        "sample_size": len(sample),
+        "min_cluster_size": int(sizes.min()),
+        "max_cluster_size": int(sizes.max()),
+    }
+
+
+def backfill(
+    conn: connection, version: int, batch_size=2000, max_batches=None, after_id=0
+) -> dict[str, Any]:
+    """
+    Stage the `version` cluster of every segment not yet staged for it,
+    `batch_size` rows at a time. Pass the returned `last_id` back as
+    `after_id` to resume where an invocation stopped.
+    """
+    centroids = _load_centroids(conn, version)
+
+    last_id = after_id
+    assigned = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, embedding::text
+                FROM video_segments
+                WHERE id > %(last_id)s
+                AND embedding IS NOT NULL
+                AND staged_clustering_version IS DISTINCT FROM %(version)s
+                ORDER BY id
+                LIMIT %(batch_size)s
+                """,
+                {"last_id": last_id, "version": version, "batch_size": batch_size},
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                conn.commit()
+                break
+            _stage_assignments(cursor, rows, version, centroids)
+        conn.commit()
+
+        last_id = rows[-1][0]
+        assigned += len(rows)
+        batches += 1
+        logger.info(f"Staged {assigned} segment clusters for version {version}")
+
+    return {
+        "version": version,
+        "assigned": assigned,
+        "last_id": last_id,
+        "done": max_batches is None or batches < max_batches,
+    }
+
+
+def activate(conn: connection, version: int, max_late_segments=5000) -> dict[str, Any]:
+    """
+    Make `version` the active clustering. Segments stored since the backfill
+    are assigned first, then every staged cluster replaces the live one, all
+    in one transaction that holds off ingest until it commits. Fails,
+    changing nothing, while more than `max_late_segments` are still
+    unassigned: backfill them first.
+    """
+    centroids = _load_centroids(conn, version)
+    try:
+        with conn.cursor() as cursor:
+            # Blocks inserts, not searches; ingest checks the active version
+            # after taking its own lock on the table
+            cursor.execute("LOCK TABLE video_segments IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                """
+                SELECT id, embedding::text
+                FROM video_segments
+                WHERE embedding IS NOT NULL
+                AND staged_clustering_version IS DISTINCT FROM %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (version, max_late_segments + 1),
+            )
+            late_rows = cursor.fetchall()
+            if len(late_rows) > max_late_segments:
+                raise ValueError(
+                    f"More than {max_late_segments} segments are not assigned by "
+                    f"version {version}, backfill them first"
+                )
+            if late_rows:
+                _stage_assignments(cursor, late_rows, version, centroids)
+
+            cursor.execute(
+                """
+                UPDATE video_segments
+                SET cluster_id = staged_cluster_id,
+                    clustering_version = staged_clustering_version,
+                    staged_cluster_id = NULL,
+                    staged_clustering_version = NULL
+                WHERE staged_clustering_version = %s
+                """,
+                (version,),
+            )
+            activated = cursor.rowcount
+            cursor.execute(
+                """
+                UPDATE embedding_clusterings SET activated_at = NOW()
+                WHERE version = %s
+                """,
+                (version,),
+            )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+    logger.info(
+        f"Activated clustering version {version} for {activated} segments, "
+        f"{len(late_rows)} of them stored since the backfill"
+    )
+    return {
+        "version": version,
+        "activated_segments": activated,
+        "late_segments": len(late_rows),
+    }
+
+
+def _load_centroids(conn: connection, version: int) -> np.ndarray:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT centroids FROM embedding_clusterings WHERE version = %s",
+            (version,),
+        )
+        row = cursor.fetchone()
+    conn.commit()
+    if row is None:
+        raise ValueError(f"Unknown clustering version: {version}")
+    return np.asarray(row[0])
+
+
+def _stage_assignments(cursor, rows, version: int, centroids: np.ndarray):
+    """Write the `version` clusters of (id, embedding text) rows to staging"""
+    embeddings = np.stack([parse_vector(text) for _, text in rows])
+    cluster_ids = np.argmax(embeddings @ centroids.T, axis=1)
+    execute_values(
+        cursor,
+        """
+        UPDATE video_segments
+        SET staged_cluster_id = batch.cluster_id,
+            staged_clustering_version = batch.clustering_version
+        FROM (VALUES %s) AS batch (id, cluster_id, clustering_version)
+        WHERE video_segments.id = batch.id
+        """,
+        [
+            (row[0], int(cluster_id), version)
+            for row, cluster_id in zip(rows, cluster_ids)
+        ],
+    )
@@ -0,0 +1,290 @@
+"""
+Convert video_segments.embedding from vector(1024) to halfvec(1024) in steps
+that each fit in one db_bootstrap invocation:
+
+    halfvec_backfill  add `embedding_half` and fill it in id-ordered batches
+    halfvec_index     build the partial halfvec HNSW indexes, and halfvec twins
+                      of the binary ones that exist, concurrently
+    halfvec_recall    compare halfvec results against full-precision search
+    halfvec_swap      fill late rows and swap the column and indexes in
+
+Searches keep using the vector column until the swap; set EMBEDDING_STORAGE to
+"halfvec" for the search and embedding consumer lambdas right after it.
+"""
+
+from logging import getLogger
+from typing import Any
+from psycopg2.extensions import connection
+from search_indexes import BINARY_PARTITION_INDEXES, EMBEDDING_DIMENSIONS
+from vector_db_service import PARTITION_INDEXES
+
+logger = getLogger()
+
+
+def halfvec_index_name(index_name: str) -> str:
+    return index_name.replace("video_segments_", "video_segments_half_", 1)
+
+
+def backfill(conn: connection, batch_size=5000, max_batches=None) -> dict[str, Any]:
+    """
+    Add `embedding_half` and copy `embedding` into it `batch_size` rows at a
+    time, committing after each batch so locks stay short. Resumes after the
+    highest id already converted; rows inserted meanwhile are caught by swap().
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"""
+            ALTER TABLE video_segments
+            ADD COLUMN IF NOT EXISTS embedding_half halfvec({EMBEDDING_DIMENSIONS})
+            """
+        )
+        cursor.execute(
+            """
+            SELECT COALESCE(MAX(id), 0) AS last_id
+            FROM video_segments
+            WHERE embedding_half IS NOT NULL
+            """
+        )
+        last_id = cursor.fetchone()[0]
+    conn.commit()
+
+    converted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH batch AS (
+                    SELECT id FROM video_segments
+                    WHERE id > %(last_id)s
+                    ORDER BY id
+                    LIMIT %(batch_size)s
+                )
+                UPDATE video_segments
+                SET embedding_half = embedding::halfvec({EMBEDDING_DIMENSIONS})
+                FROM batch
+                WHERE video_segments.id = batch.id
+                RETURNING video_segments.id
+                """,
+                {"last_id": last_id, "batch_size": batch_size},
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+
+        if not ids:
+            break
+        last_id = max(ids)
+        converted += len(ids)
+        batches += 1
+        logger.info(f"Converted {converted} segments to halfvec (last id {last_id})")
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM video_segments
+            WHERE embedding_half IS NULL AND embedding IS NOT NULL
+            """
+        )
+        remaining = cursor.fetchone()[0]
+    conn.commit()
+
+    return {"converted": converted, "last_id": last_id, "remaining": remaining}
+
+
+def build_indexes(conn: connection) -> list[str]:
+    """
+    Build the halfvec HNSW index of every partition on `embedding_half`, and
+    the binary-quantized one of each partition whose binary_indexes exist.
+    Uses CREATE INDEX CONCURRENTLY so inserts carry on during the build.
+    """
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    built = []
+    try:
+        with conn.cursor() as cursor:
+            index_methods = [
+                (PARTITION_INDEXES, "(embedding_half halfvec_ip_ops)"),
+                (
+                    _existing_indexes(cursor, BINARY_PARTITION_INDEXES),
+                    f"((binary_quantize(embedding_half)::bit({EMBEDDING_DIMENSIONS})) "
+                    "bit_hamming_ops)",
+                ),
+            ]
+            for partition_indexes, method in index_methods:
+                for (modality, scope), index_name in partition_indexes.items():
+                    half_index_name = halfvec_index_name(index_name)
+                    cursor.execute(
+                        f"""
+                        CREATE INDEX CONCURRENTLY IF NOT EXISTS {half_index_name}
+                        ON video_segments
+                        USING hnsw {method}
+                        WHERE modality = %s AND scope = %s
+                        """,
+                        (modality, scope),
+                    )
+                    built.append(half_index_name)
+                    logger.info(f"Built {half_index_name}")
+    finally:
+        conn.autocommit = autocommit
+    return built
+
+
+def compare_recall(
+    conn: connection, sample_size=50, k=10, ef_search=40
+) -> dict[str, Any]:
+    """
+    Measure recall@k against exact full-precision search, using sampled
+    segments as queries within their own partition. Reports the current
+    vector HNSW index, an exact halfvec scan (the cost of the precision loss
+    alone) and the halfvec HNSW index, plus the size of both index sets.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id, modality, scope, embedding::text
+            FROM video_segments
+            WHERE embedding_half IS NOT NULL
+            ORDER BY random()
+            LIMIT %s
+            """,
+            (sample_size,),
+        )
+        samples = cursor.fetchall()
+    conn.commit()
+
+    recalls = {"vector_index": [], "halfvec_exact": [], "halfvec_index": []}
+    for segment_id, modality, scope, embedding in samples:
+        query = {
+            "segment_id": segment_id,
+            "modality": modality,
+            "scope": scope,
+            "embedding": embedding,
+            "k": k,
+        }
+        truth = _top_k_ids(conn, query, "embedding", "vector", exact=True)
+        if not truth:
+            continue
+        for name, column, vector_type, exact in [
+            ("vector_index", "embedding", "vector", False),
+            ("halfvec_exact", "embedding_half", "halfvec", True),
+            ("halfvec_index", "embedding_half", "halfvec", False),
+        ]:
+            found = _top_k_ids(conn, query, column, vector_type, exact, ef_search)
+            recalls[name].append(len(truth & found) / len(truth))
+
+    report: dict[str, Any] = {
+        "queries": len(recalls["vector_index"]),
+        "k": k,
+        "ef_search": ef_search,
+    }
+    for name, values in recalls.items():
+        report[f"{name}_recall"] = sum(values) / len(values) if values else None
+
+    index_names = list(PARTITION_INDEXES.values())
+    report["vector_index_bytes"] = _total_index_size(conn, index_names)
+    report["halfvec_index_bytes"] = _total_index_size(
+        conn, [halfvec_index_name(index_name) for index_name in index_names]
+    )
+    return report
+
+
+def swap(conn: connection) -> None:
+    """
+    Convert rows inserted since the backfill, then replace `embedding` with
+    `embedding_half` and give the halfvec indexes the original names, all in
+    one transaction. Requires build_indexes() to have run first.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("LOCK TABLE video_segments IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            f"""
+            UPDATE video_segments
+            SET embedding_half = embedding::halfvec({EMBEDDING_DIMENSIONS})
+            WHERE embedding_half IS NULL AND embedding IS NOT NULL
+            """
+        )
+        logger.info(f"Converted {cursor.rowcount} late segments to halfvec")
+
+        index_names = [
+            *PARTITION_INDEXES.values(),
+            *BINARY_PARTITION_INDEXES.values(),
+        ]
+        for index_name in index_names:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+        cursor.execute("ALTER TABLE video_segments DROP COLUMN embedding")
+        cursor.execute(
+            "ALTER TABLE video_segments RENAME COLUMN embedding_half TO embedding"
+        )
+        # Binary partitions without a binary index have no halfvec twin either
+        for index_name in index_names:
+            cursor.execute(
+                f"ALTER INDEX IF EXISTS {halfvec_index_name(index_name)} "
+                f"RENAME TO {index_name}"
+            )
+    conn.commit()
+    logger.info("video_segments.embedding is now halfvec")
+
+
+def _existing_indexes(cursor, partition_indexes):
+    """The entries of `partition_indexes` whose index exists"""
+    cursor.execute(
+        """
+        SELECT name FROM unnest(%s::text[]) AS name
+        WHERE to_regclass(name) IS NOT NULL
+        """,
+        (list(partition_indexes.values()),),
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    return {
+        partition: index_name
+        for partition, index_name in partition_indexes.items()
+        if index_name in existing
+    }
+
+
+def _top_k_ids(
+    conn: connection,
+    query: dict[str, Any],
+    column: str,
+    vector_type: str,
+    exact: bool,
+    ef_search=40,
+) -> set[int]:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('enable_indexscan', %s, true)",
+            ("off" if exact else "on",),
+        )
+        cursor.execute(
+            "SELECT set_config('hnsw.ef_search', %s, true)", (str(ef_search),)
+        )
+        cursor.execute(
+            f"""
+            SELECT id FROM (
+                SELECT id FROM video_segments
+                WHERE modality = %(modality)s AND scope = %(scope)s
+                ORDER BY {column} <#> %(embedding)s::{vector_type}
+                LIMIT %(k)s + 1
+            ) nearest
+            WHERE id <> %(segment_id)s
+            LIMIT %(k)s
+            """,
+            query,
+        )
+        ids = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    return ids
+
+
+def _total_index_size(conn: connection, index_names: list[str]) -> int:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(pg_relation_size(to_regclass(name))), 0)
+            FROM unnest(%s::text[]) AS name
+            """,
+            (index_names,),
+        )
+        size = cursor.fetchone()[0]
+    conn.commit()
+    return int(size)
@@ -0,0 +1,141 @@
+"""
+Compare hierarchical search against flat HNSW search in a db_bootstrap
+invocation:
+
+    hierarchical_recall  recall@k and latency of both against exact search
+
+Hierarchical search finds the nearest videos by their video-scope embedding
+and searches clips only within them (SEARCH_MODE "hierarchical").
+"""
+
+import time
+from logging import getLogger
+from typing import Any
+from psycopg2.extensions import connection
+from normalize_migration import embedding_type
+
+logger = getLogger()
+
+FLAT_QUERY = """
+    SELECT id FROM video_segments
+    WHERE modality = %(modality)s AND scope = 'clip'
+    ORDER BY embedding <#> %(embedding)s::{vector_type}
+    LIMIT %(k)s + 1
+"""
+
+HIERARCHICAL_QUERY = """
+    SELECT video_clips.id
+    FROM (
+        SELECT video_id FROM video_segments
+        WHERE modality = %(modality)s AND scope = 'video'
+        ORDER BY embedding <#> %(embedding)s::{vector_type}
+        LIMIT %(videos)s
+    ) nearest_videos
+    CROSS JOIN LATERAL (
+        SELECT id, embedding <#> %(embedding)s::{vector_type} AS distance
+        FROM video_segments
+        WHERE video_id = nearest_videos.video_id
+        AND modality = %(modality)s
+        AND scope = 'clip'
+        ORDER BY distance
+        LIMIT %(k)s + 1
+    ) video_clips
+    ORDER BY video_clips.distance
+    LIMIT %(k)s + 1
+"""
+
+
+def compare_recall(
+    conn: connection, sample_size=50, k=10, videos=100, ef_search=40
+) -> dict[str, Any]:
+    """
+    Measure recall@k and query latency of flat HNSW search and of hierarchical
+    search over the `videos` nearest videos, against exact search, using
+    sampled clips as queries within their own modality
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id, modality, embedding::text
+            FROM video_segments
+            WHERE scope = 'clip' AND embedding IS NOT NULL
+            ORDER BY random()
+            LIMIT %s
+            """,
+            (sample_size,),
+        )
+        samples = cursor.fetchall()
+    conn.commit()
+
+    vector_type = embedding_type(conn)
+    queries = {
+        "flat": FLAT_QUERY.format(vector_type=vector_type),
+        "hierarchical": HIERARCHICAL_QUERY.format(vector_type=vector_type),
+    }
+    recalls: dict[str, list[float]] = {"flat": [], "hierarchical": []}
+    latencies: dict[str, list[float]] = {"flat": [], "hierarchical": []}
+    for segment_id, modality, embedding in samples:
+        query = {
+            "modality": modality,
+            "embedding": embedding,
+            "k": k,
+            "videos": videos,
+        }
+        truth, _ = _top_k_ids(conn, queries["flat"], query, segment_id, exact=True)
+        if not truth:
+            continue
+        for name, sql in queries.items():
+            found, seconds = _top_k_ids(
+                conn, sql, query, segment_id, ef_search=ef_search
+            )
+            recalls[name].append(len(truth & found) / len(truth))
+            latencies[name].append(seconds * 1000)
+
+    report: dict[str, Any] = {
+        "queries": len(recalls["flat"]),
+        "k": k,
+        "videos": videos,
+        "ef_search": ef_search,
+    }
+    for name in recalls:
+        report[f"{name}_recall"] = _mean(recalls[name])
+        report[f"{name}_mean_ms"] = _mean(latencies[name])
+        report[f"{name}_p95_ms"] = _percentile(latencies[name], 0.95)
+    return report
+
+
+def _top_k_ids(
+    conn: connection,
+    sql: str,
+    query: dict[str, Any],
+    segment_id: int,
+    exact=False,
+    ef_search=40,
+) -> tuple[set[int], float]:
+    """Run a top-k query without the query segment itself, and time it"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('enable_indexscan', %s, true)",
+            ("off" if exact else "on",),
+        )
+        cursor.execute(
+            "SELECT set_config('hnsw.ef_search', %s, true)", (str(ef_search),)
+        )
+        started = time.perf_counter()
+        cursor.execute(sql, query)
+        rows = cursor.fetchall()
+        seconds = time.perf_counter() - started
+    conn.commit()
+    ids = [row[0] for row in rows if row[0] != segment_id][: query["k"]]
+    return set(ids), seconds
+
+
+def _mean(values: list[float]) -> float | None:
+    return sum(values) / len(values) if values else None
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -2,16 +2,136 @@ import os
 from config import get_secret, setup_logging, get_db_config
 import json
 import psycopg2
+import halfvec_migration
+import normalize_migration
+import projection_refresh
+import cluster_refresh
+import hierarchical_benchmark
+import search_indexes
+import embedding_snapshot
 
 # Environment variables
 SECRET_NAME = os.getenv("SECRET_NAME", "kubrick_secret")
+# Default directory of the embedding_snapshot actions, e.g. an EFS mount
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH") or "/tmp/embedding_snapshot"
 
 SECRET = get_secret(SECRET_NAME)
 DB_CONFIG = get_db_config(SECRET)
 logger = setup_logging()
 
 
+def optional_int(event, key):
+    return int(event[key]) if key in event else None
+
+
+def swap_halfvec(conn, event):
+    halfvec_migration.swap(conn)
+    return "video_segments.embedding is now halfvec"
+
+
+# Event actions that run one migration step instead of schema.sql
+MIGRATION_ACTIONS = {
+    "halfvec_backfill": lambda conn, event: halfvec_migration.backfill(
+        conn,
+        batch_size=int(event.get("batch_size", 5000)),
+        max_batches=optional_int(event, "max_batches"),
+    ),
+    "halfvec_index": lambda conn, event: halfvec_migration.build_indexes(conn),
+    "halfvec_recall": lambda conn, event: halfvec_migration.compare_recall(
+        conn,
+        sample_size=int(event.get("sample_size", 50)),
+        k=int(event.get("k", 10)),
+        ef_search=int(event.get("ef_search", 40)),
+    ),
+    "halfvec_swap": swap_halfvec,
+    "normalize_embeddings": lambda conn, event: normalize_migration.normalize(
+        conn,
+        batch_size=int(event.get("batch_size", 5000)),
+        max_batches=optional_int(event, "max_batches"),
+        after_id=int(event.get("after_id", 0)),
+    ),
+    "normalize_indexes": lambda conn, event: normalize_migration.rebuild_indexes(conn),
+    "binary_indexes": lambda conn, event: search_indexes.build_binary_indexes(conn),
+    "projection_indexes": lambda conn, event: (
+        search_indexes.build_projection_indexes(conn)
+    ),
+    "projection_fit": lambda conn, event: projection_refresh.fit(
+        conn, sample_size=int(event.get("sample_size", 20000))
+    ),
+    "projection_backfill": lambda conn, event: projection_refresh.backfill(
+        conn,
+        version=int(event["version"]),
+        batch_size=int(event.get("batch_size", 2000)),
+        max_batches=optional_int(event, "max_batches"),
+        after_id=int(event.get("after_id", 0)),
+    ),
+    "projection_activate": lambda conn, event: projection_refresh.activate(
+        conn,
+        version=int(event["version"]),
+        max_late_segments=int(event.get("max_late_segments", 5000)),
+    ),
+    "clustering_fit": lambda conn, event: cluster_refresh.fit(
+        conn,
+        clusters=int(event.get("clusters", cluster_refresh.CLUSTERS)),
+        sample_size=int(event.get("sample_size", 50000)),
+        iterations=int(event.get("iterations", 100)),
+    ),
+    "clustering_backfill": lambda conn, event: cluster_refresh.backfill(
+        conn,
+        version=int(event["version"]),
+        batch_size=int(event.get("batch_size", 2000)),
+        max_batches=optional_int(event, "max_batches"),
+        after_id=int(event.get("after_id", 0)),
+    ),
+    "clustering_activate": lambda conn, event: cluster_refresh.activate(
+        conn,
+        version=int(event["version"]),
+        max_late_segments=int(event.get("max_late_segments", 5000)),
+    ),
+    "hierarchical_recall": lambda conn, event: hierarchical_benchmark.compare_recall(
+        conn,
+        sample_size=int(event.get("sample_size", 50)),
+        k=int(event.get("k", 10)),
+        videos=int(event.get("videos", 100)),
+        ef_search=int(event.get("ef_search", 40)),
+    ),
+    "snapshot_build": lambda conn, event: embedding_snapshot.build(
+        conn,
+        path=event.get("path", SNAPSHOT_PATH),
+        dtype=event.get("dtype", "float32"),
+        batch_size=int(event.get("batch_size", 5000)),
+    ),
+    "snapshot_append": lambda conn, event: embedding_snapshot.append(
+        conn,
+        path=event.get("path", SNAPSHOT_PATH),
+        batch_size=int(event.get("batch_size", 5000)),
+    ),
+    "snapshot_compact": lambda conn, event: embedding_snapshot.compact(
+        path=event.get("path", SNAPSHOT_PATH)
+    ),
+}
+
+
+def run_migration(event):
+    """Run the migration step named by the event's `action`"""
+    action = event["action"]
+    try:
+        with psycopg2.connect(**DB_CONFIG) as conn:
+            result = MIGRATION_ACTIONS[action](conn, event)
+            logger.info(f"{action}: {result}")
+            return {"statusCode": 200, "body": json.dumps(result)}
+
+    except Exception as e:
+        logger.error(f"Error running {action}: {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps(f"{action} failed."),
+        }
+
+
 def lambda_handler(event, context):
+    if (event or {}).get("action") in MIGRATION_ACTIONS:
+        return run_migration(event)
 
     try:
         with psycopg2.connect(**DB_CONFIG) as conn:
@@ -0,0 +1,137 @@
+"""
+Move video_segments from cosine to inner-product search in two db_bootstrap
+invocations:
+
+    normalize_embeddings  scale stored embeddings to unit length in id batches
+    normalize_indexes     rebuild the partition HNSW indexes with *_ip_ops
+
+New segments are normalized by EmbedService before they are stored, so only
+rows written before the switch need converting.
+"""
+
+from logging import getLogger
+from typing import Any
+from psycopg2.extensions import connection
+from vector_db_service import PARTITION_INDEXES
+
+# Norm function for each column type pgvector supports
+NORM_FUNCTIONS = {"vector": "vector_norm", "halfvec": "l2_norm"}
+NORM_TOLERANCE = 1e-3
+
+logger = getLogger()
+
+
+def embedding_type(conn: connection) -> str:
+    """Return the column type of video_segments.embedding: vector or halfvec"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT atttypid::regtype::text
+            FROM pg_attribute
+            WHERE attrelid = 'video_segments'::regclass AND attname = 'embedding'
+            """
+        )
+        column_type = cursor.fetchone()[0]
+    conn.commit()
+    return column_type
+
+
+def normalize(
+    conn: connection, batch_size=5000, max_batches=None, after_id=0
+) -> dict[str, Any]:
+    """
+    Rewrite embeddings that are not unit length, `batch_size` rows at a time
+    and committing after each batch. Pass the returned `last_id` back as
+    `after_id` to resume where an invocation stopped.
+    """
+    norm_function = NORM_FUNCTIONS[embedding_type(conn)]
+    last_id = after_id
+    scanned = 0
+    normalized = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT MAX(id), COUNT(*) FROM (
+                    SELECT id FROM video_segments
+                    WHERE id > %(last_id)s
+                    ORDER BY id
+                    LIMIT %(batch_size)s
+                ) batch
+                """,
+                {"last_id": last_id, "batch_size": batch_size},
+            )
+            batch_last_id, batch_count = cursor.fetchone()
+            if not batch_count:
+                conn.commit()
+                break
+
+            cursor.execute(
+                f"""
+                UPDATE video_segments
+                SET embedding = l2_normalize(embedding)
+                WHERE id > %(last_id)s AND id <= %(batch_last_id)s
+                AND abs({norm_function}(embedding) - 1) > %(tolerance)s
+                """,
+                {
+                    "last_id": last_id,
+                    "batch_last_id": batch_last_id,
+                    "tolerance": NORM_TOLERANCE,
+                },
+            )
+            normalized += cursor.rowcount
+        conn.commit()
+
+        last_id = batch_last_id
+        scanned += batch_count
+        batches += 1
+        logger.info(f"Normalized {normalized} of {scanned} segments (last id {last_id})")
+
+    return {
+        "scanned": scanned,
+        "normalized": normalized,
+        "last_id": last_id,
+        "done": max_batches is None or batches < max_batches,
+    }
+
+
+def rebuild_indexes(conn: connection) -> list[str]:
+    """
+    Replace each partition index that is not already an inner-product index:
+    build the new one concurrently, then swap it in under the original name.
+    """
+    operator_class = f"{embedding_type(conn)}_ip_ops"
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    rebuilt = []
+    try:
+        with conn.cursor() as cursor:
+            for (modality, scope), index_name in PARTITION_INDEXES.items():
+                cursor.execute(
+                    "SELECT pg_get_indexdef(to_regclass(%s))", (index_name,)
+                )
+                index_definition = cursor.fetchone()[0] or ""
+                if "_ip_ops" in index_definition:
+                    continue
+
+                new_index_name = f"{index_name}_ip"
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_index_name}")
+                cursor.execute(
+                    f"""
+                    CREATE INDEX CONCURRENTLY {new_index_name}
+                    ON video_segments
+                    USING hnsw (embedding {operator_class})
+                    WHERE modality = %s AND scope = %s
+                    """,
+                    (modality, scope),
+                )
+                cursor.execute("BEGIN")
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+                cursor.execute(f"ALTER INDEX {new_index_name} RENAME TO {index_name}")
+                cursor.execute("COMMIT")
+                rebuilt.append(index_name)
+                logger.info(f"Rebuilt {index_name} with {operator_class}")
+    finally:
+        conn.autocommit = autocommit
+    return rebuilt
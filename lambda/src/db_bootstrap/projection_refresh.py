@@ -0,0 +1,255 @@
+"""
+Fit and roll out the PCA projection behind video_segments.coarse_embedding, in
+db_bootstrap invocations:
+
+    projection_fit       fit a new projection version on sampled embeddings
+    projection_backfill  project segments onto a version in id-ordered batches
+    projection_activate  make a version the one ingest and search use
+
+Backfill writes a version's projections to the staging columns, which
+searches never read, so the active version keeps serving meanwhile. Activation
+projects the segments stored since the backfill and moves every staged row into
+coarse_embedding in one transaction. The "coarse" search mode also needs the
+indexes of the projection_indexes action, see search_indexes.py.
+"""
+
+import numpy as np
+from logging import getLogger
+from typing import Any
+from psycopg2.extensions import connection
+from psycopg2.extras import execute_values
+from vector_adapter import parse_vector, to_vector_text
+
+COARSE_DIMENSIONS = 128
+# Rows fetched per round trip while streaming a fit sample
+SAMPLE_FETCH_SIZE = 1000
+
+logger = getLogger()
+
+
+def sample_embeddings(conn: connection, sample_size: int, scope=None) -> np.ndarray:
+    """
+    Stream a random sample of segment embeddings, of every scope or only
+    `scope`, into a float32 matrix. A server-side cursor keeps only one batch
+    of the text result in memory at a time.
+    """
+    batches = []
+    with conn.cursor(name="embedding_sample") as cursor:
+        cursor.itersize = SAMPLE_FETCH_SIZE
+        cursor.execute(
+            """
+            SELECT embedding::text
+            FROM video_segments
+            WHERE embedding IS NOT NULL
+            AND (%(scope)s::text IS NULL OR scope = %(scope)s)
+            ORDER BY random()
+            LIMIT %(sample_size)s
+            """,
+            {"scope": scope, "sample_size": sample_size},
+        )
+        while rows := cursor.fetchmany(SAMPLE_FETCH_SIZE):
+            batches.append(np.stack([parse_vector(row[0]) for row in rows]))
+    conn.commit()
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate(batches)
+
+
+def fit(
+    conn: connection, sample_size=20000, dimensions=COARSE_DIMENSIONS
+) -> dict[str, Any]:
+    """
+    Fit a PCA projection on a random sample of segment embeddings and store it
+    as a new, inactive version. Returns the version and the fraction of the
+    sample's variance the kept components explain.
+    """
+    sample = sample_embeddings(conn, sample_size)
+    if len(sample) <= dimensions:
+        raise ValueError(
+            f"Need more than {dimensions} embeddings to fit a projection, "
+            f"found {len(sample)}"
+        )
+
+    mean = sample.mean(axis=0)
+    _, singular_values, components = np.linalg.svd(sample - mean, full_matrices=False)
+    variance = singular_values**2
+    explained_variance = float(variance[:dimensions].sum() / variance.sum())
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO embedding_projections (
+                dimensions, mean, components, explained_variance, sample_size
+            ) VALUES (%s, %s, %s, %s, %s)
+            RETURNING version
+            """,
+            (
+                dimensions,
+                mean.tolist(),
+                components[:dimensions].tolist(),
+                explained_variance,
+                len(sample),
+            ),
+        )
+        version = cursor.fetchone()[0]
+    conn.commit()
+
+    logger.info(
+        f"Fitted projection version {version}: {dimensions} components explain "
+        f"{explained_variance:.3f} of the variance"
+    )
+    return {
+        "version": version,
+        "dimensions": dimensions,
+        "explained_variance": explained_variance,
+        "sample_size": len(sample),
+    }
+
+
+def backfill(
+    conn: connection, version: int, batch_size=2000, max_batches=None, after_id=0
+) -> dict[str, Any]:
+    """
+    Stage the `version` projection of every segment not yet staged for it,
+    `batch_size` rows at a time. Pass the returned `last_id` back as
+    `after_id` to resume where an invocation stopped.
+    """
+    mean, components = _load_projection(conn, version)
+
+    last_id = after_id
+    projected = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, embedding::text
+                FROM video_segments
+                WHERE id > %(last_id)s
+                AND embedding IS NOT NULL
+                AND staged_projection_version IS DISTINCT FROM %(version)s
+                ORDER BY id
+                LIMIT %(batch_size)s
+                """,
+                {"last_id": last_id, "version": version, "batch_size": batch_size},
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                conn.commit()
+                break
+            _stage_projections(cursor, rows, version, mean, components)
+        conn.commit()
+
+        last_id = rows[-1][0]
+        projected += len(rows)
+        batches += 1
+        logger.info(f"Staged {projected} segment projections for version {version}")
+
+    return {
+        "version": version,
+        "projected": projected,
+        "last_id": last_id,
+        "done": max_batches is None or batches < max_batches,
+    }
+
+
+def activate(conn: connection, version: int, max_late_segments=5000) -> dict[str, Any]:
+    """
+    Make `version` the active projection. Segments stored since the backfill
+    are projected first, then every staged projection replaces the live one,
+    all in one transaction that holds off ingest until it commits. Refuses,
+    changing nothing, while more than `max_late_segments` still need
+    projecting: backfill them first.
+    """
+    mean, components = _load_projection(conn, version)
+    try:
+        with conn.cursor() as cursor:
+            # Blocks inserts, not searches; ingest checks the active version
+            # after taking its own lock on the table
+            cursor.execute("LOCK TABLE video_segments IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                """
+                SELECT id, embedding::text
+                FROM video_segments
+                WHERE embedding IS NOT NULL
+                AND staged_projection_version IS DISTINCT FROM %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (version, max_late_segments + 1),
+            )
+            late_rows = cursor.fetchall()
+            if len(late_rows) > max_late_segments:
+                raise ValueError(
+                    f"More than {max_late_segments} segments are not projected by "
+                    f"version {version}, backfill them first"
+                )
+            if late_rows:
+                _stage_projections(cursor, late_rows, version, mean, components)
+
+            cursor.execute(
+                """
+                UPDATE video_segments
+                SET coarse_embedding = staged_coarse_embedding,
+                    projection_version = staged_projection_version,
+                    staged_coarse_embedding = NULL,
+                    staged_projection_version = NULL
+                WHERE staged_projection_version = %s
+                """,
+                (version,),
+            )
+            activated = cursor.rowcount
+            cursor.execute(
+                """
+                UPDATE embedding_projections SET activated_at = NOW()
+                WHERE version = %s
+                """,
+                (version,),
+            )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+    logger.info(
+        f"Activated projection version {version} for {activated} segments, "
+        f"{len(late_rows)} of them stored since the backfill"
+    )
+    return {
+        "version": version,
+        "activated_segments": activated,
+        "late_segments": len(late_rows),
+    }
+
+
+def _load_projection(conn: connection, version: int) -> tuple[np.ndarray, np.ndarray]:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT mean, components FROM embedding_projections WHERE version = %s",
+            (version,),
+        )
+        row = cursor.fetchone()
+    conn.commit()
+    if row is None:
+        raise ValueError(f"Unknown projection version: {version}")
+    return np.asarray(row[0]), np.asarray(row[1])
+
+
+def _stage_projections(cursor, rows, version: int, mean, components):
+    """Write the `version` projections of (id, embedding text) rows to staging"""
+    embeddings = np.stack([parse_vector(text) for _, text in rows])
+    coarse_embeddings = (embeddings - mean) @ components.T
+    execute_values(
+        cursor,
+        """
+        UPDATE video_segments
+        SET staged_coarse_embedding = batch.coarse_embedding::vector,
+            staged_projection_version = batch.projection_version
+        FROM (VALUES %s) AS batch (id, coarse_embedding, projection_version)
+        WHERE video_segments.id = batch.id
+        """,
+        [
+            (row[0], to_vector_text(coarse_embedding), version)
+            for row, coarse_embedding in zip(rows, coarse_embeddings)
+        ],
+    )
@@ -1,6 +1,7 @@
 BEGIN;
 
 CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Function to update `updated_at` on row update
 CREATE OR REPLACE FUNCTION set_updated_at()
@@ -17,13 +18,28 @@ CREATE TABLE IF NOT EXISTS videos (
   s3_bucket TEXT NOT NULL,
   s3_key TEXT NOT NULL,
   duration REAL,
-  created_at TIMESTAMP DEFAULT NOW(),
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
   updated_at TIMESTAMP DEFAULT NOW(),
   height INTEGER,
   width INTEGER
 );
 
-CREATE UNIQUE INDEX unique_s3_object ON videos (s3_bucket, s3_key);
+CREATE UNIQUE INDEX IF NOT EXISTS unique_s3_object ON videos (s3_bucket, s3_key);
+
+-- Keyset pagination order for fetch_videos. A page cursor holds the created_at
+-- of its last row, so tables created before it was NOT NULL are fixed up.
+UPDATE videos SET created_at = COALESCE(updated_at, NOW()) WHERE created_at IS NULL;
+ALTER TABLE videos ALTER COLUMN created_at SET NOT NULL;
+CREATE INDEX IF NOT EXISTS videos_created_at_id_idx ON videos (created_at, id);
+
+-- Videos updated since the search snapshot's last refresh
+CREATE INDEX IF NOT EXISTS videos_updated_at_idx ON videos (updated_at);
+
+-- Trigram indexes for the lexical half of hybrid search
+CREATE INDEX IF NOT EXISTS videos_filename_trgm_idx
+  ON videos USING gin (filename gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS videos_s3_key_trgm_idx
+  ON videos USING gin (s3_key gin_trgm_ops);
 
 -- Trigger for videos
 DROP TRIGGER IF EXISTS trg_update_videos_updated_at ON videos;
@@ -32,6 +48,40 @@ BEFORE UPDATE ON videos
 FOR EACH ROW
 EXECUTE FUNCTION set_updated_at();
 
+-- Ids of deleted videos and segments in deletion order, so the search snapshot
+-- can tombstone them without re-reading the videos table. segment_id is NULL
+-- when the whole video was deleted.
+CREATE TABLE IF NOT EXISTS video_deletions (
+  id BIGSERIAL PRIMARY KEY,
+  video_id INTEGER NOT NULL,
+  deleted_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE video_deletions ADD COLUMN IF NOT EXISTS segment_id INTEGER;
+
+-- The video_deletions id each search snapshot has applied, so the rows every
+-- live snapshot has read can be pruned. A snapshot unseen for longer than its
+-- TTL is dropped and reloads in full when it next refreshes.
+CREATE TABLE IF NOT EXISTS snapshot_consumers (
+  consumer_id TEXT PRIMARY KEY,
+  deletion_watermark BIGINT NOT NULL,
+  seen_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION record_video_deletion()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO video_deletions (video_id) VALUES (OLD.id);
+  RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_record_video_deletion ON videos;
+CREATE TRIGGER trg_record_video_deletion
+AFTER DELETE ON videos
+FOR EACH ROW
+EXECUTE FUNCTION record_video_deletion();
+
 CREATE TABLE IF NOT EXISTS video_segments (
   id SERIAL PRIMARY KEY,
   video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
@@ -42,20 +92,159 @@ CREATE TABLE IF NOT EXISTS video_segments (
   embedding vector(1024)
 );
 
-CREATE INDEX IF NOT EXISTS video_segments_embedding_ann_idx
+CREATE INDEX IF NOT EXISTS video_segments_video_id_idx
+  ON video_segments (video_id);
+
+-- Segments deleted while their video stays, e.g. replaced by a re-ingest. The
+-- cascade of a video delete is already logged by its video_deletions row.
+CREATE OR REPLACE FUNCTION record_segment_deletions()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO video_deletions (video_id, segment_id)
+  SELECT deleted_segments.video_id, deleted_segments.id
+  FROM deleted_segments
+  WHERE EXISTS (SELECT 1 FROM videos WHERE videos.id = deleted_segments.video_id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_record_segment_deletions ON video_segments;
+CREATE TRIGGER trg_record_segment_deletions
+AFTER DELETE ON video_segments
+REFERENCING OLD TABLE AS deleted_segments
+FOR EACH STATEMENT
+EXECUTE FUNCTION record_segment_deletions();
+
+-- One HNSW index per (modality, scope) partition, so a filtered search only
+-- traverses the rows it can return. VectorDBService repeats these predicates
+-- verbatim in its queries; keep both in sync when adding a partition.
+-- Embeddings are stored at unit length, so inner product ranks like cosine
+-- without normalizing on every comparison. normalize_migration.py converts
+-- older cosine-indexed tables, and halfvec_migration.py replaces these with
+-- halfvec_ip_ops indexes; both keep the names, so re-running this script
+-- afterwards leaves them alone.
+DROP INDEX IF EXISTS video_segments_embedding_ann_idx;
+
+CREATE INDEX IF NOT EXISTS video_segments_visual_text_clip_ann_idx
+  ON video_segments
+  USING hnsw (embedding vector_ip_ops)
+  WHERE modality = 'visual-text' AND scope = 'clip';
+
+CREATE INDEX IF NOT EXISTS video_segments_visual_text_video_ann_idx
   ON video_segments
-  USING hnsw (embedding vector_cosine_ops);
+  USING hnsw (embedding vector_ip_ops)
+  WHERE modality = 'visual-text' AND scope = 'video';
+
+CREATE INDEX IF NOT EXISTS video_segments_audio_clip_ann_idx
+  ON video_segments
+  USING hnsw (embedding vector_ip_ops)
+  WHERE modality = 'audio' AND scope = 'clip';
+
+CREATE INDEX IF NOT EXISTS video_segments_audio_video_ann_idx
+  ON video_segments
+  USING hnsw (embedding vector_ip_ops)
+  WHERE modality = 'audio' AND scope = 'video';
+
+-- The "binary" search mode's binary-quantized twins of these indexes are built
+-- by the binary_indexes action of search_indexes.py once the mode is enabled.
+
+-- PCA projections of the embeddings, fitted offline by projection_refresh.py.
+-- Each refresh adds a version; searches and ingest use the latest activated one.
+CREATE TABLE IF NOT EXISTS embedding_projections (
+  version SERIAL PRIMARY KEY,
+  dimensions INTEGER NOT NULL,
+  mean DOUBLE PRECISION[] NOT NULL,
+  components DOUBLE PRECISION[][] NOT NULL,
+  explained_variance DOUBLE PRECISION,
+  sample_size INTEGER,
+  created_at TIMESTAMP DEFAULT NOW(),
+  activated_at TIMESTAMP
+);
+
+-- 128-d projection of each segment embedding for the "coarse" search mode,
+-- tagged with the projection version that produced it
+ALTER TABLE video_segments
+  ADD COLUMN IF NOT EXISTS coarse_embedding vector(128),
+  ADD COLUMN IF NOT EXISTS projection_version INTEGER
+    REFERENCES embedding_projections(version);
+
+-- Projections of a version being backfilled, moved into coarse_embedding when
+-- projection_refresh activates it, so searches only ever read the active version
+ALTER TABLE video_segments
+  ADD COLUMN IF NOT EXISTS staged_coarse_embedding vector(128),
+  ADD COLUMN IF NOT EXISTS staged_projection_version INTEGER
+    REFERENCES embedding_projections(version);
+
+-- The "coarse" search mode's HNSW indexes of coarse_embedding are built by the
+-- projection_indexes action of search_indexes.py once the mode is enabled.
+
+-- k-means centroids of the clip embeddings, fitted offline by cluster_refresh.py.
+-- Each refresh adds a version; searches and ingest use the latest activated one.
+CREATE TABLE IF NOT EXISTS embedding_clusterings (
+  version SERIAL PRIMARY KEY,
+  clusters INTEGER NOT NULL,
+  centroids DOUBLE PRECISION[][] NOT NULL,
+  mean_similarity DOUBLE PRECISION,
+  sample_size INTEGER,
+  created_at TIMESTAMP DEFAULT NOW(),
+  activated_at TIMESTAMP
+);
+
+-- Nearest centroid of each segment embedding for the "ivf" search mode, tagged
+-- with the clustering version that assigned it. The search scans the rows of
+-- the probed clusters through this index instead of an HNSW graph.
+ALTER TABLE video_segments
+  ADD COLUMN IF NOT EXISTS cluster_id INTEGER,
+  ADD COLUMN IF NOT EXISTS clustering_version INTEGER
+    REFERENCES embedding_clusterings(version);
+
+CREATE INDEX IF NOT EXISTS video_segments_cluster_idx
+  ON video_segments (clustering_version, cluster_id);
+
+-- Clusters of a version being backfilled, moved into cluster_id when
+-- cluster_refresh activates it
+ALTER TABLE video_segments
+  ADD COLUMN IF NOT EXISTS staged_cluster_id INTEGER,
+  ADD COLUMN IF NOT EXISTS staged_clustering_version INTEGER
+    REFERENCES embedding_clusterings(version);
+
+-- Ranked candidates of a search, stored once so later pages can be served
+-- without re-running the embedding call or the ANN query
+CREATE TABLE IF NOT EXISTS search_sessions (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  segment_ids INTEGER[] NOT NULL,
+  similarities DOUBLE PRECISION[] NOT NULL,
+  query_indexes JSONB,
+  created_at TIMESTAMP DEFAULT NOW(),
+  expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS search_sessions_expires_at_idx
+  ON search_sessions (expires_at);
+
+-- Set when a session is grouped by video: each video's score and the number of
+-- its segments stored, in order, in segment_ids
+ALTER TABLE search_sessions ADD COLUMN IF NOT EXISTS video_groups JSONB;
+
+-- Set when modalities were fused: each segment's fused score, which ranks the
+-- session, next to its best single-modality similarity
+ALTER TABLE search_sessions ADD COLUMN IF NOT EXISTS fused_scores DOUBLE PRECISION[];
 
 CREATE TABLE IF NOT EXISTS tasks (
   id SERIAL PRIMARY KEY,
   sqs_message_id TEXT,
   s3_bucket TEXT NOT NULL,
   s3_key TEXT NOT NULL,
-  created_at TIMESTAMP DEFAULT NOW(),
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
   updated_at TIMESTAMP DEFAULT NOW(),
   status TEXT NOT NULL
 );
 
+-- Keyset pagination order for fetch_tasks, NOT NULL as for videos
+UPDATE tasks SET created_at = COALESCE(updated_at, NOW()) WHERE created_at IS NULL;
+ALTER TABLE tasks ALTER COLUMN created_at SET NOT NULL;
+CREATE INDEX IF NOT EXISTS tasks_created_at_id_idx ON tasks (created_at, id);
+
 -- Trigger for tasks
 DROP TRIGGER IF EXISTS trg_update_tasks_updated_at ON tasks;
 CREATE TRIGGER trg_update_tasks_updated_at
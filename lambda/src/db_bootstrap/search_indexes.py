@@ -0,0 +1,91 @@
+"""
+HNSW indexes that only the optional search modes read, built by db_bootstrap
+invocations once a mode is enabled rather than by schema.sql:
+
+    binary_indexes      binary-quantized twins of the partition indexes, for
+                        the "binary" search mode
+    projection_indexes  indexes of the PCA-projected coarse_embedding, for the
+                        "coarse" search mode
+
+Both are built with CREATE INDEX CONCURRENTLY, so ingest carries on during the
+build. Until they exist the mode's candidate scan falls back to a sequential
+scan.
+"""
+
+from logging import getLogger
+from psycopg2.extensions import connection
+
+EMBEDDING_DIMENSIONS = 1024
+
+# Index of each (modality, scope) partition, keyed like VectorDBService's
+# PARTITION_INDEXES. The index expressions must match VectorDBService's ORDER BY.
+BINARY_PARTITION_INDEXES = {
+    ("visual-text", "clip"): "video_segments_visual_text_clip_bq_idx",
+    ("visual-text", "video"): "video_segments_visual_text_video_bq_idx",
+    ("audio", "clip"): "video_segments_audio_clip_bq_idx",
+    ("audio", "video"): "video_segments_audio_video_bq_idx",
+}
+BINARY_INDEX_METHOD = (
+    f"((binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS})) bit_hamming_ops)"
+)
+COARSE_PARTITION_INDEXES = {
+    ("visual-text", "clip"): "video_segments_visual_text_clip_coarse_idx",
+    ("visual-text", "video"): "video_segments_visual_text_video_coarse_idx",
+    ("audio", "clip"): "video_segments_audio_clip_coarse_idx",
+    ("audio", "video"): "video_segments_audio_video_coarse_idx",
+}
+COARSE_INDEX_METHOD = "(coarse_embedding vector_ip_ops)"
+
+logger = getLogger()
+
+
+def build_binary_indexes(conn: connection) -> list[str]:
+    """Build the missing binary-quantized partition indexes"""
+    return build_partition_indexes(conn, BINARY_PARTITION_INDEXES, BINARY_INDEX_METHOD)
+
+
+def build_projection_indexes(conn: connection) -> list[str]:
+    """Build the missing coarse_embedding partition indexes"""
+    return build_partition_indexes(conn, COARSE_PARTITION_INDEXES, COARSE_INDEX_METHOD)
+
+
+def build_partition_indexes(
+    conn: connection, partition_indexes, method: str
+) -> list[str]:
+    """
+    Build each of `partition_indexes` with `method` unless a valid one exists.
+    An invalid index left by an interrupted concurrent build is dropped and
+    built again. Returns the names of the indexes built.
+    """
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    built = []
+    try:
+        with conn.cursor() as cursor:
+            for (modality, scope), index_name in partition_indexes.items():
+                cursor.execute(
+                    """
+                    SELECT indisvalid FROM pg_index
+                    WHERE indexrelid = to_regclass(%s)
+                    """,
+                    (index_name,),
+                )
+                existing = cursor.fetchone()
+                if existing and existing[0]:
+                    continue
+                if existing:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY {index_name}")
+                cursor.execute(
+                    f"""
+                    CREATE INDEX CONCURRENTLY {index_name}
+                    ON video_segments
+                    USING hnsw {method}
+                    WHERE modality = %s AND scope = %s
+                    """,
+                    (modality, scope),
+                )
+                built.append(index_name)
+                logger.info(f"Built {index_name}")
+    finally:
+        conn.autocommit = autocommit
+    return built
@@ -1,3 +1,4 @@
+import math
 from typing import BinaryIO, Optional, List, Union, Dict, Any
 from twelvelabs import TwelveLabs
 from twelvelabs.types import VideoSegment, VideoEmbeddingTask, VideoEmbeddingMetadata
@@ -10,6 +11,17 @@ from logging import getLogger
 from embedding_cache import EmbeddingCache
 
 
+def l2_normalize(embedding: List[float]) -> List[float]:
+    """
+    Scale an embedding to unit length, so the inner product of two normalized
+    embeddings is their cosine similarity
+    """
+    norm = math.sqrt(math.fsum(value * value for value in embedding))
+    if norm == 0:
+        return list(embedding)
+    return [value / norm for value in embedding]
+
+
 class EmbedService:
     def __init__(
         self,
@@ -46,7 +58,7 @@ class EmbedService:
                 self.logger.info("Using cached text embedding")
                 segments = cached_embedding.get("segments", [])
                 if segments and segments[0].get("float"):
-                    return segments[0]["float"]
+                    return l2_normalize(segments[0]["float"])
 
         self.logger.info("Cache miss - creating new text embedding")
         res = self.client.embed.create(
@@ -70,7 +82,7 @@ class EmbedService:
                 task_id="text_" + str(abs(hash(input_text))),
             )
 
-        return res.text_embedding.segments[0].float_
+        return l2_normalize(res.text_embedding.segments[0].float_)
 
     def extract_image_embedding(
         self,
@@ -91,7 +103,7 @@ class EmbedService:
                 self.logger.info("Using cached image embedding")
                 segments = cached_embedding.get("segments", [])
                 if segments and segments[0].get("float"):
-                    return segments[0]["float"]
+                    return l2_normalize(segments[0]["float"])
 
         self.logger.info("Cache miss - creating new image embedding")
         if url:
@@ -118,7 +130,7 @@ class EmbedService:
                 task_id="image_" + str(abs(hash(str(content_key)))),
             )
 
-        return res.image_embedding.segments[0].float_
+        return l2_normalize(res.image_embedding.segments[0].float_)
 
     def extract_audio_embedding(
         self,
@@ -139,7 +151,7 @@ class EmbedService:
                 self.logger.info("Using cached audio embedding")
                 segments = cached_embedding.get("segments", [])
                 if segments and segments[0].get("float"):
-                    return segments[0]["float"]
+                    return l2_normalize(segments[0]["float"])
 
         self.logger.info("Cache miss - creating new audio embedding")
         if url:
@@ -166,7 +178,7 @@ class EmbedService:
                 task_id="audio_" + str(abs(hash(str(content_key)))),
             )
 
-        return res.audio_embedding.segments[0].float_
+        return l2_normalize(res.audio_embedding.segments[0].float_)
 
     def extract_video_embedding(
         self,
@@ -193,7 +205,7 @@ class EmbedService:
                 self.logger.info("Using cached video embedding")
                 segments = cached_embedding.get("segments", [])
                 return [
-                    segment["embedding"]
+                    l2_normalize(segment["embedding"])
                     for segment in segments
                     if segment["scope"] == "video"
                     and segment["modality"] in query_modality
@@ -236,6 +248,7 @@ class EmbedService:
 
         self.logger.info(f"Extracted video features: {segments}")
 
+        # retrieve_segments has already normalized these
         return [
             segment["embedding"]
             for segment in segments
@@ -304,13 +317,14 @@ class EmbedService:
         return self.normalize_segments(segments)
 
     def normalize_segments(self, segments: List[VideoSegment]) -> List[Dict[str, Any]]:
+        """Map API segments to stored segment dicts with unit-length embeddings"""
         return [
             {
                 "start_time": segment.start_offset_sec,
                 "end_time": segment.end_offset_sec,
                 "scope": segment.embedding_scope,  # "clip" or "video"
                 "modality": segment.embedding_option,  # "text-visual" or "audio"
-                "embedding": segment.float_,
+                "embedding": l2_normalize(segment.float_),
             }
             for segment in segments
         ]
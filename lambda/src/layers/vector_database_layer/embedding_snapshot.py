@@ -0,0 +1,408 @@
+"""
+Versioned on-disk snapshots of video_segments embeddings, read with
+numpy.memmap so a process can scan the corpus without loading it.
+
+A snapshot is a directory:
+
+    manifest.json               format version, dtype, dimensions, partition
+                                codes, parts, id watermark, deleted videos and
+                                retired parts
+    part-00000/embeddings.npy   (rows, dimensions) float16 or float32 matrix
+    part-00000/segment_id.npy   one .npy file per metadata column
+    part-00000/...
+
+build() streams every segment through a server-side cursor into the first
+part, append() adds a delta part with the segments above the watermark and
+records deleted videos, and compact() merges all parts into one without the
+deleted videos' rows. The manifest is replaced atomically, so readers only
+ever see complete parts.
+
+Parts replaced by compact() are only retired in the manifest, because readers
+that mapped them keep reading them, and on EFS or NFS a removed file does not
+stay readable through an open mapping. remove_retired_parts() deletes them
+once they have been retired for longer than any reader keeps a snapshot.
+
+Run as a batch job with the database settings of config.get_db_config:
+
+    python embedding_snapshot.py build|append|compact|gc PATH [--dtype float16]
+"""
+
+import os
+import json
+import time
+import shutil
+import numpy as np
+from logging import getLogger
+from typing import Any, NamedTuple
+from numpy.lib.format import open_memmap
+
+FORMAT_VERSION = 1
+SNAPSHOT_DTYPES = ["float32", "float16"]
+MANIFEST_NAME = "manifest.json"
+
+# Metadata columns stored next to the embeddings matrix of each part
+COLUMNS = {
+    "segment_id": np.int64,
+    "video_id": np.int64,
+    "partition": np.int8,
+    "start_time": np.float32,
+    "end_time": np.float32,
+}
+
+# Rows copied per step when compacting
+COPY_CHUNK = 65536
+# Seconds a part replaced by compact() stays on disk for the readers that
+# mapped it, e.g. search lambdas started before the compaction
+RETIRED_PART_GRACE_PERIOD = 24 * 3600
+
+logger = getLogger()
+
+
+class SnapshotPart(NamedTuple):
+    embeddings: np.ndarray
+    segment_id: np.ndarray
+    video_id: np.ndarray
+    partition: np.ndarray
+    start_time: np.ndarray
+    end_time: np.ndarray
+
+
+class EmbeddingSnapshot:
+    """A snapshot directory opened read-only, every array memory-mapped"""
+
+    def __init__(self, path: str):
+        self.path = path
+        manifest = read_manifest(path)
+        self.dtype = np.dtype(manifest["dtype"])
+        self.dimensions = manifest["dimensions"]
+        self.watermark = manifest["watermark"]
+        self.partitions = [tuple(partition) for partition in manifest["partitions"]]
+        self.deleted_video_ids = np.array(manifest["deleted_video_ids"], dtype=np.int64)
+        self.parts = [
+            open_part(os.path.join(path, part["name"])) for part in manifest["parts"]
+        ]
+
+    def __len__(self) -> int:
+        return sum(len(part.segment_id) for part in self.parts)
+
+    def alive(self, part: SnapshotPart) -> np.ndarray:
+        """Rows of `part` whose video has not been deleted since it was written"""
+        return ~np.isin(part.video_id, self.deleted_video_ids)
+
+
+def open_part(part_path: str) -> SnapshotPart:
+    return SnapshotPart(
+        *(
+            np.load(os.path.join(part_path, f"{name}.npy"), mmap_mode="r")
+            for name in SnapshotPart._fields
+        )
+    )
+
+
+def read_manifest(path: str) -> dict[str, Any]:
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot format version: {manifest.get('format_version')}"
+        )
+    return manifest
+
+
+def write_manifest(path: str, manifest: dict[str, Any]):
+    """Replace the manifest atomically"""
+    temp_path = os.path.join(path, f"{MANIFEST_NAME}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, os.path.join(path, MANIFEST_NAME))
+
+
+class PartWriter:
+    """Fill the memory-mapped arrays of a new part, `count` rows in id order"""
+
+    def __init__(self, part_path: str, count: int, dimensions: int, dtype: str):
+        os.makedirs(part_path, exist_ok=True)
+        self.count = count
+        self.written = 0
+        self.arrays = {
+            "embeddings": open_memmap(
+                os.path.join(part_path, "embeddings.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(count, dimensions),
+            ),
+            **{
+                name: open_memmap(
+                    os.path.join(part_path, f"{name}.npy"),
+                    mode="w+",
+                    dtype=column_dtype,
+                    shape=(count,),
+                )
+                for name, column_dtype in COLUMNS.items()
+            },
+        }
+
+    def write(self, **columns: np.ndarray):
+        rows = len(columns["segment_id"])
+        if self.written + rows > self.count:
+            raise ValueError("More rows than the part was sized for")
+        for name, values in columns.items():
+            self.arrays[name][self.written : self.written + rows] = values
+        self.written += rows
+
+    def close(self):
+        if self.written != self.count:
+            raise ValueError(f"Wrote {self.written} of {self.count} part rows")
+        for array in self.arrays.values():
+            array.flush()
+
+
+def build(conn, path: str, dtype="float32", batch_size=5000) -> dict[str, Any]:
+    """Write a new snapshot of every segment with an embedding into `path`"""
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+    if os.path.exists(os.path.join(path, MANIFEST_NAME)):
+        raise ValueError(f"A snapshot already exists at {path}")
+
+    os.makedirs(path, exist_ok=True)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "dtype": dtype,
+        "dimensions": None,
+        "partitions": [],
+        "parts": [],
+        "next_part": 0,
+        "watermark": 0,
+        "deleted_video_ids": [],
+        "retired_parts": [],
+    }
+    part = _write_delta_part(conn, path, manifest, batch_size)
+    write_manifest(path, manifest)
+    return {"path": path, "rows": part["rows"] if part else 0, **_summary(manifest)}
+
+
+def append(conn, path: str, batch_size=5000) -> dict[str, Any]:
+    """
+    Add a delta part with the segments above the snapshot's watermark and
+    record the videos deleted since the last build or append
+    """
+    manifest = read_manifest(path)
+    delta = _write_delta_part(conn, path, manifest, batch_size)
+
+    parts = [open_part(os.path.join(path, part["name"])) for part in manifest["parts"]]
+    video_ids = np.unique(
+        np.concatenate([part.video_id for part in parts] or [np.empty(0, np.int64)])
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM videos WHERE id = ANY(%s)", (video_ids.tolist(),)
+        )
+        existing = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    deleted = np.setdiff1d(video_ids, existing).tolist()
+    manifest["deleted_video_ids"] = sorted(
+        set(manifest["deleted_video_ids"]) | set(deleted)
+    )
+
+    write_manifest(path, manifest)
+    return {"path": path, "rows": delta["rows"] if delta else 0, **_summary(manifest)}
+
+
+def compact(path: str, grace_period=RETIRED_PART_GRACE_PERIOD) -> dict[str, Any]:
+    """
+    Merge every part into one, dropping the rows of deleted videos, and retire
+    the old parts. Parts retired more than `grace_period` seconds ago, by an
+    earlier compaction, are removed.
+    """
+    manifest = read_manifest(path)
+    snapshot = EmbeddingSnapshot(path)
+    keep = [snapshot.alive(part) for part in snapshot.parts]
+    count = int(sum(mask.sum() for mask in keep))
+
+    name = f"part-{manifest['next_part']:05d}"
+    writer = PartWriter(
+        os.path.join(path, name), count, snapshot.dimensions or 0, manifest["dtype"]
+    )
+    for part, mask in zip(snapshot.parts, keep):
+        for start in range(0, len(part.segment_id), COPY_CHUNK):
+            rows = mask[start : start + COPY_CHUNK]
+            writer.write(
+                **{
+                    field: values[start : start + COPY_CHUNK][rows]
+                    for field, values in part._asdict().items()
+                }
+            )
+    writer.close()
+
+    old_parts = [part["name"] for part in manifest["parts"]]
+    manifest["parts"] = [{"name": name, "rows": count}]
+    manifest["next_part"] += 1
+    manifest["deleted_video_ids"] = []
+    retired_at = time.time()
+    manifest["retired_parts"] = manifest.get("retired_parts", []) + [
+        {"name": old_part, "retired_at": retired_at} for old_part in old_parts
+    ]
+    write_manifest(path, manifest)
+    logger.info(f"Compacted {len(old_parts)} snapshot parts into {name}")
+
+    manifest = remove_retired_parts(path, grace_period)
+    return {"path": path, "rows": count, **_summary(manifest)}
+
+
+def remove_retired_parts(
+    path: str, grace_period=RETIRED_PART_GRACE_PERIOD
+) -> dict[str, Any]:
+    """
+    Delete the parts retired more than `grace_period` seconds ago and drop them
+    from the manifest, which is returned
+    """
+    manifest = read_manifest(path)
+    retired = manifest.get("retired_parts", [])
+    cutoff = time.time() - grace_period
+    expired = [part for part in retired if part["retired_at"] <= cutoff]
+    if not expired:
+        return manifest
+
+    # A run stopped between the two steps leaves the parts listed to retry
+    for part in expired:
+        shutil.rmtree(os.path.join(path, part["name"]), ignore_errors=True)
+    manifest["retired_parts"] = [part for part in retired if part not in expired]
+    write_manifest(path, manifest)
+    logger.info(f"Removed {len(expired)} retired snapshot parts")
+    return manifest
+
+
+def _write_delta_part(conn, path, manifest, batch_size) -> dict[str, Any] | None:
+    """
+    Stream the segments above the watermark into a new part and register it
+    in `manifest`. The count and the rows come from one repeatable-read
+    transaction, so the preallocated part is filled exactly.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute(
+            """
+            SELECT COUNT(*), MAX(id), MAX(vector_dims(embedding))
+            FROM video_segments
+            WHERE id > %s AND embedding IS NOT NULL
+            """,
+            (manifest["watermark"],),
+        )
+        count, max_id, dimensions = cursor.fetchone()
+
+    if not count:
+        conn.commit()
+        return None
+    if manifest["dimensions"] not in (None, dimensions):
+        conn.rollback()
+        raise ValueError(
+            f"Segments have {dimensions} dimensions, "
+            f"the snapshot has {manifest['dimensions']}"
+        )
+
+    name = f"part-{manifest['next_part']:05d}"
+    writer = PartWriter(os.path.join(path, name), count, dimensions, manifest["dtype"])
+    partitions = [tuple(partition) for partition in manifest["partitions"]]
+    try:
+        with conn.cursor(name="embedding_snapshot") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(
+                """
+                SELECT
+                    id,
+                    video_id,
+                    modality,
+                    scope,
+                    start_time,
+                    end_time,
+                    embedding::text
+                FROM video_segments
+                WHERE id > %s AND id <= %s AND embedding IS NOT NULL
+                ORDER BY id
+                """,
+                (manifest["watermark"], max_id),
+            )
+            while rows := cursor.fetchmany(batch_size):
+                writer.write(
+                    embeddings=np.stack(
+                        [
+                            np.fromstring(row[6][1:-1], dtype=np.float32, sep=",")
+                            for row in rows
+                        ]
+                    ),
+                    segment_id=[row[0] for row in rows],
+                    video_id=[row[1] for row in rows],
+                    partition=[
+                        _partition_code(partitions, (row[2], row[3])) for row in rows
+                    ],
+                    start_time=[row[4] for row in rows],
+                    end_time=[row[5] for row in rows],
+                )
+                logger.info(f"Wrote {writer.written} of {count} segments to {name}")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    writer.close()
+
+    part = {"name": name, "rows": count}
+    manifest["parts"].append(part)
+    manifest["next_part"] += 1
+    manifest["watermark"] = max_id
+    manifest["dimensions"] = dimensions
+    manifest["partitions"] = [list(partition) for partition in partitions]
+    return part
+
+
+def _partition_code(partitions: list[tuple[str, str]], partition) -> int:
+    if partition not in partitions:
+        partitions.append(partition)
+    return partitions.index(partition)
+
+
+def _summary(manifest: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "parts": len(manifest["parts"]),
+        "total_rows": sum(part["rows"] for part in manifest["parts"]),
+        "watermark": manifest["watermark"],
+        "deleted_videos": len(manifest["deleted_video_ids"]),
+        "retired_parts": len(manifest.get("retired_parts", [])),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+    import psycopg2
+    from config import get_secret, get_db_config
+
+    parser = argparse.ArgumentParser(
+        description="Build or update an embedding snapshot"
+    )
+    parser.add_argument("action", choices=["build", "append", "compact", "gc"])
+    parser.add_argument("path")
+    parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="float32")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--grace-period",
+        type=int,
+        default=RETIRED_PART_GRACE_PERIOD,
+        help="Seconds retired parts are kept for readers that mapped them",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.action == "compact":
+        result = compact(args.path, args.grace_period)
+    elif args.action == "gc":
+        manifest = remove_retired_parts(args.path, args.grace_period)
+        result = {"path": args.path, **_summary(manifest)}
+    else:
+        secret_name = os.getenv("SECRET_NAME")
+        secret = get_secret(secret_name) if secret_name else {}
+        with psycopg2.connect(**get_db_config(secret)) as conn:
+            if args.action == "build":
+                result = build(conn, args.path, args.dtype, args.batch_size)
+            else:
+                result = append(conn, args.path, args.batch_size)
+    print(json.dumps(result, indent=2))
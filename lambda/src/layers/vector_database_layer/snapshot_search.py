@@ -0,0 +1,377 @@
+import os
+import time
+import uuid
+import numpy as np
+from datetime import timedelta
+from logging import getLogger
+from psycopg2.extras import RealDictCursor
+from vector_db_service import VectorDBService
+from vector_store import NumpyVectorStore
+from embedding_snapshot import EmbeddingSnapshot
+
+# "float16" halves the snapshot's memory; scores are still computed in float32
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "float32")
+SNAPSHOT_REFRESH_INTERVAL = int(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "60"))  # seconds
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "20000"))
+# Directory written by embedding_snapshot, memory-mapped instead of loaded
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+# An engine that has not refreshed for this long stops holding back the pruning
+# of video_deletions, and reloads in full when it next refreshes
+SNAPSHOT_CONSUMER_TTL = int(os.getenv("SNAPSHOT_CONSUMER_TTL", "3600"))  # seconds
+# How long after its updated_at a videos update may commit and still be seen
+VIDEO_UPDATE_LAG = timedelta(minutes=5)
+
+VIDEOS_QUERY = """
+    SELECT
+        id AS video_id,
+        s3_bucket,
+        s3_key,
+        filename,
+        duration,
+        created_at,
+        updated_at,
+        height,
+        width
+    FROM videos
+"""
+
+
+class SnapshotSearchEngine(NumpyVectorStore):
+    """
+    NumpyVectorStore kept in step with video_segments, whose results match
+    VectorDBService.find_similar dict for dict.
+
+    With `snapshot_path` the parts of an embedding_snapshot directory are
+    memory-mapped rather than queried. At most every `refresh_interval`
+    seconds a search first pulls segments above the id watermark, with the
+    metadata of their videos, reloads the videos updated since, and tombstones
+    the videos and segments logged in video_deletions since the last refresh.
+    The videos table is only read in full once, at startup. Embeddings
+    rewritten in place, e.g. by a db_bootstrap migration, need a new snapshot.
+
+    Each engine records the video_deletions id it has applied in
+    snapshot_consumers, and prunes the log below the lowest one. An engine
+    idle for longer than `consumer_ttl` may have missed pruned deletions, so
+    it compares its segments and videos with the tables instead.
+    """
+
+    def __init__(
+        self,
+        vector_db_service: VectorDBService,
+        dtype=SNAPSHOT_DTYPE,
+        refresh_interval=SNAPSHOT_REFRESH_INTERVAL,
+        batch_size=SNAPSHOT_BATCH_SIZE,
+        snapshot_path=SNAPSHOT_PATH,
+        consumer_ttl=SNAPSHOT_CONSUMER_TTL,
+        logger=getLogger(),
+    ):
+        super().__init__(
+            page_limit=vector_db_service.default_page_limit,
+            min_similarity=vector_db_service.default_min_similarity,
+            dtype=dtype,
+            logger=logger,
+        )
+        self.vector_db_service = vector_db_service
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.consumer_ttl = consumer_ttl
+        self.consumer_id = uuid.uuid4().hex
+        self.watermark = 0
+        self.deletion_watermark = 0
+        # Latest updated_at of the loaded videos
+        self.videos_updated_at = None
+        self._refreshed_at = 0.0
+        self._snapshot_loaded = False
+
+        started = time.monotonic()
+        if snapshot_path:
+            self._load_snapshot(snapshot_path)
+            self._snapshot_loaded = True
+        self.refresh(force=True)
+        self.logger.info(
+            f"Loaded {len(self.segment_ids)} segments into the search snapshot "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    @property
+    def conn(self):
+        """The service's connection, which it replaces after a reconnect"""
+        return self.vector_db_service.conn
+
+    def refresh(self, force=False):
+        """
+        Pull new segments and updated videos and tombstone deleted videos and
+        segments, at most once per interval
+        """
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.refresh_interval:
+            return
+
+        try:
+            self.vector_db_service.reconnect_if_closed()
+            if self._refreshed_at and self._renew_consumer():
+                self._load_videos(self._load_new_segments())
+                self._load_updated_videos()
+            else:
+                # Deletions logged from here on are applied by later refreshes
+                self._load_deletion_watermark()
+                self._register_consumer()
+                self._load_new_segments()
+                if self._snapshot_loaded or self._refreshed_at:
+                    self._tombstone_missing_segments()
+                self._load_videos()
+            self._load_deletions()
+            self._prune_deletions()
+            self.conn.commit()
+        except Exception as e:
+            if not self.conn.closed:
+                self.conn.rollback()
+            if force:
+                raise e
+            self.logger.warning(f"Failed to refresh search snapshot: {e}")
+            return
+        self._refreshed_at = now
+        self._compact_if_needed()
+
+    def rank(
+        self,
+        embedding=None,
+        embeddings=None,
+        filter=None,
+        min_similarity=None,
+        max_candidates=None,
+    ) -> dict[str, list]:
+        """
+        Rank the candidates of a search session, as the keyword arguments of
+        VectorDBService.store_search_session
+        """
+        max_candidates = (
+            max_candidates or self.vector_db_service.search_session_max_candidates
+        )
+        batch = embeddings is not None
+        candidates = self._top_candidates(
+            embeddings if batch else [embedding], filter, min_similarity, max_candidates
+        )
+        return {
+            "segment_ids": [int(self.segment_ids[row]) for row, _, _ in candidates],
+            "similarities": [similarity for _, similarity, _ in candidates],
+            "query_indexes": (
+                [query_indexes for _, _, query_indexes in candidates] if batch else None
+            ),
+        }
+
+    def _top_candidates(self, embeddings, filter, min_similarity, limit: int):
+        self.refresh()
+        candidates = super()._top_candidates(embeddings, filter, min_similarity, limit)
+        self.last_search_plan["search_mode"] = "snapshot"
+        return candidates
+
+    def _load_new_segments(self) -> list[int]:
+        """
+        Append segments above the watermark, `batch_size` rows per query, and
+        return the ids of their videos
+        """
+        batches = []
+        while True:
+            with self.conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT
+                        id,
+                        video_id,
+                        modality,
+                        scope,
+                        start_time,
+                        end_time,
+                        embedding
+                    FROM video_segments
+                    WHERE id > %s AND embedding IS NOT NULL
+                    ORDER BY id
+                    LIMIT %s
+                    """,
+                    (self.watermark, self.batch_size),
+                )
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            batches.append(rows)
+            self.watermark = rows[-1][0]
+            if len(rows) < self.batch_size:
+                break
+
+        rows = [row for batch in batches for row in batch]
+        if not rows:
+            return []
+
+        # The service's connection decodes embeddings into float32 arrays
+        self._append_rows(
+            np.stack([row[6] for row in rows]).astype(self.dtype),
+            segment_ids=[row[0] for row in rows],
+            video_ids=[row[1] for row in rows],
+            partitions=[self._partition_code(row[2], row[3]) for row in rows],
+            start_times=[row[4] for row in rows],
+            end_times=[row[5] for row in rows],
+        )
+        self.logger.info(f"Added {len(rows)} segments to the search snapshot")
+        return sorted({row[1] for row in rows})
+
+    def _load_videos(self, video_ids: list[int] | None = None):
+        """
+        Load the metadata of `video_ids`, or of every video, and tombstone the
+        segments of those no longer in the videos table
+        """
+        if video_ids == []:
+            return
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if video_ids is None:
+                cursor.execute(VIDEOS_QUERY)
+            else:
+                cursor.execute(VIDEOS_QUERY + " WHERE id = ANY(%s)", (video_ids,))
+            videos = {row["video_id"]: dict(row) for row in cursor.fetchall()}
+        self._track_updated_at(videos)
+
+        if video_ids is None:
+            self.videos = videos
+            missing = np.setdiff1d(self.video_ids, list(videos))
+        else:
+            self.videos.update(videos)
+            missing = np.setdiff1d(video_ids, list(videos))
+        self._tombstone_videos(missing)
+
+    def _load_updated_videos(self):
+        """Reload the metadata of videos updated since the last refresh"""
+        if self.videos_updated_at is None:
+            return
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                VIDEOS_QUERY + " WHERE updated_at > %s",
+                (self.videos_updated_at - VIDEO_UPDATE_LAG,),
+            )
+            videos = {row["video_id"]: dict(row) for row in cursor.fetchall()}
+        self.videos.update(videos)
+        self._track_updated_at(videos)
+
+    def _track_updated_at(self, videos: dict[int, dict]):
+        self.videos_updated_at = max(
+            [video["updated_at"] for video in videos.values() if video["updated_at"]]
+            + ([self.videos_updated_at] if self.videos_updated_at else []),
+            default=None,
+        )
+
+    def _load_deletion_watermark(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM video_deletions")
+            self.deletion_watermark = cursor.fetchall()[0][0]
+
+    def _load_deletions(self):
+        """Tombstone the videos and segments deleted since the last refresh"""
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, video_id, segment_id
+                FROM video_deletions
+                WHERE id > %s
+                ORDER BY id
+                """,
+                (self.deletion_watermark,),
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        self.deletion_watermark = rows[-1][0]
+        video_ids = [row[1] for row in rows if row[2] is None]
+        for video_id in video_ids:
+            self.videos.pop(video_id, None)
+        self._tombstone_videos(video_ids)
+        self._tombstone_segments([row[2] for row in rows if row[2] is not None])
+
+    def _register_consumer(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO snapshot_consumers (consumer_id, deletion_watermark)
+                VALUES (%s, %s)
+                ON CONFLICT (consumer_id) DO UPDATE
+                SET deletion_watermark = EXCLUDED.deletion_watermark, seen_at = NOW()
+                """,
+                (self.consumer_id, self.deletion_watermark),
+            )
+
+    def _renew_consumer(self) -> bool:
+        """
+        Record the deletion watermark of the last refresh. False when the
+        engine was dropped as idle, so deletions it had not read may be gone.
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE snapshot_consumers
+                SET deletion_watermark = %s, seen_at = NOW()
+                WHERE consumer_id = %s
+                """,
+                (self.deletion_watermark, self.consumer_id),
+            )
+            renewed = cursor.rowcount == 1
+        if not renewed:
+            self.logger.warning("Search snapshot was idle too long, reloading it")
+        return renewed
+
+    def _prune_deletions(self):
+        """Drop idle consumers and the deletions every remaining one has applied"""
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE FROM snapshot_consumers
+                WHERE seen_at < NOW() - make_interval(secs => %s)
+                """,
+                (self.consumer_ttl,),
+            )
+            cursor.execute(
+                """
+                DELETE FROM video_deletions
+                WHERE id <= (SELECT MIN(deletion_watermark) FROM snapshot_consumers)
+                """
+            )
+
+    def _tombstone_missing_segments(self):
+        """
+        Tombstone segments no longer in video_segments, whose deletions may
+        predate the engine or have been pruned
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM video_segments WHERE id <= %s", (self.watermark,)
+            )
+            existing = [row[0] for row in cursor.fetchall()]
+        self._tombstone_segments(np.setdiff1d(self.segment_ids, existing))
+
+    def _tombstone_segments(self, segment_ids):
+        deleted = self.alive & np.isin(self.segment_ids, segment_ids)
+        if deleted.any():
+            self.alive &= ~deleted
+            self.logger.info(f"Tombstoned {int(deleted.sum())} deleted segments")
+
+    def _tombstone_videos(self, video_ids):
+        deleted = self.alive & np.isin(self.video_ids, video_ids)
+        if deleted.any():
+            self.alive &= ~deleted
+            self.logger.info(f"Tombstoned {int(deleted.sum())} snapshot segments")
+
+    def _load_snapshot(self, path: str):
+        """Map the parts of an on-disk snapshot and continue from its watermark"""
+        snapshot = EmbeddingSnapshot(path)
+        if snapshot.dtype != self.dtype:
+            self.logger.info(f"Using the {snapshot.dtype} dtype of snapshot {path}")
+            self.dtype = snapshot.dtype
+        self.partition_keys = list(snapshot.partitions)
+        for part in snapshot.parts:
+            self._append_rows(
+                part.embeddings,
+                segment_ids=part.segment_id,
+                video_ids=part.video_id,
+                partitions=part.partition,
+                start_times=part.start_time,
+                end_times=part.end_time,
+                alive=snapshot.alive(part),
+            )
+        self.watermark = snapshot.watermark
@@ -0,0 +1,94 @@
+"""
+psycopg2 adaptation of pgvector values.
+
+psycopg2 interpolates every parameter into the query text and reads every
+result as text, so pgvector's binary I/O is out of reach. Importing this
+module instead makes embeddings cross the wire in their most compact text
+form:
+
+    Vector parameters are sent as vector literals, '[0.1,0.25]', at float32
+    precision, rather than as the ARRAY[...] of float reprs a list becomes,
+    which Postgres parses as numeric[] before casting it. A list of Vectors
+    is sent as an array of literals, for `::vector[]` parameters. Plain
+    lists and numpy arrays are left to psycopg2's own adaptation.
+
+    vector and halfvec columns of a connection passed to register_vector
+    are decoded straight into float32 arrays.
+
+Vector literals are untyped, so a query still casts each parameter to the
+column type it needs, e.g. `%s::halfvec`.
+"""
+
+import numpy as np
+from psycopg2.extensions import (
+    AsIs,
+    connection,
+    new_array_type,
+    new_type,
+    register_adapter,
+    register_type,
+)
+
+# pgvector types decoded by register_vector
+VECTOR_TYPES = ["vector", "halfvec"]
+
+
+class Vector:
+    """
+    An embedding to send as a pgvector literal. Numpy code can keep using it
+    as the float32 array it wraps.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+        if self.values.ndim != 1:
+            raise ValueError(f"A vector has one dimension, not {self.values.ndim}")
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def to_vector_text(embedding) -> str:
+    """Format an embedding as pgvector text, with enough digits for float32"""
+    values = np.asarray(embedding, dtype=np.float32)
+    return "[" + ",".join(f"{value:.9g}" for value in values.tolist()) + "]"
+
+
+def adapt_vector(vector: Vector) -> AsIs:
+    return AsIs(f"'{to_vector_text(vector.values)}'")
+
+
+def parse_vector(value: str | None, cursor=None) -> np.ndarray | None:
+    """Decode pgvector text, e.g. '[0.1,0.25]', into a float32 array"""
+    if value is None:
+        return None
+    return np.fromstring(value[1:-1], dtype=np.float32, sep=",")
+
+
+def register_vector(conn: connection):
+    """
+    Decode the pgvector columns of `conn` into float32 arrays. Does nothing
+    while the extension is not installed.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT typname, oid, typarray FROM pg_type WHERE typname = ANY(%s)",
+            (VECTOR_TYPES,),
+        )
+        types = cursor.fetchall()
+    conn.commit()
+
+    for name, oid, array_oid in types:
+        vector_type = new_type((oid,), name.upper(), parse_vector)
+        register_type(vector_type, conn)
+        register_type(
+            new_array_type((array_oid,), f"{name.upper()}[]", vector_type), conn
+        )
+
+
+register_adapter(Vector, adapt_vector)
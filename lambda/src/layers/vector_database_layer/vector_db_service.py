@@ -1,42 +1,414 @@
 import os
+import re
+import json
+import math
 import time
+import base64
+import hashlib
+import binascii
+import numpy as np
 import psycopg2
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from itertools import groupby
 from logging import getLogger
-from typing import Any, NamedTuple
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple
+from psycopg2.errors import InvalidSqlStatementName
 from psycopg2.extras import RealDictCursor
-from psycopg2.extensions import connection
+from psycopg2.extensions import connection, cursor as Cursor
+from vector_adapter import Vector, register_vector
 
 
 class PaginatedResult(NamedTuple):
     items: list[dict[str, Any]]
     total: int
+    next_cursor: str | None = None
+
+
+class EmbeddingProjection(NamedTuple):
+    """A PCA projection of the embeddings, as stored in embedding_projections"""
+
+    version: int
+    mean: np.ndarray
+    components: np.ndarray
+
+    def project_segment(self, embedding) -> list[float]:
+        """Project a stored embedding: its offset from the mean, onto the components"""
+        return (self.components @ (np.asarray(embedding) - self.mean)).tolist()
+
+    def project_query(self, embedding) -> list[float]:
+        """
+        Project a query embedding without centering it. The inner product with
+        a projected segment then approximates the query's inner product with
+        the segment's offset from the mean, which only differs from the full
+        inner product by a per-query constant, so the ranking is kept.
+        """
+        return (self.components @ np.asarray(embedding)).tolist()
+
+
+class EmbeddingClustering(NamedTuple):
+    """A k-means clustering of the embeddings, as stored in embedding_clusterings"""
+
+    version: int
+    centroids: np.ndarray
+
+    def assign(self, embedding) -> int:
+        """The cluster of a stored embedding: its nearest centroid"""
+        return int(np.argmax(self.centroids @ np.asarray(embedding)))
+
+    def nearest(self, embedding, nprobe: int) -> list[int]:
+        """The `nprobe` clusters whose centroids are nearest a query embedding"""
+        similarities = self.centroids @ np.asarray(embedding)
+        nprobe = min(nprobe, len(similarities))
+        return np.argpartition(-similarities, nprobe - 1)[:nprobe].tolist()
 
 
 DEFAULT_PAGE_LIMIT = os.getenv("DEFAULT_PAGE_LIMIT", 10)
 DEFAULT_MIN_SIMILARITY = os.getenv("DEFAULT_MIN_SIMILARITY", 0.2)
+HNSW_EF_SEARCH_MIN = int(os.getenv("HNSW_EF_SEARCH_MIN", "40"))
+HNSW_EF_SEARCH_MAX = int(os.getenv("HNSW_EF_SEARCH_MAX", "1000"))
+# Opt-in pgvector iterative index scans: "strict" or "relaxed" (unset = off)
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN") or None
+HNSW_MAX_SCAN_TUPLES = int(os.getenv("HNSW_MAX_SCAN_TUPLES", "20000"))
+EXACT_SEARCH_SELECTIVITY = float(os.getenv("EXACT_SEARCH_SELECTIVITY", "0.01"))
+# Searches expected to compare at most this many segments scan them exactly
+EXACT_SEARCH_MAX_ROWS = int(os.getenv("EXACT_SEARCH_MAX_ROWS", "20000"))
+TABLE_STATS_TTL = int(os.getenv("TABLE_STATS_TTL", "300"))  # seconds
+SEARCH_SESSION_TTL = int(os.getenv("SEARCH_SESSION_TTL", "900"))  # seconds
+SEARCH_SESSION_MAX_CANDIDATES = int(os.getenv("SEARCH_SESSION_MAX_CANDIDATES", "200"))
+# Column type of video_segments.embedding: "vector" or "halfvec" once the
+# db_bootstrap halfvec migration has been swapped in
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector")
+# "hnsw" searches the embedding indexes directly; "binary" and "coarse" take
+# an oversample of candidates from the binary-quantized or PCA-projected
+# indexes and rerank them exactly; "hierarchical" searches clips only within
+# the videos whose video-scope embedding is nearest; "ivf" scans only the rows
+# of the clusters whose k-means centroids are nearest
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hnsw")
+BINARY_OVERSAMPLE = int(os.getenv("BINARY_OVERSAMPLE", "10"))
+COARSE_OVERSAMPLE = int(os.getenv("COARSE_OVERSAMPLE", "4"))
+HIERARCHICAL_VIDEOS = int(os.getenv("HIERARCHICAL_VIDEOS", "100"))
+PROJECTION_TTL = int(os.getenv("PROJECTION_TTL", "300"))  # seconds
+# Clusters probed per query vector in "ivf" mode
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+CLUSTERING_TTL = int(os.getenv("CLUSTERING_TTL", "300"))  # seconds
+# The versions the database holds active. Searches compare against these rather
+# than the cached models, which may lag an activation by up to their TTL.
+ACTIVE_PROJECTION_VERSION = """
+    SELECT version FROM embedding_projections
+    WHERE activated_at IS NOT NULL
+    ORDER BY activated_at DESC
+    LIMIT 1
+"""
+ACTIVE_CLUSTERING_VERSION = """
+    SELECT version FROM embedding_clusterings
+    WHERE activated_at IS NOT NULL
+    ORDER BY activated_at DESC
+    LIMIT 1
+"""
+# Segments nested under each video when a search session is grouped by video
+SEGMENTS_PER_VIDEO = int(os.getenv("SEGMENTS_PER_VIDEO", "3"))
+# Largest gap in seconds between two clips that are still merged into one range
+MERGE_MAX_GAP = float(os.getenv("MERGE_MAX_GAP", "0"))
+# Slack for REAL start/end times that should meet exactly
+TIME_TOLERANCE = 1e-3
+# Candidates ranked per stored result when a session is diversified with MMR
+MMR_OVERSAMPLE = int(os.getenv("MMR_OVERSAMPLE", "3"))
+# Videos matched by filename or S3 key that take part in a hybrid search
+HYBRID_LEXICAL_LIMIT = int(os.getenv("HYBRID_LEXICAL_LIMIT", "50"))
+# pg_trgm word similarity a filename or S3 key needs to match a hybrid query
+HYBRID_LEXICAL_THRESHOLD = float(os.getenv("HYBRID_LEXICAL_THRESHOLD", "0.6"))
+# Rank offset k of reciprocal rank fusion, 1 / (k + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Weight of each modality's similarity when visual-text and audio are fused
+MODALITY_WEIGHTS = MappingProxyType(
+    {
+        "visual-text": float(os.getenv("VISUAL_TEXT_WEIGHT", "0.5")),
+        "audio": float(os.getenv("AUDIO_WEIGHT", "0.5")),
+    }
+)
+# PREPARE the hot queries once per connection and EXECUTE them from then on
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "true").lower() == "true"
+# Statements prepared on one connection before they are all deallocated
+PREPARED_STATEMENT_LIMIT = int(os.getenv("PREPARED_STATEMENT_LIMIT", "64"))
+
+EMBEDDING_DIMENSIONS = 1024
+EMBEDDING_STORAGE_TYPES = ["vector", "halfvec"]
+SEARCH_MODES = ["hnsw", "binary", "coarse", "hierarchical", "ivf"]
+GROUP_BY_OPTIONS = ["video"]
+# How a video is scored from the similarities of its top segments
+VIDEO_SCORES = {"max": "MAX", "mean": "AVG"}
+
+ITERATIVE_SCAN_ORDERS = {"strict": "strict_order", "relaxed": "relaxed_order"}
+
+# A psycopg2 placeholder, with the cast that follows it, or an escaped %
+QUERY_PARAMETER = re.compile(r"%(?:\((\w+)\))?s((?:::[\w.]+(?:\[\])?)?)|%%")
+
+# Every (modality, scope) pair has its own partial HNSW index (see schema.sql)
+SEGMENT_MODALITIES = ["visual-text", "audio"]
+SEGMENT_SCOPES = ["clip", "video"]
+PARTITION_INDEXES = {
+    (modality, scope): f"video_segments_{modality.replace('-', '_')}_{scope}_ann_idx"
+    for modality in SEGMENT_MODALITIES
+    for scope in SEGMENT_SCOPES
+}
+# "auto" picks exact or ANN search per query from table statistics
+SEARCH_STRATEGIES = ["auto", "exact", "ann"]
+
+
+class SessionOptions(NamedTuple):
+    """
+    How create_search_session ranks a query's candidates beyond similarity
+    order: grouped by video, diversified by MMR, fused with a lexical match of
+    `query_text`, and scored across modalities
+    """
+
+    group_by: str | None = None
+    segments_per_video: int | None = None
+    video_score: str = "max"
+    diversity: float | None = None
+    query_text: str | None = None
+    fuse_modalities: bool = False
+    modality_weights: dict[str, float] | None = None
+
+
+class SessionSettings(NamedTuple):
+    """Service-wide defaults and sizes of the SessionOptions rankings"""
+
+    segments_per_video: int = SEGMENTS_PER_VIDEO
+    mmr_oversample: int = MMR_OVERSAMPLE
+    hybrid_lexical_limit: int = HYBRID_LEXICAL_LIMIT
+    hybrid_lexical_threshold: float = HYBRID_LEXICAL_THRESHOLD
+    rrf_k: int = RRF_K
+    modality_weights: Mapping[str, float] = MODALITY_WEIGHTS
+
+
+VIDEO_RESULT_COLUMNS = """
+    videos.id AS video_id,
+    videos.s3_bucket,
+    videos.s3_key,
+    videos.filename,
+    videos.duration,
+    videos.created_at,
+    videos.updated_at,
+    videos.height,
+    videos.width
+"""
+
+
+def encode_page_cursor(row: dict[str, Any]) -> str:
+    """Encode the (created_at, id) keyset position of a row as an opaque cursor"""
+    position = {"created_at": row["created_at"].isoformat(), "id": row["id"]}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_page_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor from encode_page_cursor, raising ValueError if malformed"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position["created_at"]), int(position["id"])
+    except (binascii.Error, json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid page cursor: {cursor}") from e
+
+
+@lru_cache(maxsize=256)
+def to_prepared_query(query: str) -> tuple[str, list[tuple[str | int, str]]]:
+    """
+    Rewrite a psycopg2 query for PREPARE: each distinct %(name)s, or each %s in
+    turn, becomes a $n parameter. Returns the rewritten query and, in $n order,
+    every parameter's key and the cast written after it, which EXECUTE repeats
+    so its arguments are typed as they were when the query was sent as text.
+    """
+    parameters: list[tuple[str | int, str]] = []
+    keys: list[str | int] = []
+
+    def replace(match: re.Match) -> str:
+        if match.group(0) == "%%":
+            return "%"
+        name, cast = match.group(1), match.group(2)
+        key = name if name is not None else len(keys)
+        if key not in keys:
+            keys.append(key)
+            parameters.append((key, cast))
+        return f"${keys.index(key) + 1}{cast}"
+
+    return QUERY_PARAMETER.sub(replace, query), parameters
+
+
+def merge_adjacent_results(
+    results: list[dict[str, Any]], max_gap=MERGE_MAX_GAP
+) -> list[dict[str, Any]]:
+    """
+    Merge clip results of the same video and modality whose time windows
+    overlap or are at most `max_gap` seconds apart into one range. A range
+    keeps the fields and rank of its best clip, spans all of its clips, and
+    adds the max and mean similarity and the ids of its clips in time order.
+    Other results pass through with their own id as `segment_ids`.
+    """
+    ranges = []
+    open_ranges = {}
+    ranked = sorted(
+        enumerate(results),
+        key=lambda item: (
+            item[1]["video"]["id"],
+            item[1]["modality"],
+            item[1]["scope"],
+            item[1]["start_time"],
+        ),
+    )
+    for rank, result in ranked:
+        key = (result["video"]["id"], result["modality"])
+        current = open_ranges.get(key) if result["scope"] == "clip" else None
+        if (
+            current is not None
+            and result["start_time"] <= current["end_time"] + max_gap + TIME_TOLERANCE
+        ):
+            current["end_time"] = max(current["end_time"], result["end_time"])
+            current["members"].append((rank, result))
+            continue
+
+        current = {"end_time": result["end_time"], "members": [(rank, result)]}
+        ranges.append(current)
+        if result["scope"] == "clip":
+            open_ranges[key] = current
+
+    merged = []
+    for current in ranges:
+        members = current["members"]
+        rank, best = min(members, key=lambda member: member[0])
+        similarities = [member["similarity"] for _, member in members]
+        merged_result = {
+            **best,
+            "start_time": members[0][1]["start_time"],
+            "end_time": current["end_time"],
+            "similarity": max(similarities),
+            "mean_similarity": sum(similarities) / len(similarities),
+            "segment_ids": [member["id"] for _, member in members],
+        }
+        query_indexes = [
+            member["query_indexes"]
+            for _, member in members
+            if "query_indexes" in member
+        ]
+        if query_indexes:
+            merged_result["query_indexes"] = sorted(set().union(*query_indexes))
+        merged.append((rank, merged_result))
+
+    return [merged_result for _, merged_result in sorted(merged, key=lambda m: m[0])]
+
+
+def mmr_order(
+    similarities: np.ndarray, embeddings: np.ndarray, diversity: float, limit: int
+) -> list[int]:
+    """
+    Greedily pick up to `limit` candidates by Maximal Marginal Relevance and
+    return their indexes in pick order. Each pick maximizes
+    (1 - diversity) * similarity - diversity * (similarity to the closest pick),
+    so `diversity=0` keeps the relevance order. Embeddings are unit length:
+    their pairwise similarities are one matrix product.
+    """
+    count = len(similarities)
+    if count == 0 or limit <= 0:
+        return []
+    pairwise = embeddings @ embeddings.T
+    relevance = (1 - diversity) * similarities
+    available = np.ones(count, dtype=bool)
+    pick = int(np.argmax(similarities))
+    order = [pick]
+    available[pick] = False
+    redundancy = pairwise[pick].copy()
+    while len(order) < min(limit, count):
+        scores = np.where(available, relevance - diversity * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, pairwise[pick], out=redundancy)
+    return order
 
 
 # TODO: Create a new class to handle non-vector db operations, allow for relational + vector DB architecture.
+# The vector side already implements vector_store.VectorStore: upsert_segments,
+# delete_video_segments, find_similar and find_similar_batch.
 class VectorDBService:
     def __init__(
         self,
         db_params,
         page_limit=DEFAULT_PAGE_LIMIT,
         min_similarity=DEFAULT_MIN_SIMILARITY,
+        ef_search_min=HNSW_EF_SEARCH_MIN,
+        ef_search_max=HNSW_EF_SEARCH_MAX,
+        scan_mode=HNSW_ITERATIVE_SCAN,
+        max_scan_tuples=HNSW_MAX_SCAN_TUPLES,
+        exact_search_selectivity=EXACT_SEARCH_SELECTIVITY,
+        exact_search_max_rows=EXACT_SEARCH_MAX_ROWS,
+        table_stats_ttl=TABLE_STATS_TTL,
+        search_session_ttl=SEARCH_SESSION_TTL,
+        search_session_max_candidates=SEARCH_SESSION_MAX_CANDIDATES,
+        embedding_storage=EMBEDDING_STORAGE,
+        search_mode=SEARCH_MODE,
+        binary_oversample=BINARY_OVERSAMPLE,
+        coarse_oversample=COARSE_OVERSAMPLE,
+        hierarchical_videos=HIERARCHICAL_VIDEOS,
+        projection_ttl=PROJECTION_TTL,
+        ivf_nprobe=IVF_NPROBE,
+        clustering_ttl=CLUSTERING_TTL,
+        session_settings=SessionSettings(),
+        prepared_statements=PREPARED_STATEMENTS,
+        prepared_statement_limit=PREPARED_STATEMENT_LIMIT,
         logger=getLogger(),
     ):
+        if embedding_storage not in EMBEDDING_STORAGE_TYPES:
+            raise ValueError(f"Unknown embedding storage: {embedding_storage}")
+
         self.db_params = db_params
         self.default_page_limit = page_limit
         self.default_min_similarity = min_similarity
+        self.ef_search_min = ef_search_min
+        self.ef_search_max = ef_search_max
+        self.default_scan_mode = scan_mode
+        self.max_scan_tuples = max_scan_tuples
+        self.exact_search_selectivity = exact_search_selectivity
+        self.exact_search_max_rows = exact_search_max_rows
+        self.table_stats_ttl = table_stats_ttl
+        self.search_session_ttl = search_session_ttl
+        self.search_session_max_candidates = search_session_max_candidates
+        self.embedding_storage = embedding_storage
+        self.default_search_mode = search_mode
+        self.default_oversample = {
+            "binary": binary_oversample,
+            "coarse": coarse_oversample,
+        }
+        self.hierarchical_videos = hierarchical_videos
+        self.projection_ttl = projection_ttl
+        self.ivf_nprobe = ivf_nprobe
+        self.clustering_ttl = clustering_ttl
+        self.session_settings = session_settings
+        self.prepared_statements = prepared_statements
+        self.prepared_statement_limit = prepared_statement_limit
         self.logger = logger
         self.conn = self.get_connection()
+        # Names of the statements prepared on _prepared_connection
+        self._prepared_connection: connection | None = None
+        self._prepared_statements: set[str] = set()
+        self._table_stats = None
+        self._table_stats_fetched_at = 0.0
+        self._projection = None
+        self._projection_fetched_at = 0.0
+        self._clustering = None
+        self._clustering_fetched_at = 0.0
+        # The plan of the latest search, for callers to report
+        self.last_search_plan: dict[str, Any] | None = None
 
     def get_connection(self, max_retries=3) -> connection:
         attempt = 0
         while True:
             try:
                 self.logger.info("Connecting to database...")
-                return psycopg2.connect(**self.db_params)
+                conn = psycopg2.connect(**self.db_params)
+                register_vector(conn)
+                return conn
             except psycopg2.OperationalError as e:
                 attempt += 1
                 if attempt == max_retries - 1:
@@ -49,55 +421,184 @@ class VectorDBService:
                 )
                 time.sleep(2**attempt)
 
-    def fetch_videos(self, page, limit) -> PaginatedResult:
-        # Assumes page is 0-indexed
+    def reconnect_if_closed(self):
+        """
+        Replace a connection the server or network has closed. Users of `conn`,
+        such as the snapshot search engine, call this before each transaction.
+        """
+        if self.conn.closed:
+            self.logger.warning("Database connection is closed, reconnecting")
+            self.conn = self.get_connection()
+
+    def _execute_prepared(
+        self,
+        cursor: Cursor,
+        query: str,
+        params,
+        plan_settings: dict[str, str] | None = None,
+        transaction_settings: dict[str, str] | None = None,
+    ):
+        """
+        Run `query` as a statement prepared on the cursor's connection. It is
+        PREPAREd the first time its text is seen on that connection and
+        EXECUTEd with `params` from then on, so repeated calls skip parsing and,
+        once Postgres settles on a generic plan, planning. `plan_settings`, the
+        planner settings the query runs under, are part of the statement's
+        identity because a cached plan ignores later changes to them.
+
+        Statements belong to a connection, so after a reconnect they are
+        prepared again on first use. A statement deallocated behind our back,
+        e.g. by a pooler's DISCARD ALL, aborts the transaction: it is rolled
+        back, `transaction_settings` (the settings the transaction had applied)
+        are applied again, and the statement is prepared and run once more.
+        """
+        if not self.prepared_statements:
+            cursor.execute(query, params)
+            return
+
+        prepared_query, parameters = to_prepared_query(query)
+        statement_key = prepared_query + json.dumps(plan_settings or {}, sort_keys=True)
+        name = f"vdb_{hashlib.md5(statement_key.encode()).hexdigest()[:16]}"
+
+        if self._prepared_connection is not cursor.connection:
+            self._prepared_connection = cursor.connection
+            self._prepared_statements = set()
+        if name not in self._prepared_statements:
+            self._prepare(cursor, name, prepared_query)
+
+        arguments = ", ".join(f"%s{cast}" for _, cast in parameters)
+        statement = f"EXECUTE {name}({arguments})" if parameters else f"EXECUTE {name}"
+        values = [params[key] for key, _ in parameters]
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                offset = page * limit
+            cursor.execute(statement, values)
+        except InvalidSqlStatementName:
+            self.logger.warning(f"Prepared statement {name} was deallocated, retrying")
+            cursor.connection.rollback()
+            self._prepared_statements.clear()
+            self._apply_settings(cursor, transaction_settings or {})
+            self._prepare(cursor, name, prepared_query)
+            cursor.execute(statement, values)
 
-                video_query = """
-                    SELECT *,
-                           COUNT(*) OVER() AS total_count
-                    FROM videos
-                    LIMIT %s
-                    OFFSET %s
-                    """
-                cursor.execute(video_query, (limit, offset))
-                rows = cursor.fetchall()
+    def _prepare(self, cursor: Cursor, name: str, prepared_query: str):
+        """PREPARE a statement, first deallocating all once the limit is reached"""
+        if len(self._prepared_statements) >= self.prepared_statement_limit:
+            cursor.execute("DEALLOCATE ALL")
+            self._prepared_statements.clear()
+        cursor.execute(f"PREPARE {name} AS {prepared_query}")
+        self._prepared_statements.add(name)
 
-                total_videos = rows[0]["total_count"] if rows else 0
-
-                videos_data = [
-                    {
-                        "id": video.get("id"),
-                        "filename": video.get("filename"),
-                        "s3_bucket": video.get("s3_bucket"),
-                        "s3_key": video.get("s3_key"),
-                        "duration": video.get("duration"),
-                        "created_at": (
-                            (created_at := video.get("created_at"))
-                            and created_at.isoformat()
-                        ),
-                        "updated_at": (
-                            (updated_at := video.get("updated_at"))
-                            and updated_at.isoformat()
-                        ),
-                        "height": video.get("height"),
-                        "width": video.get("width"),
-                    }
-                    for video in rows
-                ]
+    def fetch_videos(
+        self, page=0, limit=None, cursor=None, exact_total=False
+    ) -> PaginatedResult:
+        limit = limit or self.default_page_limit
+        try:
+            rows, total, next_cursor = self._fetch_keyset_page(
+                "videos",
+                "*",
+                page=page,
+                limit=limit,
+                cursor=cursor,
+                exact_total=exact_total,
+            )
 
-            return PaginatedResult(items=videos_data, total=total_videos)
+            videos_data = [
+                {
+                    "id": video.get("id"),
+                    "filename": video.get("filename"),
+                    "s3_bucket": video.get("s3_bucket"),
+                    "s3_key": video.get("s3_key"),
+                    "duration": video.get("duration"),
+                    "created_at": (
+                        (created_at := video.get("created_at"))
+                        and created_at.isoformat()
+                    ),
+                    "updated_at": (
+                        (updated_at := video.get("updated_at"))
+                        and updated_at.isoformat()
+                    ),
+                    "height": video.get("height"),
+                    "width": video.get("width"),
+                }
+                for video in rows
+            ]
 
+            return PaginatedResult(
+                items=videos_data, total=total, next_cursor=next_cursor
+            )
+
+        except ValueError:
+            raise
         except Exception as e:
             self.logger.error(f"Error searching video in database: {e}")
             raise e
 
+    def _fetch_keyset_page(
+        self, table: str, columns: str, page, limit, cursor=None, exact_total=False
+    ) -> tuple[list[dict[str, Any]], int, str | None]:
+        """
+        Fetch one page of `table`, newest first, ordered on (created_at, id).
+
+        With a cursor the page starts right after the cursor's row, so deep pages
+        cost the same as the first one. Without one, `page` (0-indexed) is used
+        as an offset. The total is the planner's row estimate, raised to the
+        rows the page shows exist, unless `exact_total` is set or the estimate
+        is unusable: -1 or 0 for a table never analyzed, or an empty one.
+        Returns the rows, the total and the cursor of the next page, if any.
+        """
+        conditions = ""
+        query_params: dict[str, Any] = {"limit": limit + 1, "offset": 0}
+        if cursor:
+            created_at, row_id = decode_page_cursor(cursor)
+            conditions = "WHERE (created_at, id) < (%(created_at)s, %(id)s)"
+            query_params.update({"created_at": created_at, "id": row_id})
+        else:
+            query_params["offset"] = page * limit
+
+        self.reconnect_if_closed()
+        with self.conn.cursor(cursor_factory=RealDictCursor) as db_cursor:
+            self._execute_prepared(
+                db_cursor,
+                f"""
+                SELECT {columns}
+                FROM {table}
+                {conditions}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %(limit)s
+                OFFSET %(offset)s
+                """,
+                query_params,
+            )
+            rows = db_cursor.fetchall()
+
+            total = None
+            if not exact_total:
+                self._execute_prepared(
+                    db_cursor,
+                    "SELECT reltuples::bigint AS total FROM pg_class WHERE oid = %s::regclass",
+                    (table,),
+                )
+                estimate = db_cursor.fetchone()
+                if estimate and estimate["total"] > 0:
+                    # A stale estimate can be below the rows already paged past
+                    total = max(estimate["total"], query_params["offset"] + len(rows))
+            if total is None:
+                db_cursor.execute(f"SELECT COUNT(*) AS total FROM {table}")
+                total = db_cursor.fetchone()["total"]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_page_cursor(rows[-1])
+
+        return rows, total, next_cursor
+
     def store(self, video_metadata, video_segments):
         try:
+            projection, clustering = self._lock_segment_models()
             video_id = self._insert_video(video_metadata)
-            self._insert_video_segments(video_id, video_segments)
+            self._insert_video_segments(
+                video_id, video_segments, projection, clustering
+            )
             self.conn.commit()
             self.logger.info(f"Stored video and {len(video_segments)} embeddings.")
 
@@ -105,6 +606,37 @@ class VectorDBService:
             self.logger.error("Error storing embedding:", e)
             self.conn.rollback()
 
+    def _lock_segment_models(
+        self,
+    ) -> tuple[EmbeddingProjection | None, EmbeddingClustering | None]:
+        """
+        Lock video_segments against an activation and return the projection and
+        clustering to store new segments with. The lock is taken before the
+        active versions are checked, so an activation has either committed or
+        waits for this transaction; a cached model it replaced is read again.
+        """
+        for _ in range(2):
+            # A cache refresh commits, so both are read before the lock
+            projection = self.get_active_projection()
+            clustering = self.get_active_clustering()
+            with self.conn.cursor() as cursor:
+                cursor.execute("LOCK TABLE video_segments IN ROW EXCLUSIVE MODE")
+                cursor.execute(
+                    f"""
+                    SELECT ({ACTIVE_PROJECTION_VERSION}), ({ACTIVE_CLUSTERING_VERSION})
+                    """
+                )
+                active_versions = tuple(cursor.fetchone())
+            if active_versions == (
+                projection.version if projection else None,
+                clustering.version if clustering else None,
+            ):
+                return projection, clustering
+            self.conn.rollback()
+            self._projection_fetched_at = 0.0
+            self._clustering_fetched_at = 0.0
+        raise Exception("Embedding projection or clustering changed during ingest")
+
     def _insert_video(self, metadata: dict) -> int:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
@@ -125,7 +657,16 @@ class VectorDBService:
                 raise Exception(f"Error during process of storing video: {metadata}")
             return result["id"]
 
-    def _insert_video_segments(self, video_id: int, segments: list[dict]):
+    def _insert_video_segments(
+        self,
+        video_id: int,
+        segments: list[dict],
+        projection: EmbeddingProjection | None = None,
+        clustering: EmbeddingClustering | None = None,
+    ):
+        # Embeddings are sent as untyped vector literals (see vector_adapter) and
+        # cast to the column type here, so both storage types take the same
+        # parameters
         with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
             data_to_insert = [
                 (
@@ -134,25 +675,73 @@ class VectorDBService:
                     segment["scope"],
                     segment["start_time"],
                     segment["end_time"],
-                    segment["embedding"],
+                    Vector(segment["embedding"]),
+                    (
+                        Vector(projection.project_segment(segment["embedding"]))
+                        if projection
+                        else None
+                    ),
+                    projection.version if projection else None,
+                    clustering.assign(segment["embedding"]) if clustering else None,
+                    clustering.version if clustering else None,
                 )
                 for segment in segments
             ]
 
             cursor.executemany(
-                """
+                f"""
             INSERT INTO video_segments (
                 video_id,
                 modality,
                 scope,
                 start_time,
                 end_time,
-                embedding
-            ) VALUES (%s, %s, %s, %s, %s, %s)
+                embedding,
+                coarse_embedding,
+                projection_version,
+                cluster_id,
+                clustering_version
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s::{self.embedding_storage}, %s::vector, %s,
+                %s, %s
+            )
             """,
                 data_to_insert,
             )
 
+    def upsert_segments(self, video_id: int, segments: list[dict]):
+        """Replace the stored segments of a video, as one transaction"""
+        try:
+            projection, clustering = self._lock_segment_models()
+            with self.conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM video_segments WHERE video_id = %s", (video_id,)
+                )
+            self._insert_video_segments(video_id, segments, projection, clustering)
+            self.conn.commit()
+            self.logger.info(f"Stored {len(segments)} embeddings of video {video_id}")
+
+        except Exception as e:
+            self.logger.error(f"Error replacing segments of video {video_id}: {e}")
+            self.conn.rollback()
+            raise e
+
+    def delete_video_segments(self, video_id: int) -> int:
+        """Remove the segments of a video and return how many there were"""
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM video_segments WHERE video_id = %s", (video_id,)
+                )
+                deleted = cursor.rowcount
+            self.conn.commit()
+            return deleted
+
+        except Exception as e:
+            self.logger.error(f"Error deleting segments of video {video_id}: {e}")
+            self.conn.rollback()
+            raise e
+
     def find_similar(
         self,
         embedding,
@@ -160,154 +749,1485 @@ class VectorDBService:
         page=0,
         limit=None,
         min_similarity=None,
+        scan_mode=None,
+        search_mode=None,
+        oversample=None,
+        nprobe=None,
+        strategy=None,
     ) -> list[dict[str, Any]]:
+        """
+        Return page `page` of the segments nearest `embedding`. `min_similarity`
+        is checked on the nearest `limit * (page + 1)` segments after the LIMIT.
+        A segment meeting it that the LIMIT cut would be less similar than all
+        of them, so a page holds fewer than `limit` results only when fewer
+        segments meet the threshold, and is then the last.
+        """
         limit = limit or self.default_page_limit
         offset = limit * page
         min_similarity = min_similarity or self.default_min_similarity
 
-        query_parts = []
-        query_params = []
+        query_params = {
+            "embedding": embedding,
+            "candidate_limit": limit + offset,
+            "max_distance": self._similarity_to_distance(min_similarity),
+        }
+        plan = self._plan_search(filter, search_mode, strategy)
+        ranked_segments_query = self._ranked_segments_query(
+            filter,
+            query_params,
+            batch=False,
+            search_mode=plan["search_mode"],
+            oversample=oversample,
+            nprobe=nprobe,
+        )
+
+        try:
+            return self._fetch_ranked_page(
+                ranked_segments_query, query_params, limit, offset, plan, scan_mode
+            )
+        except Exception as e:
+            self.logger.error(f"Error searching database: {e}")
+            raise e
+
+    def find_similar_batch(
+        self,
+        embeddings,
+        filter=None,
+        page=0,
+        limit=None,
+        min_similarity=None,
+        scan_mode=None,
+        search_mode=None,
+        oversample=None,
+        nprobe=None,
+        strategy=None,
+    ) -> list[dict[str, Any]]:
+        """
+        Like find_similar for several query vectors at once: each segment is
+        reported once, with its best similarity and the indexes of the query
+        vectors that matched it
+        """
+        limit = limit or self.default_page_limit
+        offset = limit * page
+        min_similarity = min_similarity or self.default_min_similarity
+
+        query_params = {
+            "embeddings": embeddings,
+            "candidate_limit": limit + offset,
+            "max_distance": self._similarity_to_distance(min_similarity),
+        }
+        plan = self._plan_search(filter, search_mode, strategy)
+        ranked_segments_query = self._ranked_segments_query(
+            filter,
+            query_params,
+            batch=True,
+            search_mode=plan["search_mode"],
+            oversample=oversample,
+            nprobe=nprobe,
+        )
+
+        try:
+            return self._fetch_ranked_page(
+                ranked_segments_query, query_params, limit, offset, plan, scan_mode
+            )
+        except Exception as e:
+            self.logger.error(f"Error searching database with batch: {e}")
+            raise e
+
+    def create_search_session(
+        self,
+        embedding=None,
+        embeddings=None,
+        filter=None,
+        min_similarity=None,
+        scan_mode=None,
+        search_mode=None,
+        oversample=None,
+        nprobe=None,
+        strategy=None,
+        options: SessionOptions | None = None,
+        max_candidates=None,
+        ttl=None,
+    ) -> tuple[str, int]:
+        """
+        Rank the top `max_candidates` segments for a query once and store their
+        ids and scores under a new session token that expires after `ttl`
+        seconds. Those below `min_similarity` are left out, so a session holds
+        fewer only when fewer segments meet it (see find_similar). Pass
+        `embedding` for a single query or `embeddings` for a batch. `options`
+        (SessionOptions) chooses how the candidates are ranked; sizes left unset
+        come from `session_settings`.
+
+        With `group_by="video"` the session ranks videos instead: each video is
+        scored by the max or mean (`video_score`) similarity of its best
+        `segments_per_video` segments, which are kept nested under it. Grouping
+        runs in the database over `max_candidates * segments_per_video`
+        candidate segments, so enough distinct videos survive it.
+
+        With a `diversity` between 0 and 1 the session is reordered by MMR
+        (see mmr_order) over `max_candidates * mmr_oversample` candidates. Their
+        stored embeddings come back with the ANN query itself, and the picks are
+        stored by a second statement in the same transaction.
+
+        With `query_text` the search is hybrid: videos whose filename or S3 key
+        match it by trigram word similarity are ranked next to the vector
+        candidates, each represented by its segment nearest to `embedding`, and
+        the two lists are fused by reciprocal rank fusion in the same statement.
+        Lexical hits are gated by the `hybrid_lexical_threshold` setting, not
+        min_similarity (see _hybrid_session_query).
+
+        With `fuse_modalities` visual-text and audio candidates of the same video
+        and overlapping time windows are scored together (see
+        _modality_fusion_query) before any of the rankings above. They are
+        ranked by the fused score, which results other than hybrid ones report
+        as "fused_score"; "similarity" stays the best cosine similarity of
+        either modality.
+
+        `nprobe` sets how many clusters an "ivf" search scans per query vector.
+
+        `strategy` forces an "exact" scan or an "ann" index search instead of
+        the "auto" choice of _plan_search; the plan is left in
+        `last_search_plan`.
+
+        Returns the session token and the number of stored results.
+        """
+        options = options or SessionOptions()
+        settings = self.session_settings
+        group_by = options.group_by
+        diversity = options.diversity
+        query_text = options.query_text
+        max_candidates = max_candidates or self.search_session_max_candidates
+        min_similarity = min_similarity or self.default_min_similarity
+        batch = embeddings is not None
+        if group_by is not None and group_by not in GROUP_BY_OPTIONS:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        if options.video_score not in VIDEO_SCORES:
+            raise ValueError(f"Unsupported video_score: {options.video_score}")
+        if diversity is not None and not 0 <= diversity <= 1:
+            raise ValueError(f"diversity must be between 0 and 1: {diversity}")
+        if diversity is not None and group_by:
+            raise ValueError("diversity cannot be combined with group_by")
+        if query_text and (batch or group_by or diversity is not None):
+            raise ValueError(
+                "query_text needs a single embedding and no group_by or diversity"
+            )
+        segments_per_video = options.segments_per_video or settings.segments_per_video
+        if group_by:
+            candidate_limit = max_candidates * segments_per_video
+        elif diversity is not None:
+            candidate_limit = max_candidates * settings.mmr_oversample
+        else:
+            candidate_limit = max_candidates
+
+        query_params = {
+            "candidate_limit": candidate_limit,
+            "max_distance": self._similarity_to_distance(min_similarity),
+            "ttl": ttl or self.search_session_ttl,
+        }
+        if batch:
+            query_params["embeddings"] = embeddings
+        else:
+            query_params["embedding"] = embedding
+        plan = self._plan_search(filter, search_mode, strategy)
+        ranked_segments_query = self._ranked_segments_query(
+            filter,
+            query_params,
+            batch=batch,
+            search_mode=plan["search_mode"],
+            oversample=oversample,
+            nprobe=nprobe,
+            modality_weights=(
+                {**settings.modality_weights, **(options.modality_weights or {})}
+                if options.fuse_modalities
+                else None
+            ),
+        )
+
+        if group_by:
+            query_params["max_candidates"] = max_candidates
+            query_params["segments_per_video"] = segments_per_video
+            query = self._video_session_query(
+                ranked_segments_query, VIDEO_SCORES[options.video_score]
+            )
+        elif query_text:
+            query_params["query_text"] = query_text
+            query_params["max_candidates"] = max_candidates
+            query_params["lexical_limit"] = settings.hybrid_lexical_limit
+            query_params["rrf_k"] = settings.rrf_k
+            query = self._hybrid_session_query(
+                ranked_segments_query, filter, query_params
+            )
+        elif diversity is not None:
+            query = f"""
+                WITH {ranked_segments_query}
+                SELECT
+                    ranked_segments.segment_id,
+                    -ranked_segments.distance AS similarity,
+                    CASE WHEN %(fused)s THEN -ranked_segments.rank_distance END
+                        AS fused_score,
+                    ranked_segments.query_indexes,
+                    video_segments.embedding
+                FROM ranked_segments
+                INNER JOIN video_segments
+                    ON video_segments.id = ranked_segments.segment_id
+                ORDER BY ranked_segments.rank_distance, ranked_segments.segment_id
+            """
+        else:
+            query = self._segment_session_query(ranked_segments_query)
+        query_params["batch"] = batch
+        query_params["fused"] = options.fuse_modalities
+
+        try:
+            search_settings = self._search_settings(
+                query_params["index_scan_limit"], plan, scan_mode
+            )
+            if query_text:
+                search_settings["pg_trgm.word_similarity_threshold"] = str(
+                    settings.hybrid_lexical_threshold
+                )
+            with self._search_cursor(search_settings) as cursor:
+                cursor.execute(query, query_params)
+                if diversity is None:
+                    session = cursor.fetchone()
+                else:
+                    session = self._store_diversified_session(
+                        cursor,
+                        cursor.fetchall(),
+                        diversity,
+                        max_candidates,
+                        query_params["ttl"],
+                        batch,
+                    )
+
+            if session is None:
+                raise Exception("Search session was not stored")
+            self.logger.info(
+                f"Stored search session {session['session_token']} "
+                f"with {session['total']} results"
+            )
+            return session["session_token"], session["total"]
+
+        except Exception as e:
+            self.logger.error(f"Error creating search session: {e}")
+            raise e
+
+    @staticmethod
+    def _store_diversified_session(
+        cursor, candidates, diversity: float, limit: int, ttl: int, batch: bool
+    ) -> dict[str, Any]:
+        """
+        Store the MMR order of ranked `candidates` as a search session. Their
+        fused score, when modalities were fused, is the relevance MMR weighs.
+        """
+        fused = bool(candidates) and candidates[0]["fused_score"] is not None
+        relevance = "fused_score" if fused else "similarity"
+        if candidates:
+            order = mmr_order(
+                np.array([candidate[relevance] for candidate in candidates]),
+                np.stack([candidate["embedding"] for candidate in candidates]),
+                diversity,
+                limit,
+            )
+            candidates = [candidates[index] for index in order]
+
+        return VectorDBService._insert_search_session(
+            cursor,
+            [candidate["segment_id"] for candidate in candidates],
+            [candidate["similarity"] for candidate in candidates],
+            [candidate["query_indexes"] for candidate in candidates] if batch else None,
+            ttl,
+            [candidate["fused_score"] for candidate in candidates] if fused else None,
+        )
+
+    def store_search_session(
+        self, segment_ids, similarities, query_indexes=None, ttl=None
+    ) -> tuple[str, int]:
+        """
+        Store candidates ranked outside the database, e.g. by the in-process
+        SnapshotSearchEngine, as a search session. Returns the session token and
+        the number of stored candidates.
+        """
+        try:
+            with self._search_cursor({}) as cursor:
+                session = self._insert_search_session(
+                    cursor,
+                    segment_ids,
+                    similarities,
+                    query_indexes,
+                    ttl or self.search_session_ttl,
+                )
+            return session["session_token"], session["total"]
+
+        except Exception as e:
+            self.logger.error(f"Error storing search session: {e}")
+            raise e
+
+    @staticmethod
+    def _insert_search_session(
+        cursor, segment_ids, similarities, query_indexes, ttl: int, fused_scores=None
+    ) -> dict[str, Any]:
+        """Insert one ranked search session, clearing expired ones"""
+        cursor.execute(
+            """
+            WITH expired_sessions AS (
+                DELETE FROM search_sessions WHERE expires_at <= NOW()
+            )
+            INSERT INTO search_sessions (
+                id,
+                segment_ids,
+                similarities,
+                query_indexes,
+                fused_scores,
+                expires_at
+            ) VALUES (
+                gen_random_uuid(),
+                %(segment_ids)s::int[],
+                %(similarities)s::double precision[],
+                %(query_indexes)s::jsonb,
+                %(fused_scores)s::double precision[],
+                NOW() + make_interval(secs => %(ttl)s)
+            )
+            RETURNING id::text AS session_token, cardinality(segment_ids) AS total
+            """,
+            {
+                "segment_ids": list(segment_ids),
+                "similarities": list(similarities),
+                "query_indexes": (
+                    json.dumps(query_indexes) if query_indexes is not None else None
+                ),
+                "fused_scores": (
+                    list(fused_scores) if fused_scores is not None else None
+                ),
+                "ttl": ttl,
+            },
+        )
+        return cursor.fetchone()
+
+    def _hybrid_session_query(
+        self, ranked_segments_query: str, filter, query_params: dict[str, Any]
+    ) -> str:
+        """
+        Build the statement that stores the reciprocal rank fusion of
+        `ranked_segments` and the videos matching `query_text` lexically. A
+        segment's score sums 1 / (rrf_k + rank) over the lists it appears in;
+        the similarity stored with it is still its vector similarity.
+
+        The two lists are gated separately. Vector candidates must be within
+        the min_similarity distance bound. A lexical hit must instead match by
+        word similarity at least the `hybrid_lexical_threshold` setting,
+        applied as pg_trgm.word_similarity_threshold so the trigram indexes
+        serve `<%`.
+        The min_similarity bound does not apply to it: the segment representing
+        a lexically matched video is kept, with its vector similarity, however
+        low that is.
+        """
+        partitions = self._segment_partitions(filter)
+        query_params["lexical_modalities"] = [modality for modality, _ in partitions]
+        query_params["lexical_scopes"] = [scope for _, scope in partitions]
+        video_filter = ""
+        if filter and "video_id" in filter:
+            video_filter = "AND id = ANY(%(video_ids)s)"
+
+        return f"""
+            WITH {ranked_segments_query},
+            expired_sessions AS (
+                DELETE FROM search_sessions WHERE expires_at <= NOW()
+            ),
+            lexical_videos AS (
+                SELECT
+                    id AS video_id,
+                    row_number() OVER (ORDER BY lexical_score DESC, id) AS rank
+                FROM (
+                    SELECT
+                        id,
+                        GREATEST(
+                            word_similarity(%(query_text)s, filename),
+                            word_similarity(%(query_text)s, s3_key)
+                        ) AS lexical_score
+                    FROM videos
+                    WHERE (
+                        %(query_text)s <%% filename OR %(query_text)s <%% s3_key
+                    )
+                    {video_filter}
+                    ORDER BY lexical_score DESC, id
+                    LIMIT %(lexical_limit)s
+                ) lexical_matches
+            ),
+            ranks AS (
+                SELECT
+                    segment_id,
+                    distance,
+                    row_number() OVER (ORDER BY rank_distance, segment_id) AS rank
+                FROM ranked_segments
+                UNION ALL
+                SELECT
+                    best_segment.segment_id,
+                    best_segment.distance,
+                    lexical_videos.rank
+                FROM lexical_videos
+                CROSS JOIN query_embeddings
+                CROSS JOIN LATERAL (
+                    SELECT
+                        id AS segment_id,
+                        embedding <#> query_embeddings.embedding AS distance
+                    FROM video_segments
+                    WHERE video_id = lexical_videos.video_id
+                    AND (modality, scope) IN (
+                        SELECT * FROM unnest(
+                            %(lexical_modalities)s::text[], %(lexical_scopes)s::text[]
+                        )
+                    )
+                    ORDER BY distance
+                    LIMIT 1
+                ) best_segment
+            ),
+            fused_segments AS (
+                SELECT
+                    segment_id,
+                    MIN(distance) AS distance,
+                    SUM(1.0 / (%(rrf_k)s + rank)) AS rrf_score
+                FROM ranks
+                GROUP BY segment_id
+                ORDER BY rrf_score DESC, distance, segment_id
+                LIMIT %(max_candidates)s
+            )
+            INSERT INTO search_sessions (
+                id,
+                segment_ids,
+                similarities,
+                expires_at
+            )
+            SELECT
+                gen_random_uuid(),
+                COALESCE(
+                    array_agg(segment_id ORDER BY rrf_score DESC, distance, segment_id),
+                    '{{}}'
+                ),
+                COALESCE(
+                    array_agg(-distance ORDER BY rrf_score DESC, distance, segment_id),
+                    '{{}}'
+                ),
+                NOW() + make_interval(secs => %(ttl)s)
+            FROM fused_segments
+            RETURNING id::text AS session_token, cardinality(segment_ids) AS total
+        """
+
+    @staticmethod
+    def _segment_session_query(ranked_segments_query: str) -> str:
+        """Build the statement that stores `ranked_segments` as a search session"""
+        # Expired sessions are cleared by the same statement that stores a new one
+        return f"""
+            WITH {ranked_segments_query},
+            expired_sessions AS (
+                DELETE FROM search_sessions WHERE expires_at <= NOW()
+            )
+            INSERT INTO search_sessions (
+                id,
+                segment_ids,
+                similarities,
+                query_indexes,
+                fused_scores,
+                expires_at
+            )
+            SELECT
+                gen_random_uuid(),
+                COALESCE(
+                    array_agg(segment_id ORDER BY rank_distance, video_id),
+                    '{{}}'
+                ),
+                COALESCE(
+                    array_agg(-distance ORDER BY rank_distance, video_id),
+                    '{{}}'
+                ),
+                CASE WHEN %(batch)s THEN
+                    COALESCE(
+                        jsonb_agg(
+                            to_jsonb(query_indexes) ORDER BY rank_distance, video_id
+                        ),
+                        '[]'
+                    )
+                END,
+                CASE WHEN %(fused)s THEN
+                    array_agg(-rank_distance ORDER BY rank_distance, video_id)
+                END,
+                NOW() + make_interval(secs => %(ttl)s)
+            FROM ranked_segments
+            RETURNING id::text AS session_token, cardinality(segment_ids) AS total
+        """
+
+    @staticmethod
+    def _video_session_query(ranked_segments_query: str, video_score: str) -> str:
+        """
+        Build the statement that stores `ranked_segments` grouped by video. The
+        segment arrays hold each video's top segments back to back, in video
+        order; `video_groups` records each video's similarity, fused score and
+        segment count. `video_score` aggregates both over the top segments.
+        """
+        return f"""
+            WITH {ranked_segments_query},
+            expired_sessions AS (
+                DELETE FROM search_sessions WHERE expires_at <= NOW()
+            ),
+            video_ranked_segments AS (
+                SELECT
+                    ranked_segments.*,
+                    row_number() OVER (
+                        PARTITION BY video_id ORDER BY rank_distance, segment_id
+                    ) AS video_rank
+                FROM ranked_segments
+            ),
+            ranked_videos AS (
+                SELECT
+                    video_id,
+                    similarity,
+                    score,
+                    segment_count,
+                    row_number() OVER (ORDER BY score DESC, video_id) AS position
+                FROM (
+                    SELECT
+                        video_id,
+                        {video_score}(-distance) AS similarity,
+                        {video_score}(-rank_distance) AS score,
+                        COUNT(*) AS segment_count
+                    FROM video_ranked_segments
+                    WHERE video_rank <= %(segments_per_video)s
+                    GROUP BY video_id
+                ) scored_videos
+                ORDER BY score DESC, video_id
+                LIMIT %(max_candidates)s
+            ),
+            group_segments AS (
+                SELECT video_ranked_segments.*, ranked_videos.position
+                FROM video_ranked_segments
+                INNER JOIN ranked_videos USING (video_id)
+                WHERE video_rank <= %(segments_per_video)s
+            )
+            INSERT INTO search_sessions (
+                id,
+                segment_ids,
+                similarities,
+                query_indexes,
+                fused_scores,
+                video_groups,
+                expires_at
+            )
+            SELECT
+                gen_random_uuid(),
+                COALESCE(
+                    (
+                        SELECT array_agg(segment_id ORDER BY position, video_rank)
+                        FROM group_segments
+                    ),
+                    '{{}}'
+                ),
+                COALESCE(
+                    (
+                        SELECT array_agg(-distance ORDER BY position, video_rank)
+                        FROM group_segments
+                    ),
+                    '{{}}'
+                ),
+                CASE WHEN %(batch)s THEN
+                    COALESCE(
+                        (
+                            SELECT jsonb_agg(
+                                to_jsonb(query_indexes) ORDER BY position, video_rank
+                            )
+                            FROM group_segments
+                        ),
+                        '[]'
+                    )
+                END,
+                CASE WHEN %(fused)s THEN
+                    (
+                        SELECT array_agg(-rank_distance ORDER BY position, video_rank)
+                        FROM group_segments
+                    )
+                END,
+                COALESCE(
+                    (
+                        SELECT jsonb_agg(
+                            jsonb_build_object(
+                                'video_id', video_id,
+                                'similarity', similarity,
+                                'fused_score', CASE WHEN %(fused)s THEN score END,
+                                'segment_count', segment_count
+                            )
+                            ORDER BY position
+                        )
+                        FROM ranked_videos
+                    ),
+                    '[]'
+                ),
+                NOW() + make_interval(secs => %(ttl)s)
+            RETURNING
+                id::text AS session_token,
+                jsonb_array_length(video_groups) AS total
+        """
+
+    def fetch_search_session_page(
+        self, session_token: str, page=0, limit=None, merge_adjacent=False
+    ) -> PaginatedResult | None:
+        """
+        Serve one page of a stored search session. Only the page's segments are
+        joined to video_segments and videos. Pages of a session grouped by video
+        hold `limit` videos, each with its top segments under "segments".
+        With `merge_adjacent`, adjacent clips on the page are merged into time
+        ranges by merge_adjacent_results, so a page may hold fewer results.
+        Returns None if the session does not exist or has expired.
+        """
+        limit = limit or self.default_page_limit
+        offset = limit * page
+
+        query_params = {
+            "session_token": session_token,
+            "limit": limit,
+            "offset": offset,
+        }
+
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    """
+                    SELECT video_groups IS NOT NULL AS grouped
+                    FROM search_sessions
+                    WHERE id = %(session_token)s AND expires_at > NOW()
+                    """,
+                    query_params,
+                )
+                session = cursor.fetchone()
+                rows = []
+                if session is not None:
+                    cursor.execute(
+                        self._session_page_query(session["grouped"]), query_params
+                    )
+                    rows = cursor.fetchall()
+            self.conn.commit()
 
-        query_parts.append(
+        except Exception as e:
+            self.logger.error(f"Error fetching search session page: {e}")
+            self.conn.rollback()
+            raise e
+
+        if not rows:
+            self.logger.warning(f"Search session {session_token} not found or expired")
+            return None
+
+        results = [row for row in rows if row["segment_id"] is not None]
+        if session["grouped"]:
+            items = self._normalize_video_group_results(results, merge_adjacent)
+        else:
+            items = self._normalize_find_similar_results(results)
+            if merge_adjacent:
+                items = merge_adjacent_results(items)
+        return PaginatedResult(items=items, total=rows[0]["session_total"])
+
+    @staticmethod
+    def _session_page_query(grouped: bool) -> str:
+        """
+        Build the query for one page of a search session. `position` indexes the
+        session's segment arrays; a grouped page first picks its videos from
+        `video_groups` and then the run of positions holding each one's segments.
+        """
+        if grouped:
+            session_total = "jsonb_array_length(search_sessions.video_groups)"
+            page_positions = """
+                SELECT
+                    segment_positions.position,
+                    page_groups.position AS group_position,
+                    page_groups.video_similarity,
+                    page_groups.video_fused_score
+                FROM (
+                    SELECT
+                        position,
+                        (video_group ->> 'similarity')::float AS video_similarity,
+                        (video_group ->> 'fused_score')::float AS video_fused_score,
+                        (video_group ->> 'segment_count')::int AS segment_count,
+                        SUM((video_group ->> 'segment_count')::int) OVER (
+                            ORDER BY position
+                        ) AS segments_through
+                    FROM jsonb_array_elements(search_sessions.video_groups)
+                        WITH ORDINALITY AS g(video_group, position)
+                    ORDER BY position
+                    LIMIT %(limit)s
+                    OFFSET %(offset)s
+                ) page_groups
+                CROSS JOIN LATERAL generate_series(
+                    page_groups.segments_through - page_groups.segment_count + 1,
+                    page_groups.segments_through
+                ) AS segment_positions(position)
             """
-            WITH similarity_calc AS (
+        else:
+            session_total = "cardinality(search_sessions.segment_ids)"
+            page_positions = """
                 SELECT
-                    videos.id AS video_id,
-                    videos.s3_bucket,
-                    videos.s3_key,
-                    videos.filename,
-                    videos.duration,
-                    videos.created_at,
-                    videos.updated_at,
-                    videos.height,
-                    videos.width,
+                    position,
+                    position AS group_position,
+                    NULL AS video_similarity,
+                    NULL AS video_fused_score
+                FROM generate_subscripts(search_sessions.segment_ids, 1) AS position
+                ORDER BY position
+                LIMIT %(limit)s
+                OFFSET %(offset)s
+            """
+
+        return f"""
+            SELECT
+                {session_total} AS session_total,
+                page_segments.*
+            FROM search_sessions
+            LEFT JOIN LATERAL (
+                SELECT
+                    {VIDEO_RESULT_COLUMNS},
                     video_segments.id AS segment_id,
                     video_segments.modality,
                     video_segments.scope,
                     video_segments.start_time,
                     video_segments.end_time,
-                    1 - (video_segments.embedding <=> %s::vector) AS similarity
-                FROM videos
-                INNER JOIN video_segments ON videos.id = video_segments.video_id
-            )
-            SELECT * FROM similarity_calc WHERE similarity > %s
+                    search_sessions.query_indexes -> (candidates.position::int - 1)
+                        AS query_indexes,
+                    search_sessions.similarities[candidates.position] AS similarity,
+                    search_sessions.fused_scores[candidates.position] AS fused_score,
+                    candidates.video_similarity,
+                    candidates.video_fused_score,
+                    candidates.group_position,
+                    candidates.position
+                FROM ({page_positions}) candidates
+                INNER JOIN video_segments
+                    ON video_segments.id = search_sessions.segment_ids[candidates.position]
+                INNER JOIN videos ON videos.id = video_segments.video_id
+            ) page_segments ON true
+            WHERE search_sessions.id = %(session_token)s
+            AND search_sessions.expires_at > NOW()
+            ORDER BY page_segments.position
+        """
+
+    def _ranked_segments_query(
+        self,
+        filter,
+        query_params: dict[str, Any],
+        batch: bool,
+        search_mode=None,
+        oversample=None,
+        nprobe=None,
+        modality_weights=None,
+    ) -> str:
+        """
+        Build the WITH list that defines `ranked_segments`: the nearest segments
+        within the distance bound, with their best distance and, for a batch, the
+        indexes of the query vectors that matched them. With `modality_weights`
+        these are fused across modalities by _modality_fusion_query first.
+        Sessions are ranked by `rank_distance`, which is the fused distance
+        after fusion and `distance` otherwise.
+
+        Each query vector runs an index-ordered top-k through LATERAL; video
+        columns are left to the caller so they are only joined for the rows it
+        keeps. The similarity threshold is checked as a distance bound on the
+        ordered candidates rather than in the scan's WHERE: the scan ends at the
+        LIMIT instead of walking the graph for rows that can never qualify.
+
+        The threshold does not make the scan itself any cheaper, and cannot:
+        HNSW has no distance radius to stop at, ef_search sizes the candidate
+        list rather than bounding distances, and SQL cannot end an index scan at
+        the first row past the bound. A high threshold only drops rows earlier.
+        """
+        search_mode = self._resolve_search_mode(search_mode)
+        coarse = search_mode == "coarse"
+        ivf = search_mode == "ivf"
+        # Sent as vector literals (see vector_adapter)
+        if batch:
+            query_params["embeddings"] = [
+                Vector(embedding) for embedding in query_params["embeddings"]
+            ]
+        else:
+            query_params["embedding"] = Vector(query_params["embedding"])
+        if coarse:
+            self._add_coarse_query_params(query_params, batch)
+        if ivf:
+            self._add_ivf_query_params(query_params, batch, nprobe)
+
+        nearest_segments_query = self._nearest_segments_query(
+            filter, query_params, search_mode, oversample
+        )
+        # Fusion reads the per-modality rows as `channel_segments` and defines
+        # `ranked_segments` over them
+        segments_name = "channel_segments" if modality_weights else "ranked_segments"
+        fusion_query = (
+            f", {self._modality_fusion_query(modality_weights, query_params)}"
+            if modality_weights
+            else ""
+        )
+
+        if not batch:
+            if coarse:
+                extra_column = ", %(coarse_embedding)s::vector AS coarse_embedding"
+            elif ivf:
+                extra_column = ", %(cluster_ids)s::int[] AS cluster_ids"
+            else:
+                extra_column = ""
+            return f"""
+                query_embeddings AS (
+                    SELECT
+                        %(embedding)s::{self.embedding_storage} AS embedding
+                        {extra_column}
+                ),
+                {segments_name} AS MATERIALIZED (
+                    SELECT
+                        candidates.*,
+                        candidates.distance AS rank_distance,
+                        NULL::int[] AS query_indexes
+                    FROM query_embeddings
+                    CROSS JOIN LATERAL ({nearest_segments_query}) candidates
+                    WHERE candidates.distance < %(max_distance)s
+                )
+                {fusion_query}
+            """
+
+        # All query vectors travel as one vector[] parameter, and the hits are
+        # merged per segment, keeping the best distance and every query index
+        # that matched it.
+        if coarse:
+            query_embeddings = f"""
+                SELECT embedding, coarse_embedding, (ordinality - 1)::int AS query_index
+                FROM unnest(
+                    %(embeddings)s::{self.embedding_storage}[],
+                    %(coarse_embeddings)s::vector[]
+                ) WITH ORDINALITY AS q(embedding, coarse_embedding, ordinality)
             """
+        elif ivf:
+            # Each query's cluster list travels as the text of an int[], since
+            # unnest would flatten a two-dimensional array
+            query_embeddings = f"""
+                SELECT
+                    embedding,
+                    cluster_ids::int[] AS cluster_ids,
+                    (ordinality - 1)::int AS query_index
+                FROM unnest(
+                    %(embeddings)s::{self.embedding_storage}[],
+                    %(query_cluster_ids)s::text[]
+                ) WITH ORDINALITY AS q(embedding, cluster_ids, ordinality)
+            """
+        else:
+            query_embeddings = f"""
+                SELECT embedding, (ordinality - 1)::int AS query_index
+                FROM unnest(%(embeddings)s::{self.embedding_storage}[])
+                    WITH ORDINALITY AS q(embedding, ordinality)
+            """
+        return f"""
+            query_embeddings AS ({query_embeddings}),
+            nearest_segments AS MATERIALIZED (
+                SELECT query_embeddings.query_index, candidates.*
+                FROM query_embeddings
+                CROSS JOIN LATERAL ({nearest_segments_query}) candidates
+                WHERE candidates.distance < %(max_distance)s
+            ),
+            {segments_name} AS (
+                SELECT
+                    segment_id,
+                    video_id,
+                    modality,
+                    scope,
+                    start_time,
+                    end_time,
+                    MIN(distance) AS distance,
+                    MIN(distance) AS rank_distance,
+                    array_agg(query_index ORDER BY distance, query_index) AS query_indexes
+                FROM nearest_segments
+                GROUP BY segment_id, video_id, modality, scope, start_time, end_time
+            )
+            {fusion_query}
+        """
+
+    @staticmethod
+    def _modality_fusion_query(
+        modality_weights: dict[str, float], query_params: dict[str, Any]
+    ) -> str:
+        """
+        Build the CTE that fuses `channel_segments` across modalities into
+        `ranked_segments`. Each visual-text segment is scored with the best
+        audio segment of the same video and scope whose time window overlaps
+        it, as the weighted sum of both similarities; a channel without a match
+        adds nothing, so segments matching in both channels rank first. Audio
+        segments with no overlapping visual-text match keep their own row. The
+        fused score is returned as `rank_distance`, its negation, and
+        `distance` stays the best distance of either channel.
+        """
+        if any(weight < 0 for weight in modality_weights.values()):
+            raise ValueError(
+                f"Modality weights must be non-negative: {modality_weights}"
+            )
+        query_params["visual_text_weight"] = modality_weights["visual-text"]
+        query_params["audio_weight"] = modality_weights["audio"]
+        overlaps = """
+            audio.video_id = visual.video_id
+            AND audio.scope = visual.scope
+            AND audio.start_time < visual.end_time
+            AND visual.start_time < audio.end_time
+        """
+        return f"""
+            ranked_segments AS (
+                SELECT
+                    visual.segment_id,
+                    visual.video_id,
+                    visual.modality,
+                    visual.scope,
+                    visual.start_time,
+                    visual.end_time,
+                    LEAST(visual.distance, MIN(audio.distance)) AS distance,
+                    %(visual_text_weight)s * visual.distance
+                        + %(audio_weight)s * COALESCE(MIN(audio.distance), 0)
+                        AS rank_distance,
+                    visual.query_indexes
+                FROM channel_segments visual
+                LEFT JOIN channel_segments audio
+                    ON audio.modality = 'audio' AND {overlaps}
+                WHERE visual.modality = 'visual-text'
+                GROUP BY
+                    visual.segment_id,
+                    visual.video_id,
+                    visual.modality,
+                    visual.scope,
+                    visual.start_time,
+                    visual.end_time,
+                    visual.distance,
+                    visual.query_indexes
+                UNION ALL
+                SELECT
+                    audio.segment_id,
+                    audio.video_id,
+                    audio.modality,
+                    audio.scope,
+                    audio.start_time,
+                    audio.end_time,
+                    audio.distance,
+                    %(audio_weight)s * audio.distance AS rank_distance,
+                    audio.query_indexes
+                FROM channel_segments audio
+                WHERE audio.modality = 'audio'
+                AND NOT EXISTS (
+                    SELECT 1 FROM channel_segments visual
+                    WHERE visual.modality = 'visual-text' AND {overlaps}
+                )
+            )
+        """
+
+    def _fetch_ranked_page(
+        self,
+        ranked_segments_query: str,
+        query_params: dict[str, Any],
+        limit: int,
+        offset: int,
+        plan: dict[str, Any],
+        scan_mode,
+    ) -> list[dict[str, Any]]:
+        """Join video columns onto one page of `ranked_segments` and normalize it"""
+        query = f"""
+            WITH {ranked_segments_query}
+            SELECT
+                {VIDEO_RESULT_COLUMNS},
+                ranked_segments.segment_id,
+                ranked_segments.modality,
+                ranked_segments.scope,
+                ranked_segments.start_time,
+                ranked_segments.end_time,
+                ranked_segments.query_indexes,
+                -ranked_segments.distance AS similarity
+            FROM ranked_segments
+            INNER JOIN videos ON videos.id = ranked_segments.video_id
+            ORDER BY ranked_segments.distance ASC, videos.id ASC
+            LIMIT %(limit)s
+            OFFSET %(offset)s
+        """
+        query_params = {**query_params, "limit": limit, "offset": offset}
+
+        settings = self._search_settings(
+            query_params["index_scan_limit"], plan, scan_mode
         )
-        query_params.extend([embedding, min_similarity])
+        # ef_search and the iterative scan are read when the scan starts, not
+        # when it is planned
+        plan_settings = {
+            name: value
+            for name, value in settings.items()
+            if not name.startswith("hnsw.")
+        }
+        with self._search_cursor(settings) as cursor:
+            self._execute_prepared(
+                cursor, query, query_params, plan_settings, settings
+            )
+            results = cursor.fetchall()
 
-        if filter and "scope" in filter:
-            query_parts.append("AND scope = %s")
-            query_params.append(filter["scope"])
-        if filter and "modality" in filter:
-            placeholders = ",".join(["%s"] * len(filter["modality"]))
-            query_parts.append(f"AND modality IN ({placeholders})")
-            query_params.extend(filter["modality"])
+        return self._normalize_find_similar_results(results)
 
-        query_parts.append("ORDER BY similarity DESC, video_id ASC LIMIT %s OFFSET %s")
-        query_params.extend([limit, offset])
+    def _nearest_segments_query(
+        self, filter, query_params: dict[str, Any], search_mode=None, oversample=None
+    ) -> str:
+        """
+        Build the top-k subquery run for each row of `query_embeddings`: one
+        index-ordered scan per (modality, scope) partition the filter allows,
+        merged by distance. Each branch repeats its partial index predicate
+        exactly so the planner can pick that partition's HNSW index.
 
-        try:
-            query = "\n".join(query_parts)
+        In "binary" and "coarse" mode each branch first takes `oversample` times
+        the candidates from the partition's binary-quantized index by Hamming
+        distance, or from its PCA-projected index by projected inner product,
+        then reranks them by exact distance against the stored embeddings.
 
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, query_params)
-                results = cursor.fetchall()
+        In "hierarchical" mode a clip branch first takes the
+        `hierarchical_videos` nearest videos from the video-scope index of its
+        modality, then scans the clips of each of them through the video_id
+        index: one small ANN traversal plus bounded per-video scans instead of
+        a traversal of the whole clip graph. Video-scope branches run as "hnsw".
 
-            return self._normalize_find_similar_results(results)
+        In "ivf" mode each branch compares only the rows assigned by the active
+        clustering to one of the query's `cluster_ids`, read through the
+        (clustering_version, cluster_id) index; _search_settings keeps the
+        planner off the HNSW indexes for it.
 
-        except Exception as e:
-            self.logger.error(f"Error searching database: {e}")
-            raise e
+        The partition predicates are written as literals rather than parameters:
+        a generic plan of the prepared statement could not match a partial index
+        against a parameter. Adds the filter and scan size values to
+        `query_params`.
+        """
+        search_mode = search_mode or self.default_search_mode
+        if search_mode in ("hnsw", "ivf"):
+            query_params["index_scan_limit"] = query_params["candidate_limit"]
+        elif search_mode == "hierarchical":
+            query_params["hierarchical_videos"] = self.hierarchical_videos
+            query_params["index_scan_limit"] = max(
+                query_params["candidate_limit"], self.hierarchical_videos
+            )
+        else:
+            oversample = oversample or self.default_oversample[search_mode]
+            query_params["index_scan_limit"] = (
+                query_params["candidate_limit"] * oversample
+            )
 
-    def find_similar_batch(
-        self, embeddings, filter=None, page=0, limit=None, min_similarity=None
-    ) -> list[dict[str, Any]]:
-        limit = limit or self.default_page_limit
-        offset = limit * page
-        min_similarity = min_similarity or self.default_min_similarity
+        post_filter = self._post_filter_conditions(filter, query_params)
+        if search_mode == "binary":
+            candidate_order = f"""
+                binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS})
+                    <~> binary_quantize(query_embeddings.embedding)
+            """
+        elif search_mode == "coarse":
+            # Rows projected by an older version are not comparable
+            post_filter += f" AND projection_version = ({ACTIVE_PROJECTION_VERSION})"
+            candidate_order = "coarse_embedding <#> query_embeddings.coarse_embedding"
+        elif search_mode == "ivf":
+            post_filter += f"""
+                AND clustering_version = ({ACTIVE_CLUSTERING_VERSION})
+                AND cluster_id = ANY(query_embeddings.cluster_ids)
+            """
 
-        try:
-            query_params = []
-
-            filter_conditions = []
-            filter_params = []
-            if filter:
-                if "scope" in filter:
-                    filter_conditions.append("AND scope = %s")
-                    filter_params.append(filter["scope"])
-                if "modality" in filter:
-                    placeholders = ",".join(["%s"] * len(filter["modality"]))
-                    filter_conditions.append(f"AND modality IN ({placeholders})")
-                    filter_params.extend(filter["modality"])
-
-            filter_clause = " ".join(filter_conditions)
-
-            # Build CTEs first
-            cte_parts = []
-            select_parts = []
-
-            for i, embedding in enumerate(embeddings):
-                cte_parts.append(
-                    f"""
-                    similarity_calc_{i} AS (
+        branches = []
+        for modality, scope in self._segment_partitions(filter):
+            if (modality, scope) not in PARTITION_INDEXES:
+                raise ValueError(f"Unsupported modality and scope: {modality}, {scope}")
+            partition_filter = f"""
+                WHERE modality = '{modality}' AND scope = '{scope}'
+                {post_filter}
+            """
+            if search_mode == "hierarchical" and scope == "clip":
+                branches.append(
+                    f"""(
+                        SELECT video_clips.*
+                        FROM (
+                            SELECT video_id
+                            FROM video_segments
+                            WHERE modality = '{modality}' AND scope = 'video'
+                            {post_filter}
+                            ORDER BY embedding <#> query_embeddings.embedding
+                            LIMIT %(hierarchical_videos)s
+                        ) nearest_videos
+                        CROSS JOIN LATERAL (
+                            SELECT
+                                id AS segment_id,
+                                video_id,
+                                modality,
+                                scope,
+                                start_time,
+                                end_time,
+                                embedding <#> query_embeddings.embedding AS distance
+                            FROM video_segments
+                            WHERE video_id = nearest_videos.video_id
+                            AND modality = '{modality}'
+                            AND scope = '{scope}'
+                            ORDER BY distance
+                            LIMIT %(candidate_limit)s
+                        ) video_clips
+                        ORDER BY distance
+                        LIMIT %(candidate_limit)s
+                    )"""
+                )
+            elif search_mode in ("hnsw", "hierarchical", "ivf"):
+                branches.append(
+                    f"""(
+                        SELECT
+                            id AS segment_id,
+                            video_id,
+                            modality,
+                            scope,
+                            start_time,
+                            end_time,
+                            embedding <#> query_embeddings.embedding AS distance
+                        FROM video_segments
+                        {partition_filter}
+                        ORDER BY distance
+                        LIMIT %(candidate_limit)s
+                    )"""
+                )
+            else:
+                branches.append(
+                    f"""(
                         SELECT
-                            videos.id AS video_id,
-                            videos.s3_bucket,
-                            videos.s3_key,
-                            videos.filename,
-                            videos.duration,
-                            videos.created_at,
-                            videos.updated_at,
-                            videos.height,
-                            videos.width,
-                            video_segments.id AS segment_id,
-                            video_segments.modality,
-                            video_segments.scope,
-                            video_segments.start_time,
-                            video_segments.end_time,
-                            1 - (video_segments.embedding <=> %s::vector) AS similarity,
-                            {i} AS query_index
-                        FROM videos
-                        INNER JOIN video_segments ON videos.id = video_segments.video_id
+                            segment_id,
+                            video_id,
+                            modality,
+                            scope,
+                            start_time,
+                            end_time,
+                            embedding <#> query_embeddings.embedding AS distance
+                        FROM (
+                            SELECT
+                                id AS segment_id,
+                                video_id,
+                                modality,
+                                scope,
+                                start_time,
+                                end_time,
+                                embedding
+                            FROM video_segments
+                            {partition_filter}
+                            ORDER BY {candidate_order}
+                            LIMIT %(index_scan_limit)s
+                        ) index_candidates
+                        ORDER BY distance
+                        LIMIT %(candidate_limit)s
                     )"""
                 )
 
-                select_parts.append(
-                    f"""
-                    SELECT * FROM similarity_calc_{i} 
-                    WHERE similarity > %s {filter_clause}
-                """
+        return f"""
+            SELECT * FROM ({" UNION ALL ".join(branches)}) partition_candidates
+            ORDER BY distance
+            LIMIT %(candidate_limit)s
+        """
+
+    def _resolve_search_mode(self, search_mode) -> str:
+        """
+        Validate a search mode, falling back from "coarse" or "ivf" to "hnsw"
+        while no embedding projection or clustering has been activated
+        """
+        search_mode = search_mode or self.default_search_mode
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search_mode: {search_mode}")
+        if search_mode == "coarse" and self.get_active_projection() is None:
+            self.logger.warning("No active embedding projection, using hnsw search")
+            return "hnsw"
+        if search_mode == "ivf" and self.get_active_clustering() is None:
+            self.logger.warning("No active embedding clustering, using hnsw search")
+            return "hnsw"
+        return search_mode
+
+    def _add_coarse_query_params(self, query_params: dict[str, Any], batch: bool):
+        """Project the query embedding(s) with the active projection"""
+        projection = self.get_active_projection()
+        if batch:
+            query_params["coarse_embeddings"] = [
+                Vector(projection.project_query(embedding))
+                for embedding in query_params["embeddings"]
+            ]
+        else:
+            query_params["coarse_embedding"] = Vector(
+                projection.project_query(query_params["embedding"])
+            )
+
+    def _add_ivf_query_params(
+        self, query_params: dict[str, Any], batch: bool, nprobe=None
+    ):
+        """Pick the clusters of the active clustering to scan per query vector"""
+        clustering = self.get_active_clustering()
+        nprobe = nprobe or self.ivf_nprobe
+        if batch:
+            query_params["query_cluster_ids"] = [
+                "{" + ",".join(map(str, clustering.nearest(embedding, nprobe))) + "}"
+                for embedding in query_params["embeddings"]
+            ]
+        else:
+            query_params["cluster_ids"] = clustering.nearest(
+                query_params["embedding"], nprobe
+            )
+
+    @staticmethod
+    def _segment_partitions(filter) -> list[tuple[str, str]]:
+        """List the (modality, scope) partitions a search filter covers"""
+        filter = filter or {}
+        modalities = filter.get("modality", SEGMENT_MODALITIES)
+        scopes = filter.get("scope", SEGMENT_SCOPES)
+        modalities = modalities if isinstance(modalities, list) else [modalities]
+        scopes = scopes if isinstance(scopes, list) else [scopes]
+        return [(modality, scope) for modality in modalities for scope in scopes]
+
+    @staticmethod
+    def _post_filter_conditions(filter, query_params: dict[str, Any]) -> str:
+        """
+        Build the filter conditions the partition indexes cannot answer. They are
+        checked against each candidate the index scan yields.
+        """
+        if not filter or "video_id" not in filter:
+            return ""
+
+        video_ids = filter["video_id"]
+        query_params["video_ids"] = (
+            video_ids if isinstance(video_ids, list) else [video_ids]
+        )
+        return "AND video_id = ANY(%(video_ids)s)"
+
+    @contextmanager
+    def _search_cursor(self, settings: dict[str, str]):
+        """Yield a cursor in its own transaction, with `settings` applied to it only"""
+        self.reconnect_if_closed()
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                self._apply_settings(cursor, settings)
+                yield cursor
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _apply_settings(self, cursor: Cursor, settings: dict[str, str]):
+        """Set `settings` for the rest of the cursor's transaction, in one round trip"""
+        if not settings:
+            return
+        cursor.execute(
+            "SELECT " + ", ".join(["set_config(%s, %s, true)"] * len(settings)),
+            [value for setting in settings.items() for value in setting],
+        )
+
+    def _plan_search(self, filter, search_mode=None, strategy=None) -> dict[str, Any]:
+        """
+        Choose between an exact scan and an ANN index search for one query and
+        record the choice in `last_search_plan`.
+
+        "auto" answers exactly when the filter keeps only a sliver of each
+        partition, or when the rows left to compare are few enough that a scan
+        is cheap anyway: a small library, or a narrow video_id filter. Both are
+        estimated from the cached table statistics. An exact plan always runs
+        in "hnsw" mode, whose distance ordering the scan then computes exactly.
+        """
+        strategy = strategy or "auto"
+        if strategy not in SEARCH_STRATEGIES:
+            raise ValueError(f"Unsupported search strategy: {strategy}")
+        selectivity = self._estimate_post_filter_selectivity(filter)
+        estimated_rows = selectivity * sum(
+            self._estimate_partition_rows(modality, scope)
+            for modality, scope in self._segment_partitions(filter)
+        )
+
+        if strategy == "auto":
+            exact = (
+                selectivity < self.exact_search_selectivity
+                or estimated_rows <= self.exact_search_max_rows
+            )
+            strategy = "exact" if exact else "ann"
+        if strategy == "exact":
+            search_mode = "hnsw"
+
+        self.last_search_plan = {
+            "strategy": strategy,
+            "search_mode": self._resolve_search_mode(search_mode),
+            "estimated_rows": int(estimated_rows),
+            "selectivity": selectivity,
+        }
+        self.logger.debug(f"Search plan: {self.last_search_plan}")
+        return self.last_search_plan
+
+    def _search_settings(
+        self, candidate_count: int, plan: dict[str, Any], scan_mode=None
+    ) -> dict[str, str]:
+        """
+        Apply a search plan as planner and pgvector settings.
+
+        An exact plan, and an "ivf" one, scans without the HNSW indexes; "ivf"
+        still reads the probed clusters through a bitmap scan of their index.
+        Otherwise ef_search is sized so the scan can still yield
+        `candidate_count` rows after the filter; with an iterative scan mode
+        the index keeps scanning, up to `max_scan_tuples`, instead.
+        """
+        scan_mode = scan_mode or self.default_scan_mode
+        selectivity = plan["selectivity"]
+
+        if plan["strategy"] == "exact" or plan["search_mode"] == "ivf":
+            return {"enable_indexscan": "off"}
+
+        if scan_mode:
+            if scan_mode not in ITERATIVE_SCAN_ORDERS:
+                raise ValueError(f"Unsupported scan_mode: {scan_mode}")
+            return {
+                "hnsw.ef_search": str(self._ef_search_for(candidate_count)),
+                "hnsw.iterative_scan": ITERATIVE_SCAN_ORDERS[scan_mode],
+                "hnsw.max_scan_tuples": str(self.max_scan_tuples),
+            }
+
+        # No row passes an empty video_id filter, so the smallest scan will do
+        if selectivity <= 0:
+            return {"hnsw.ef_search": str(self.ef_search_min)}
+        ef_search = self._ef_search_for(math.ceil(candidate_count / selectivity))
+        return {"hnsw.ef_search": str(ef_search)}
+
+    def _ef_search_for(self, candidate_count: int) -> int:
+        """Clamp the ef_search needed for `candidate_count` rows to the configured bounds"""
+        return max(self.ef_search_min, min(candidate_count, self.ef_search_max))
+
+    def _estimate_post_filter_selectivity(self, filter) -> float:
+        """
+        Estimate the fraction of a partition's rows that pass the filter.
+        modality and scope are answered by the partial indexes themselves.
+        """
+        if not filter or "video_id" not in filter:
+            return 1.0
+
+        video_count = self.get_table_stats().get("videos", 0)
+        if video_count <= 0:
+            return 1.0
+
+        video_ids = filter["video_id"]
+        video_ids = video_ids if isinstance(video_ids, list) else [video_ids]
+        return min(1.0, len(video_ids) / video_count)
+
+    def _estimate_partition_rows(self, modality: str, scope: str) -> float:
+        """
+        Estimate the segments in one (modality, scope) partition from its
+        partial index, falling back to an even share of video_segments
+        """
+        table_stats = self.get_table_stats()
+        rows = table_stats.get(PARTITION_INDEXES[(modality, scope)], -1)
+        if rows >= 0:
+            return rows
+        segment_count = max(table_stats.get("video_segments", 0), 0)
+        return segment_count / len(PARTITION_INDEXES)
+
+    def get_table_stats(self) -> dict[str, float]:
+        """
+        Return estimated row counts for videos, video_segments and each
+        partition's partial index, read from pg_class and cached for
+        `table_stats_ttl` seconds. A count of -1 means never analyzed.
+        """
+        now = time.monotonic()
+        if (
+            self._table_stats is not None
+            and now - self._table_stats_fetched_at < self.table_stats_ttl
+        ):
+            return self._table_stats
+
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    """
+                    SELECT relname, reltuples
+                    FROM pg_class
+                    WHERE oid IN ('videos'::regclass, 'video_segments'::regclass)
+                    OR relname = ANY(%s)
+                    """,
+                    (list(PARTITION_INDEXES.values()),),
                 )
+                rows = cursor.fetchall()
+            self.conn.commit()
+        except Exception as e:
+            self.logger.warning(f"Failed to read table statistics: {e}")
+            self.conn.rollback()
+            return self._table_stats or {}
 
-                query_params.append(embedding)
-
-            for _ in embeddings:
-                query_params.extend([min_similarity] + filter_params)
-
-            full_query = f"""
-                WITH {", ".join(cte_parts)}
-                SELECT * FROM (
-                    {" UNION ALL ".join(select_parts)}
-                ) combined_results
-                ORDER BY
-                    similarity DESC,
-                    video_id ASC
-                LIMIT %s
-                OFFSET %s;
-            """
-            query_params.extend([limit, offset])
+        self._table_stats = {row["relname"]: row["reltuples"] for row in rows}
+        self._table_stats_fetched_at = now
+        return self._table_stats
 
+    def get_active_projection(self) -> EmbeddingProjection | None:
+        """
+        Return the most recently activated embedding projection, or None if no
+        projection has been activated yet. Cached for `projection_ttl` seconds.
+        """
+        now = time.monotonic()
+        if now - self._projection_fetched_at < self.projection_ttl:
+            return self._projection
+
+        try:
             with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(full_query, query_params)
-                results = cursor.fetchall()
+                cursor.execute(
+                    """
+                    SELECT version, mean, components
+                    FROM embedding_projections
+                    WHERE activated_at IS NOT NULL
+                    ORDER BY activated_at DESC
+                    LIMIT 1
+                    """
+                )
+                row = cursor.fetchone()
+            self.conn.commit()
+        except Exception as e:
+            self.logger.warning(f"Failed to read embedding projection: {e}")
+            self.conn.rollback()
+            return self._projection
+
+        self._projection = (
+            EmbeddingProjection(
+                version=row["version"],
+                mean=np.asarray(row["mean"]),
+                components=np.asarray(row["components"]),
+            )
+            if row
+            else None
+        )
+        self._projection_fetched_at = now
+        return self._projection
 
-            return self._normalize_find_similar_results(results)
+    def get_active_clustering(self) -> EmbeddingClustering | None:
+        """
+        Return the most recently activated embedding clustering, or None if no
+        clustering has been activated yet. Cached for `clustering_ttl` seconds.
+        """
+        now = time.monotonic()
+        if now - self._clustering_fetched_at < self.clustering_ttl:
+            return self._clustering
 
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    """
+                    SELECT version, centroids
+                    FROM embedding_clusterings
+                    WHERE activated_at IS NOT NULL
+                    ORDER BY activated_at DESC
+                    LIMIT 1
+                    """
+                )
+                row = cursor.fetchone()
+            self.conn.commit()
         except Exception as e:
-            self.logger.error(f"Error searching database with batch: {e}")
-            raise e
+            self.logger.warning(f"Failed to read embedding clustering: {e}")
+            self.conn.rollback()
+            return self._clustering
+
+        self._clustering = (
+            EmbeddingClustering(
+                version=row["version"], centroids=np.asarray(row["centroids"])
+            )
+            if row
+            else None
+        )
+        self._clustering_fetched_at = now
+        return self._clustering
 
-    def _normalize_find_similar_results(self, raw_results):
+    @staticmethod
+    def _similarity_to_distance(min_similarity) -> float:
+        """
+        Convert a similarity threshold to the matching `<#>` distance bound.
+        Embeddings are stored and queried at unit length, so the negative inner
+        product `<#>` returns is exactly minus their cosine similarity.
+        """
+        return -float(min_similarity)
+
+    @staticmethod
+    def _normalize_find_similar_results(raw_results):
         return [
             {
                 "id": raw_result["segment_id"],
@@ -316,6 +2236,16 @@ class VectorDBService:
                 "start_time": raw_result["start_time"],
                 "end_time": raw_result["end_time"],
                 "similarity": raw_result["similarity"],
+                **(
+                    {"fused_score": raw_result["fused_score"]}
+                    if raw_result.get("fused_score") is not None
+                    else {}
+                ),
+                **(
+                    {"query_indexes": raw_result["query_indexes"]}
+                    if raw_result.get("query_indexes") is not None
+                    else {}
+                ),
                 "video": {
                     "id": raw_result["video_id"],
                     "s3_bucket": raw_result["s3_bucket"],
@@ -331,6 +2261,33 @@ class VectorDBService:
             for raw_result in raw_results
         ]
 
+    def _normalize_video_group_results(self, raw_results, merge_adjacent=False):
+        """Nest page rows of a grouped session under one result per video"""
+        video_groups = []
+        for _, group_rows in groupby(
+            raw_results, key=lambda raw_result: raw_result["group_position"]
+        ):
+            group_rows = list(group_rows)
+            segments = self._normalize_find_similar_results(group_rows)
+            if merge_adjacent:
+                segments = merge_adjacent_results(segments)
+            video_groups.append(
+                {
+                    "video": segments[0]["video"],
+                    "similarity": group_rows[0]["video_similarity"],
+                    **(
+                        {"fused_score": group_rows[0]["video_fused_score"]}
+                        if group_rows[0].get("video_fused_score") is not None
+                        else {}
+                    ),
+                    "segments": [
+                        {key: value for key, value in segment.items() if key != "video"}
+                        for segment in segments
+                    ],
+                }
+            )
+        return video_groups
+
     def store_task(self, task_data):
         with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
             try:
@@ -356,9 +2313,11 @@ class VectorDBService:
                 self.conn.rollback()
 
     def update_task_status(self, sqs_message_id, new_status):
+        self.reconnect_if_closed()
         with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
             try:
-                cursor.execute(
+                self._execute_prepared(
+                    cursor,
                     """
                     UPDATE tasks SET status = %s
                     WHERE sqs_message_id = %s
@@ -374,23 +2333,19 @@ class VectorDBService:
                 self.logger.exception(f"Error updating task: {e}")
                 self.conn.rollback()
 
-    def fetch_tasks(self, page, limit) -> PaginatedResult:
+    def fetch_tasks(
+        self, page=0, limit=None, cursor=None, exact_total=False
+    ) -> PaginatedResult:
+        limit = limit or self.default_page_limit
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                offset = page * limit
-
-                # Query to get tasks with pagination and total count
-                tasks_query = """
-                    SELECT id, sqs_message_id, s3_bucket, s3_key, created_at, updated_at, status,
-                           COUNT(*) OVER() AS total_count
-                    FROM tasks
-                    ORDER BY created_at DESC
-                    LIMIT %s OFFSET %s
-                """
-                cursor.execute(tasks_query, (limit, offset))
-                raw_results = cursor.fetchall()
-
-                total_tasks = raw_results[0]["total_count"] if raw_results else 0
+            raw_results, total_tasks, next_cursor = self._fetch_keyset_page(
+                "tasks",
+                "id, sqs_message_id, s3_bucket, s3_key, created_at, updated_at, status",
+                page=page,
+                limit=limit,
+                cursor=cursor,
+                exact_total=exact_total,
+            )
 
             tasks_data = [
                 {
@@ -410,8 +2365,12 @@ class VectorDBService:
                 }
                 for task in raw_results
             ]
-            return PaginatedResult(items=tasks_data, total=total_tasks)
+            return PaginatedResult(
+                items=tasks_data, total=total_tasks, next_cursor=next_cursor
+            )
 
+        except ValueError:
+            raise
         except Exception as e:
             self.logger.error(f"Error fetching tasks from database: {e}")
             raise
@@ -422,8 +2381,9 @@ class VectorDBService:
             WHERE s3_bucket = %s AND s3_key = %s
         """
         try:
+            self.reconnect_if_closed()
             with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, (bucket, key))
+                self._execute_prepared(cursor, query, (bucket, key))
                 results = cursor.fetchall()
 
                 if results:
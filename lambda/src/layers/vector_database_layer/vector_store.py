@@ -0,0 +1,443 @@
+import numpy as np
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Any, Protocol, runtime_checkable
+from vector_db_service import (
+    DEFAULT_MIN_SIMILARITY,
+    DEFAULT_PAGE_LIMIT,
+    VectorDBService,
+)
+
+STORE_DTYPES = ["float32", "float16"]
+# Rows per matrix product; bounds float16 conversions and memmap page-ins
+SCORE_CHUNK = 65536
+# Share of tombstoned in-memory rows at which they are compacted away
+COMPACT_DEAD_FRACTION = 0.2
+
+
+def minibatch_kmeans(
+    sample: np.ndarray, clusters: int, iterations=100, batch_size=1024, seed=0
+) -> np.ndarray:
+    """
+    Spherical mini-batch k-means: each step assigns a random batch to its
+    nearest centroids by inner product and moves every centroid towards its
+    members with a per-centroid learning rate of 1 / (points seen), then
+    renormalizes it. Returns unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    counts = np.zeros(clusters)
+    for _ in range(iterations):
+        batch = sample[rng.choice(len(sample), min(batch_size, len(sample)))]
+        assignment = np.argmax(batch @ centroids.T, axis=1)
+        for cluster in np.unique(assignment):
+            members = batch[assignment == cluster]
+            counts[cluster] += len(members)
+            rate = len(members) / counts[cluster]
+            centroids[cluster] += rate * (members.mean(axis=0) - centroids[cluster])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    return centroids
+
+
+@runtime_checkable
+class VectorStore(Protocol):
+    """
+    Segment embeddings and the top-k searches over them. VectorDBService is
+    the pgvector implementation and NumpyVectorStore the in-process one; both
+    return find_similar results in the same shape.
+    """
+
+    def upsert_segments(self, video_id: int, segments: list[dict[str, Any]]):
+        """Replace the stored segments of a video"""
+        ...
+
+    def delete_video_segments(self, video_id: int) -> int:
+        """Remove the segments of a video and return how many there were"""
+        ...
+
+    def find_similar(
+        self, embedding, filter=None, page=0, limit=None, min_similarity=None
+    ) -> list[dict[str, Any]]: ...
+
+    def find_similar_batch(
+        self, embeddings, filter=None, page=0, limit=None, min_similarity=None
+    ) -> list[dict[str, Any]]: ...
+
+
+class NumpyVectorStore:
+    """
+    In-process VectorStore over unit-length embeddings held in a few
+    contiguous blocks. Searches are exact: a handful of matrix products plus
+    an argpartition. After build_ivf() they only score the `nprobe` inverted
+    lists nearest each query.
+
+    Deleting a video tombstones its rows; once enough in-memory rows are dead
+    they are compacted away. Blocks that are np.memmap views of an
+    embedding_snapshot are never copied into memory.
+    """
+
+    def __init__(
+        self,
+        page_limit=DEFAULT_PAGE_LIMIT,
+        min_similarity=DEFAULT_MIN_SIMILARITY,
+        dtype="float32",
+        nprobe=8,
+        logger=getLogger(),
+    ):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported store dtype: {dtype}")
+        self.default_page_limit = page_limit
+        self.default_min_similarity = min_similarity
+        self.dtype = np.dtype(dtype)
+        self.nprobe = nprobe
+        self.logger = logger
+
+        self.embedding_blocks: list[np.ndarray] = []
+        self.segment_ids = np.empty(0, dtype=np.int64)
+        self.video_ids = np.empty(0, dtype=np.int64)
+        self.partitions = np.empty(0, dtype=np.int8)
+        self.start_times = np.empty(0, dtype=np.float32)
+        self.end_times = np.empty(0, dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self.partition_keys: list[tuple[str, str]] = []
+        self.videos: dict[int, dict[str, Any]] = {}
+        # IVF centroids and the inverted list of every row, once built
+        self.centroids: np.ndarray | None = None
+        self.list_ids = np.empty(0, dtype=np.int32)
+        self.last_search_plan: dict[str, Any] | None = None
+
+    def upsert_segments(
+        self, video_id: int, segments: list[dict[str, Any]], video=None
+    ):
+        """
+        Replace the segments of a video. `video` holds the metadata results
+        report for it, as selected from the videos table; segments without an
+        `id` get one above the largest stored id.
+        """
+        now = datetime.now(timezone.utc)
+        self.videos[video_id] = {
+            "video_id": video_id,
+            "s3_bucket": None,
+            "s3_key": None,
+            "filename": None,
+            "duration": None,
+            "created_at": now,
+            "updated_at": now,
+            "height": None,
+            "width": None,
+            **self.videos.get(video_id, {}),
+            **(video or {}),
+        }
+        self.delete_video_segments(video_id, forget_video=False)
+        if not segments:
+            return
+
+        next_id = int(self.segment_ids.max(initial=0)) + 1
+        self._append_rows(
+            np.asarray(
+                [segment["embedding"] for segment in segments], dtype=np.float32
+            ).astype(self.dtype),
+            segment_ids=[
+                segment.get("id", next_id + index)
+                for index, segment in enumerate(segments)
+            ],
+            video_ids=[video_id] * len(segments),
+            partitions=[
+                self._partition_code(segment["modality"], segment["scope"])
+                for segment in segments
+            ],
+            start_times=[segment["start_time"] for segment in segments],
+            end_times=[segment["end_time"] for segment in segments],
+        )
+
+    def delete_video_segments(self, video_id: int, forget_video=True) -> int:
+        """Tombstone the segments of a video and return how many were alive"""
+        deleted = self.alive & (self.video_ids == video_id)
+        self.alive &= ~deleted
+        if forget_video:
+            self.videos.pop(video_id, None)
+        self._compact_if_needed()
+        return int(deleted.sum())
+
+    def find_similar(
+        self, embedding, filter=None, page=0, limit=None, min_similarity=None
+    ) -> list[dict[str, Any]]:
+        limit = limit or self.default_page_limit
+        offset = limit * page
+        candidates = self._top_candidates(
+            [embedding], filter, min_similarity, limit + offset
+        )
+        return self._result_dicts(candidates[offset : offset + limit], batch=False)
+
+    def find_similar_batch(
+        self, embeddings, filter=None, page=0, limit=None, min_similarity=None
+    ) -> list[dict[str, Any]]:
+        limit = limit or self.default_page_limit
+        offset = limit * page
+        candidates = self._top_candidates(
+            embeddings, filter, min_similarity, limit + offset
+        )
+        return self._result_dicts(candidates[offset : offset + limit], batch=True)
+
+    def build_ivf(
+        self, lists: int, iterations=100, batch_size=1024, sample_size=50000, seed=0
+    ) -> dict[str, Any]:
+        """
+        Cluster a sample of the live rows into `lists` inverted lists with
+        minibatch_kmeans, then assign every row to its nearest centroid
+        """
+        rows = np.flatnonzero(self.alive)
+        if len(rows) < lists:
+            raise ValueError(f"Need at least {lists} segments, found {len(rows)}")
+
+        rng = np.random.default_rng(seed)
+        if len(rows) > sample_size:
+            rows = np.sort(rng.choice(rows, sample_size, replace=False))
+        sample = self._gather(rows)
+        self.centroids = minibatch_kmeans(sample, lists, iterations, batch_size, seed)
+        self.list_ids = np.concatenate(
+            [np.empty(0, dtype=np.int32)]
+            + [self._assign_lists(chunk) for _, chunk in self._chunks()]
+        )
+        sizes = np.bincount(self.list_ids[self.alive], minlength=lists)
+        self.logger.info(
+            f"Built {lists} IVF lists over {len(self.list_ids)} segments, "
+            f"largest {int(sizes.max())}"
+        )
+        return {
+            "lists": lists,
+            "sample_size": len(sample),
+            "max_list_size": int(sizes.max()),
+        }
+
+    def _top_candidates(
+        self, embeddings, filter, min_similarity, limit: int
+    ) -> list[tuple[int, float, list[int]]]:
+        """
+        Return up to `limit` (row, similarity, query indexes) above
+        `min_similarity`, best first. Like the database search, each query
+        vector contributes its own top `limit` and a segment keeps its best
+        similarity over them.
+        """
+        min_similarity = float(min_similarity or self.default_min_similarity)
+        mask = self._filter_mask(filter)
+        probing = self.centroids is not None and self.nprobe < len(self.centroids)
+        self.last_search_plan = {
+            "strategy": "ivf" if probing else "exact",
+            "search_mode": "numpy",
+            "estimated_rows": int(mask.sum()),
+        }
+        if not mask.any():
+            return []
+
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if not probing:
+            scores = self._scores(queries)
+
+        matches: dict[int, list[tuple[float, int]]] = {}
+        for query_index, query in enumerate(queries):
+            if probing:
+                probed = np.argpartition(-(self.centroids @ query), self.nprobe - 1)
+                rows = np.flatnonzero(
+                    mask & np.isin(self.list_ids, probed[: self.nprobe])
+                )
+                if not len(rows):
+                    continue
+                row_scores = self._gather(rows) @ query
+            else:
+                rows = np.flatnonzero(mask)
+                row_scores = scores[rows, query_index]
+            count = min(limit, len(rows))
+            best = np.argpartition(-row_scores, count - 1)[:count]
+            best = best[row_scores[best] > min_similarity]
+            for row, score in zip(rows[best].tolist(), row_scores[best].tolist()):
+                matches.setdefault(row, []).append((score, query_index))
+
+        # Same order as the database: distance, then video id; query indexes
+        # by distance, then index
+        ranked = sorted(
+            (
+                (row, sorted(row_matches, key=lambda match: (-match[0], match[1])))
+                for row, row_matches in matches.items()
+            ),
+            key=lambda item: (
+                -item[1][0][0],
+                self.video_ids[item[0]],
+                self.segment_ids[item[0]],
+            ),
+        )
+        return [
+            (row, row_matches[0][0], [query_index for _, query_index in row_matches])
+            for row, row_matches in ranked[:limit]
+        ]
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Inner products of every row with every query, one column each"""
+        if len(self.embedding_blocks) == 1:
+            block = self.embedding_blocks[0]
+            if block.dtype == np.float32 and not isinstance(block, np.memmap):
+                return block @ queries.T
+        # float16 has no BLAS path and mapped blocks page in as they are read:
+        # score both in float32 chunks
+        scores = np.empty((len(self.segment_ids), len(queries)), dtype=np.float32)
+        for start, chunk in self._chunks():
+            scores[start : start + len(chunk)] = chunk @ queries.T
+        return scores
+
+    def _chunks(self):
+        """Yield (first row, float32 embeddings) over all rows, in row order"""
+        offset = 0
+        for block in self.embedding_blocks:
+            for start in range(0, len(block), SCORE_CHUNK):
+                chunk = np.asarray(block[start : start + SCORE_CHUNK], np.float32)
+                yield offset + start, chunk
+            offset += len(block)
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        """float32 embeddings of the given sorted rows"""
+        gathered = []
+        offset = 0
+        for block in self.embedding_blocks:
+            block_rows = rows[(rows >= offset) & (rows < offset + len(block))]
+            gathered.append(np.asarray(block[block_rows - offset], np.float32))
+            offset += len(block)
+        if not gathered:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(gathered)
+
+    def _assign_lists(self, embeddings: np.ndarray) -> np.ndarray:
+        return np.argmax(embeddings @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _filter_mask(self, filter) -> np.ndarray:
+        """Rows that are alive and pass the modality, scope and video_id filter"""
+        partitions = VectorDBService._segment_partitions(filter)
+        partition_codes = [
+            code
+            for code, partition in enumerate(self.partition_keys)
+            if partition in partitions
+        ]
+        mask = self.alive & np.isin(self.partitions, partition_codes)
+        if filter and "video_id" in filter:
+            video_ids = filter["video_id"]
+            video_ids = video_ids if isinstance(video_ids, list) else [video_ids]
+            mask &= np.isin(self.video_ids, video_ids)
+        return mask
+
+    def _result_dicts(self, candidates, batch: bool) -> list[dict[str, Any]]:
+        """Build the rows find_similar selects and normalize them the same way"""
+        rows = []
+        for row, similarity, query_indexes in candidates:
+            video = self.videos[int(self.video_ids[row])]
+            modality, scope = self.partition_keys[self.partitions[row]]
+            rows.append(
+                {
+                    **video,
+                    "segment_id": int(self.segment_ids[row]),
+                    "modality": modality,
+                    "scope": scope,
+                    "start_time": float(self.start_times[row]),
+                    "end_time": float(self.end_times[row]),
+                    "query_indexes": query_indexes if batch else None,
+                    "similarity": similarity,
+                }
+            )
+        return VectorDBService._normalize_find_similar_results(rows)
+
+    def _append_rows(
+        self,
+        embeddings: np.ndarray,
+        segment_ids,
+        video_ids,
+        partitions,
+        start_times,
+        end_times,
+        alive=None,
+    ):
+        """
+        Append rows. In-memory embeddings extend the in-memory tail block;
+        a memmap becomes a block of its own.
+        """
+        if self.centroids is not None:
+            self.list_ids = np.concatenate(
+                [self.list_ids]
+                + [
+                    self._assign_lists(
+                        np.asarray(embeddings[start : start + SCORE_CHUNK], np.float32)
+                    )
+                    for start in range(0, len(embeddings), SCORE_CHUNK)
+                ]
+            )
+        if not isinstance(embeddings, np.memmap):
+            if self.embedding_blocks and not isinstance(
+                self.embedding_blocks[-1], np.memmap
+            ):
+                embeddings = np.concatenate([self.embedding_blocks.pop(), embeddings])
+        self.embedding_blocks.append(embeddings)
+
+        rows = len(segment_ids)
+        self.segment_ids = np.concatenate(
+            [self.segment_ids, np.asarray(segment_ids, dtype=np.int64)]
+        )
+        self.video_ids = np.concatenate(
+            [self.video_ids, np.asarray(video_ids, dtype=np.int64)]
+        )
+        self.partitions = np.concatenate(
+            [self.partitions, np.asarray(partitions, dtype=np.int8)]
+        )
+        self.start_times = np.concatenate(
+            [self.start_times, np.asarray(start_times, dtype=np.float32)]
+        )
+        self.end_times = np.concatenate(
+            [self.end_times, np.asarray(end_times, dtype=np.float32)]
+        )
+        self.alive = np.concatenate(
+            [self.alive, np.ones(rows, dtype=bool) if alive is None else alive]
+        )
+
+    def _in_memory_rows(self) -> np.ndarray:
+        """Rows held in memory rather than in a mapped snapshot part"""
+        return np.concatenate(
+            [np.empty(0, dtype=bool)]
+            + [
+                np.full(len(block), not isinstance(block, np.memmap))
+                for block in self.embedding_blocks
+            ]
+        )
+
+    def _compact_if_needed(self):
+        in_memory = self._in_memory_rows()
+        dead = int((in_memory & ~self.alive).sum())
+        if dead and dead >= COMPACT_DEAD_FRACTION * int(in_memory.sum()):
+            self._compact()
+
+    def _compact(self):
+        """
+        Drop tombstoned rows of the in-memory blocks so scoring stops paying for
+        them. Mapped blocks keep theirs until the on-disk snapshot is compacted.
+        """
+        keep = self.alive | ~self._in_memory_rows()
+        blocks = []
+        offset = 0
+        for block in self.embedding_blocks:
+            block_keep = keep[offset : offset + len(block)]
+            offset += len(block)
+            if not isinstance(block, np.memmap):
+                block = np.ascontiguousarray(block[block_keep])
+            if len(block):
+                blocks.append(block)
+        self.embedding_blocks = blocks
+        self.segment_ids = self.segment_ids[keep]
+        self.video_ids = self.video_ids[keep]
+        self.partitions = self.partitions[keep]
+        self.start_times = self.start_times[keep]
+        self.end_times = self.end_times[keep]
+        self.alive = self.alive[keep]
+        if self.centroids is not None:
+            self.list_ids = self.list_ids[keep]
+        self.logger.info(f"Compacted the vector store to {len(self.alive)} rows")
+
+    def _partition_code(self, modality: str, scope: str) -> int:
+        partition = (modality, scope)
+        if partition not in self.partition_keys:
+            self.partition_keys.append(partition)
+        return self.partition_keys.index(partition)
@@ -2,6 +2,7 @@ import sys
 import os
 import boto3
 import json
+import importlib
 import pytest
 from moto import mock_aws
 from unittest.mock import MagicMock, patch
@@ -34,6 +35,7 @@ class TestConfig:
         "s3_delete_handler",
         "sqs_embedding_task_consumer",
         "sqs_embedding_task_producer",
+        "db_bootstrap",
     ]
 
     # Default environment variables
@@ -56,6 +58,14 @@ class TestConfig:
         "twelvelabs",
     ]
 
+    # Vector database layer modules mocked for the handlers, and the ones that
+    # import them, reloaded for real by the layer's own tests
+    VECTOR_DATABASE_LAYER_MODULES = [
+        "vector_db_service",
+        "vector_store",
+        "snapshot_search",
+    ]
+
 
 def setup_python_paths():
     """Setup Python paths for Lambda layers and source code."""
@@ -99,6 +109,7 @@ def setup_module_mocks():
     mock_vector_db_service = MagicMock()
     sys.modules["vector_db_service"] = MagicMock()
     sys.modules["vector_db_service"].VectorDBService = mock_vector_db_service
+    sys.modules["snapshot_search"] = MagicMock()
 
     # Mock EmbedService to prevent API calls during import
     mock_embed_service = MagicMock()
@@ -226,6 +237,60 @@ def test_s3_bucket(s3_client):
     return bucket_name
 
 
+# ============================================================================
+# LAYER FIXTURES
+# ============================================================================
+
+
+def import_real_modules(module_names):
+    """
+    Swap the mocks of `module_names` out of sys.modules while the test runs
+    and restore them afterwards. Yields an importer for the real modules.
+    """
+    # Only the mocked modules are swapped: dropping everything imported by the
+    # test would also drop C-extension modules such as psycopg2.errors, which
+    # cannot be imported twice
+    mocks = {
+        module_name: sys.modules.pop(module_name, None) for module_name in module_names
+    }
+    yield importlib.import_module
+    for module_name, mock in mocks.items():
+        sys.modules.pop(module_name, None)
+        if mock is not None:
+            sys.modules[module_name] = mock
+
+
+@pytest.fixture
+def vector_database_layer():
+    """
+    Import the real vector database layer modules in place of the mocks the
+    handler tests use, restoring the mocks afterwards. Returns an importer:
+    vector_database_layer("vector_db_service") gives the real module.
+    """
+    yield from import_real_modules(TestConfig.VECTOR_DATABASE_LAYER_MODULES)
+
+
+@pytest.fixture
+def embed_service_layer():
+    """
+    Import the real embed_service module, on the mocked TwelveLabs client.
+    Returns an importer like vector_database_layer.
+    """
+    yield from import_real_modules(["embed_service"])
+
+
+@pytest.fixture
+def search_controller():
+    """
+    Import the real search_controller module, on the real vector database
+    layer, restoring the mocks afterwards. Returns the module.
+    """
+    for import_module in import_real_modules(
+        ["search_controller", *TestConfig.VECTOR_DATABASE_LAYER_MODULES]
+    ):
+        yield import_module("search_controller")
+
+
 # ============================================================================
 # BUILDER FIXTURES
 # ============================================================================
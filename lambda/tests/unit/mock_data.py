@@ -1,4 +1,6 @@
+import copy
 import json
+import numpy as np
 from typing import Dict, Any, Optional
 
 
@@ -243,3 +245,233 @@ class TestDataBuilder:
             "DB_PASSWORD": db_password,
         }
 
+    @staticmethod
+    def unit_rows(centers, count: int, seed: int = 0) -> np.ndarray:
+        """Create `count` unit vectors scattered closely around each of `centers`."""
+        rng = np.random.default_rng(seed)
+        rows = np.concatenate(
+            [center + rng.normal(0, 0.05, (count, len(center))) for center in centers]
+        )
+        return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+
+class RolloutDatabase:
+    """
+    The video_segments columns and model tables projection_refresh and
+    cluster_refresh roll out, answering the statements they send. Changes
+    since the last commit are undone by a rollback.
+    """
+
+    def __init__(self):
+        self.segments: Dict[int, Dict[str, Any]] = {}
+        self.projections: Dict[int, Dict[str, Any]] = {}
+        self.clusterings: Dict[int, Dict[str, Any]] = {}
+        self.lock_modes: list = []
+        self._committed = self._state()
+
+    def add_segment(self, embedding, **columns) -> int:
+        segment_id = max(self.segments, default=0) + 1
+        self.segments[segment_id] = {
+            "embedding": list(embedding),
+            "scope": "clip",
+            "coarse_embedding": None,
+            "projection_version": None,
+            "staged_coarse_embedding": None,
+            "staged_projection_version": None,
+            "cluster_id": None,
+            "clustering_version": None,
+            "staged_cluster_id": None,
+            "staged_clustering_version": None,
+            **columns,
+        }
+        self.commit()
+        return segment_id
+
+    def add_projection(self, version, mean, components, active=False):
+        self.projections[version] = {
+            "mean": mean,
+            "components": components,
+            "activated_at": version if active else None,
+        }
+        self.commit()
+
+    def add_clustering(self, version, centroids, active=False):
+        self.clusterings[version] = {
+            "centroids": centroids,
+            "activated_at": version if active else None,
+        }
+        self.commit()
+
+    def active_version(self, models) -> Optional[int]:
+        """The most recently activated version, as the service picks it"""
+        active = {
+            model["activated_at"]: version
+            for version, model in models.items()
+            if model["activated_at"]
+        }
+        return active[max(active)] if active else None
+
+    def coarse_search_ids(self):
+        """Segments a "coarse" search compares: projected by the active version"""
+        version = self.active_version(self.projections)
+        return [
+            segment_id
+            for segment_id, row in self.segments.items()
+            if row["coarse_embedding"] is not None
+            and row["projection_version"] == version
+        ]
+
+    def ivf_search_ids(self):
+        """Segments an "ivf" search compares: assigned by the active version"""
+        version = self.active_version(self.clusterings)
+        return [
+            segment_id
+            for segment_id, row in self.segments.items()
+            if row["cluster_id"] is not None and row["clustering_version"] == version
+        ]
+
+    def connect(self):
+        return RolloutConnection(self)
+
+    def execute_values(self, cursor, query, rows):
+        """Stand-in for psycopg2.extras.execute_values on staging updates"""
+        if "staged_coarse_embedding" in query:
+            columns = ("staged_coarse_embedding", "staged_projection_version")
+        else:
+            columns = ("staged_cluster_id", "staged_clustering_version")
+        for segment_id, value, version in rows:
+            self.segments[segment_id].update(zip(columns, (value, version)))
+
+    def commit(self):
+        self._committed = self._state()
+
+    def rollback(self):
+        self.segments, self.projections, self.clusterings = copy.deepcopy(
+            self._committed
+        )
+
+    def _state(self):
+        return copy.deepcopy((self.segments, self.projections, self.clusterings))
+
+
+class RolloutConnection:
+    def __init__(self, database: RolloutDatabase):
+        self.database = database
+
+    def cursor(self, name=None):
+        return RolloutCursor(self.database)
+
+    def commit(self):
+        self.database.commit()
+
+    def rollback(self):
+        self.database.rollback()
+
+
+class RolloutCursor:
+    def __init__(self, database: RolloutDatabase):
+        self.database = database
+        self.rows: list = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        database = self.database
+        if query.startswith("LOCK TABLE video_segments IN"):
+            database.lock_modes.append(query.split(" IN ")[1])
+        elif query.startswith("SELECT mean, components FROM embedding_projections"):
+            projection = database.projections.get(params[0])
+            self.rows = (
+                [(projection["mean"], projection["components"])] if projection else []
+            )
+        elif query.startswith("SELECT centroids FROM embedding_clusterings"):
+            clustering = database.clusterings.get(params[0])
+            self.rows = [(clustering["centroids"],)] if clustering else []
+        elif query.startswith("SELECT id, embedding::text FROM video_segments"):
+            self.rows = self._unstaged_segments(query, params)
+        elif query.startswith("SELECT embedding::text FROM video_segments"):
+            self.rows = [
+                (json.dumps(row["embedding"]),)
+                for row in database.segments.values()
+                if params["scope"] in (None, row["scope"])
+            ][: params["sample_size"]]
+        elif query.startswith("INSERT INTO embedding_projections"):
+            dimensions, mean, components = params[:3]
+            version = max(database.projections, default=0) + 1
+            database.projections[version] = {
+                "mean": mean,
+                "components": components,
+                "activated_at": None,
+            }
+            self.rows = [(version,)]
+        elif query.startswith("INSERT INTO embedding_clusterings"):
+            version = max(database.clusterings, default=0) + 1
+            database.clusterings[version] = {
+                "centroids": params[1],
+                "activated_at": None,
+            }
+            self.rows = [(version,)]
+        elif query.startswith("UPDATE video_segments SET coarse_embedding = staged"):
+            self._flip(params[0], "coarse_embedding", "projection_version")
+        elif query.startswith("UPDATE video_segments SET cluster_id = staged"):
+            self._flip(params[0], "cluster_id", "clustering_version")
+        elif query.startswith("UPDATE embedding_projections SET activated_at"):
+            self._activate(database.projections, params[0])
+        elif query.startswith("UPDATE embedding_clusterings SET activated_at"):
+            self._activate(database.clusterings, params[0])
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def _unstaged_segments(self, query, params):
+        column = (
+            "staged_projection_version"
+            if "staged_projection_version" in query
+            else "staged_clustering_version"
+        )
+        if isinstance(params, dict):
+            version, after_id, limit = (
+                params["version"],
+                params["last_id"],
+                params["batch_size"],
+            )
+        else:
+            (version, limit), after_id = params, 0
+        rows = [
+            (segment_id, json.dumps(row["embedding"]))
+            for segment_id, row in sorted(self.database.segments.items())
+            if segment_id > after_id and row[column] != version
+        ]
+        return rows[:limit]
+
+    def _flip(self, version, column, version_column):
+        self.rowcount = 0
+        for row in self.database.segments.values():
+            if row[f"staged_{version_column}"] == version:
+                row[column] = row[f"staged_{column}"]
+                row[version_column] = version
+                row[f"staged_{column}"] = None
+                row[f"staged_{version_column}"] = None
+                self.rowcount += 1
+
+    def _activate(self, models, version):
+        activated_at = max(
+            [model["activated_at"] or 0 for model in models.values()], default=0
+        )
+        models[version]["activated_at"] = activated_at + 1
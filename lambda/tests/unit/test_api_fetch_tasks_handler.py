@@ -27,6 +27,7 @@ def test_lambda_handler_success(mock_vector_db, kubrick_secret, event_builder):
             }
         ],
         1,
+        None,
     )
 
     event = event_builder.api_gateway_proxy_event(
@@ -43,12 +44,14 @@ def test_lambda_handler_success(mock_vector_db, kubrick_secret, event_builder):
     assert body["metadata"]["page"] == 1
     assert len(body["data"]) == 1
     assert body["data"][0]["status"] == "completed"
-    mock_vector_db.fetch_tasks.assert_called_once_with(page=1, limit=5)
+    mock_vector_db.fetch_tasks.assert_called_once_with(
+        page=1, limit=5, cursor=None, exact_total=False
+    )
 
 
 def test_lambda_handler_default_params(mock_vector_db, kubrick_secret, event_builder):
     """Test that default parameters are used when none are provided."""
-    mock_vector_db.fetch_tasks.return_value = ([], 0)
+    mock_vector_db.fetch_tasks.return_value = ([], 0, None)
 
     event = event_builder.api_gateway_proxy_event()
     response = lambda_handler(event, {})
@@ -57,12 +60,14 @@ def test_lambda_handler_default_params(mock_vector_db, kubrick_secret, event_bui
     body = json.loads(response["body"])
     assert body["metadata"]["limit"] == 10  # Default limit from lambda
     assert body["metadata"]["page"] == 0    # Default page from lambda
-    mock_vector_db.fetch_tasks.assert_called_once_with(page=0, limit=10)
+    mock_vector_db.fetch_tasks.assert_called_once_with(
+        page=0, limit=10, cursor=None, exact_total=False
+    )
 
 
 def test_lambda_handler_limit_validation(mock_vector_db, kubrick_secret, event_builder):
     """Test that pagination parameters are capped and floored correctly."""
-    mock_vector_db.fetch_tasks.return_value = ([], 0)
+    mock_vector_db.fetch_tasks.return_value = ([], 0, None)
 
     event = event_builder.api_gateway_proxy_event(
         query_params={"limit": "100", "page": "-5"}
@@ -73,7 +78,9 @@ def test_lambda_handler_limit_validation(mock_vector_db, kubrick_secret, event_b
     body = json.loads(response["body"])
     assert body["metadata"]["limit"] == 50  # Capped at MAX_TASK_LIMIT
     assert body["metadata"]["page"] == 0    # Min value is 0
-    mock_vector_db.fetch_tasks.assert_called_once_with(page=0, limit=50)
+    mock_vector_db.fetch_tasks.assert_called_once_with(
+        page=0, limit=50, cursor=None, exact_total=False
+    )
 
 
 def test_lambda_handler_invalid_params(mock_vector_db, kubrick_secret, event_builder):
@@ -109,7 +116,7 @@ def test_lambda_handler_boundary_conditions(
     mock_vector_db, kubrick_secret, event_builder
 ):
     """Test that a limit of 0 is corrected to the minimum of 1."""
-    mock_vector_db.fetch_tasks.return_value = ([], 0)
+    mock_vector_db.fetch_tasks.return_value = ([], 0, None)
 
     event = event_builder.api_gateway_proxy_event(
         query_params={"limit": "0", "page": "0"}
@@ -119,4 +126,39 @@ def test_lambda_handler_boundary_conditions(
     assert response["statusCode"] == 200
     body = json.loads(response["body"])
     assert body["metadata"]["limit"] == 1  # Minimum enforced
-    mock_vector_db.fetch_tasks.assert_called_once_with(page=0, limit=1)
+    mock_vector_db.fetch_tasks.assert_called_once_with(
+        page=0, limit=1, cursor=None, exact_total=False
+    )
+
+
+def test_lambda_handler_cursor_pagination(
+    mock_vector_db, kubrick_secret, event_builder
+):
+    """Test that the cursor is forwarded and the next cursor is returned."""
+    mock_vector_db.fetch_tasks.return_value = ([], 42, "next-cursor")
+
+    event = event_builder.api_gateway_proxy_event(
+        query_params={"limit": "5", "cursor": "abc", "exact_total": "true"}
+    )
+    response = lambda_handler(event, {})
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["metadata"]["next_cursor"] == "next-cursor"
+    assert "page" not in body["metadata"]
+    assert body["metadata"]["total"] == 42
+    mock_vector_db.fetch_tasks.assert_called_once_with(
+        page=0, limit=5, cursor="abc", exact_total=True
+    )
+
+
+def test_lambda_handler_invalid_cursor(mock_vector_db, kubrick_secret, event_builder):
+    """Test for a 400 validation error when the cursor cannot be decoded."""
+    mock_vector_db.fetch_tasks.side_effect = ValueError("Invalid pagination cursor")
+
+    event = event_builder.api_gateway_proxy_event(query_params={"cursor": "bad"})
+    response = lambda_handler(event, {})
+
+    assert response["statusCode"] == 400
+    body = json.loads(response["body"])
+    assert body["error"]["code"] == "VALIDATION_ERROR"
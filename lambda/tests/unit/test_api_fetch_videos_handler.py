@@ -38,7 +38,7 @@ def test_lambda_handler_success(
     """Test successful retrieval of a list of videos."""
     # Setup mocks
     videos = [test_data_builder.video()]
-    mock_vector_db.fetch_videos.return_value = (videos, 1)
+    mock_vector_db.fetch_videos.return_value = (videos, 1, None)
 
     # Test event
     event = event_builder.api_gateway_proxy_event(
@@ -59,14 +59,16 @@ def test_lambda_handler_success(
     assert body["metadata"]["page"] == 0
     assert len(body["data"]) == 1
 
-    mock_vector_db.fetch_videos.assert_called_once_with(page=0, limit=10)
+    mock_vector_db.fetch_videos.assert_called_once_with(
+        page=0, limit=10, cursor=None, exact_total=False
+    )
     mock_add_presigned_urls.assert_called_once()
 
 
 def test_lambda_handler_default_params(mock_vector_db, kubrick_secret, event_builder):
     """Test that default pagination parameters are used when none are provided."""
     # Setup mock
-    mock_vector_db.fetch_videos.return_value = ([], 0)
+    mock_vector_db.fetch_videos.return_value = ([], 0, None)
 
     # Test event (no query params)
     event = event_builder.api_gateway_proxy_event()
@@ -81,7 +83,9 @@ def test_lambda_handler_default_params(mock_vector_db, kubrick_secret, event_bui
     assert body["metadata"]["limit"] == 12
     assert body["metadata"]["page"] == 0
 
-    mock_vector_db.fetch_videos.assert_called_once_with(page=0, limit=12)
+    mock_vector_db.fetch_videos.assert_called_once_with(
+        page=0, limit=12, cursor=None, exact_total=False
+    )
 
 
 def test_lambda_handler_database_error(mock_vector_db, kubrick_secret, event_builder):
@@ -106,7 +110,7 @@ def test_lambda_handler_database_error(mock_vector_db, kubrick_secret, event_bui
 def test_lambda_handler_invalid_params(mock_vector_db, kubrick_secret, event_builder):
     """Test 400 error response for invalid pagination parameters."""
     # Setup mock
-    mock_vector_db.fetch_videos.return_value = ([], 0)
+    mock_vector_db.fetch_videos.return_value = ([], 0, None)
 
     # Test event
     event = event_builder.api_gateway_proxy_event(
@@ -133,7 +137,7 @@ def test_lambda_handler_with_environment_variables(
 ):
     """Test that environment variables for secrets and S3 are used correctly."""
     # Setup mocks
-    mock_vector_db.fetch_videos.return_value = ([], 0)
+    mock_vector_db.fetch_videos.return_value = ([], 0, None)
     mock_get_secret.return_value = kubrick_secret
 
     # Test event
@@ -151,7 +155,7 @@ def test_lambda_handler_with_environment_variables(
 def test_lambda_handler_no_videos_found(mock_vector_db, kubrick_secret, event_builder):
     """Test successful response with an empty data array when no videos are found."""
     # Setup mock
-    mock_vector_db.fetch_videos.return_value = ([], 0)
+    mock_vector_db.fetch_videos.return_value = ([], 0, None)
 
     # Test event
     event = event_builder.api_gateway_proxy_event(
@@ -167,4 +171,48 @@ def test_lambda_handler_no_videos_found(mock_vector_db, kubrick_secret, event_bu
     body = json.loads(response["body"])
     assert len(body["data"]) == 0
     assert body["metadata"]["total"] == 0
-    mock_vector_db.fetch_videos.assert_called_once_with(page=0, limit=10)
+    mock_vector_db.fetch_videos.assert_called_once_with(
+        page=0, limit=10, cursor=None, exact_total=False
+    )
+
+
+def test_lambda_handler_cursor_pagination(
+    mock_vector_db, kubrick_secret, event_builder
+):
+    """Test that the cursor is forwarded and the next cursor is returned."""
+    # Setup mock
+    mock_vector_db.fetch_videos.return_value = ([], 42, "next-cursor")
+
+    # Test event
+    event = event_builder.api_gateway_proxy_event(
+        query_params={"limit": "10", "cursor": "abc"}
+    )
+    context = {}
+
+    # Execute
+    response = lambda_handler(event, context)
+
+    # Assert
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["metadata"]["next_cursor"] == "next-cursor"
+    assert "page" not in body["metadata"]
+    mock_vector_db.fetch_videos.assert_called_once_with(
+        page=0, limit=10, cursor="abc", exact_total=False
+    )
+
+
+def test_lambda_handler_invalid_cursor(mock_vector_db, kubrick_secret, event_builder):
+    """Test 400 error response when the cursor cannot be decoded."""
+    # Setup mock
+    mock_vector_db.fetch_videos.side_effect = ValueError("Invalid pagination cursor")
+
+    # Test event
+    event = event_builder.api_gateway_proxy_event(query_params={"cursor": "bad"})
+    context = {}
+
+    # Execute
+    response = lambda_handler(event, context)
+
+    # Assert
+    assert response["statusCode"] == 400
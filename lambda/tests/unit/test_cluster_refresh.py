@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+import cluster_refresh
+from mock_data import RolloutDatabase, TestDataBuilder
+
+
+@pytest.fixture
+def database():
+    """Six segments assigned by active version 1, and a fitted version 2"""
+    database = RolloutDatabase()
+    database.add_clustering(1, np.eye(3)[:1], active=True)
+    database.add_clustering(2, np.eye(3))
+    for embedding in TestDataBuilder.unit_rows(np.eye(3), 2):
+        database.add_segment(embedding, cluster_id=0, clustering_version=1)
+    with patch.object(cluster_refresh, "execute_values", database.execute_values):
+        yield database
+
+
+def test_backfill_stages_without_touching_the_active_clustering(database):
+    """Test that backfill -> search -> activate keeps every segment searchable."""
+    conn = database.connect()
+
+    first = cluster_refresh.backfill(conn, 2, batch_size=4, max_batches=1)
+    rest = cluster_refresh.backfill(conn, 2, batch_size=4, after_id=first["last_id"])
+
+    assert first == {"version": 2, "assigned": 4, "last_id": 4, "done": False}
+    assert rest == {"version": 2, "assigned": 2, "last_id": 6, "done": True}
+    assert database.ivf_search_ids() == [1, 2, 3, 4, 5, 6]
+    staged = [row["staged_cluster_id"] for row in database.segments.values()]
+    assert staged == [0, 0, 1, 1, 2, 2]
+
+    # Stored by ingest with the active version between backfill and activate
+    database.add_segment([0.0, 0.1, 0.9], cluster_id=0, clustering_version=1)
+    result = cluster_refresh.activate(conn, 2)
+
+    assert result == {"version": 2, "activated_segments": 7, "late_segments": 1}
+    assert database.active_version(database.clusterings) == 2
+    assert database.ivf_search_ids() == [1, 2, 3, 4, 5, 6, 7]
+    assigned = [row["cluster_id"] for row in database.segments.values()]
+    assert assigned == [0, 0, 1, 1, 2, 2, 2]
+
+
+def test_activate_fails_while_segments_are_unassigned(database):
+    """Test that activate changes nothing while stale segments remain."""
+    conn = database.connect()
+
+    with pytest.raises(ValueError):
+        cluster_refresh.activate(conn, 2, max_late_segments=5)
+
+    assert database.active_version(database.clusterings) == 1
+    assert database.ivf_search_ids() == [1, 2, 3, 4, 5, 6]
+    assert all(row["staged_cluster_id"] is None for row in database.segments.values())
+
+
+def test_backfill_rejects_unknown_versions(database):
+    """Test that backfill and activate refuse a version that was never fitted."""
+    conn = database.connect()
+
+    with pytest.raises(ValueError):
+        cluster_refresh.backfill(conn, 99)
+    with pytest.raises(ValueError):
+        cluster_refresh.activate(conn, 99)
+
+
+def test_fit_clusters_only_clip_embeddings(database):
+    """Test that fit() samples clip segments and stores an inactive version."""
+    database.add_segment([0.0, 0.0, 1.0], scope="video")
+    conn = database.connect()
+
+    result = cluster_refresh.fit(conn, clusters=3, iterations=20, batch_size=4)
+
+    assert result["version"] == 3
+    assert result["sample_size"] == 6
+    assert result["min_cluster_size"] == 2
+    assert database.clusterings[3]["activated_at"] is None
+    assert database.active_version(database.clusterings) == 1
+    with pytest.raises(ValueError):
+        cluster_refresh.fit(conn, clusters=7)
@@ -0,0 +1,204 @@
+import os
+import re
+import psycopg2
+import pytest
+from unittest.mock import patch
+
+import search_indexes
+from db_bootstrap import lambda_function
+
+BOOTSTRAP_DIR = os.path.dirname(lambda_function.__file__)
+
+# Statements that create a named object, and the clause that makes them a no-op
+# when it already exists
+CREATE_STATEMENTS = [
+    (r"CREATE EXTENSION (IF NOT EXISTS )?(\w+)", "extension"),
+    (r"CREATE (OR REPLACE )?FUNCTION (\w+)", "function"),
+    (r"CREATE TABLE (IF NOT EXISTS )?(\w+)", "table"),
+    (r"CREATE (?:UNIQUE )?INDEX (IF NOT EXISTS )?(\w+)", "index"),
+    (r"CREATE TRIGGER ()(\w+)", "trigger"),
+]
+
+
+class FakeCatalog:
+    """
+    The named objects schema.sql creates, failing like Postgres does when a
+    statement creates one that already exists
+    """
+
+    def __init__(self):
+        self.objects = set()
+
+    def execute(self, script):
+        for statement in split_statements(script):
+            self.apply(" ".join(statement.split()))
+
+    def apply(self, statement):
+        drop = re.match(r"DROP (TRIGGER|INDEX) IF EXISTS (\w+)", statement)
+        if drop:
+            self.objects.discard((drop.group(1).lower(), drop.group(2)))
+            return
+        for alter in re.finditer(r"ADD COLUMN (IF NOT EXISTS )?(\w+)", statement):
+            table = re.match(r"ALTER TABLE (\w+)", statement).group(1)
+            self.create(("column", f"{table}.{alter.group(2)}"), alter.group(1))
+        for pattern, kind in CREATE_STATEMENTS:
+            create = re.match(pattern, statement)
+            if create:
+                self.create((kind, create.group(2)), create.group(1))
+
+    def create(self, key, guard):
+        if key in self.objects and not guard:
+            raise psycopg2.ProgrammingError(f"{key[0]} {key[1]} already exists")
+        self.objects.add(key)
+
+
+def split_statements(script):
+    """Split a SQL script on semicolons outside comments and $$ bodies"""
+    script = re.sub(r"--[^\n]*", "", script)
+    statements = [""]
+    for index, part in enumerate(re.split(r"(\$\$.*?\$\$)", script, flags=re.S)):
+        if index % 2:
+            statements[-1] += part
+            continue
+        first, *rest = part.split(";")
+        statements[-1] += first
+        statements.extend(rest)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+class FakeConnection:
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, script):
+        self.catalog.execute(script)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = FakeCatalog()
+    monkeypatch.chdir(BOOTSTRAP_DIR)
+    with patch.object(
+        lambda_function.psycopg2, "connect", lambda **kwargs: FakeConnection(catalog)
+    ):
+        yield catalog
+
+
+def test_bootstrap_runs_twice_against_the_same_database(catalog):
+    """Test that schema.sql can be re-run against a bootstrapped database."""
+    first = lambda_function.lambda_handler({}, {})
+    created = set(catalog.objects)
+    second = lambda_function.lambda_handler({}, {})
+
+    assert first["statusCode"] == 200
+    assert second["statusCode"] == 200
+    assert catalog.objects == created
+    assert ("index", "unique_s3_object") in created
+
+
+def test_fake_catalog_rejects_unguarded_creates(catalog):
+    """Test that the fake catalog fails on a duplicate, as Postgres would."""
+    catalog.execute("CREATE UNIQUE INDEX unique_s3_object ON videos (s3_key);")
+
+    with pytest.raises(psycopg2.ProgrammingError):
+        catalog.execute("CREATE UNIQUE INDEX unique_s3_object ON videos (s3_key);")
+
+
+def test_bootstrap_leaves_the_optional_search_mode_indexes_out(catalog):
+    """Test that schema.sql builds only the partition indexes every mode needs."""
+    lambda_function.lambda_handler({}, {})
+
+    indexes = {name for kind, name in catalog.objects if kind == "index"}
+    assert "video_segments_audio_clip_ann_idx" in indexes
+    assert not any(name.endswith(("_bq_idx", "_coarse_idx")) for name in indexes)
+
+
+class IndexCatalog:
+    """pg_index validity of existing indexes, built on by concurrent builds"""
+
+    def __init__(self, valid):
+        self.valid = dict(valid)
+        self.autocommit = False
+        self.statements = []
+
+    def cursor(self):
+        return IndexCursor(self)
+
+
+class IndexCursor:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        catalog = self.catalog
+        assert catalog.autocommit, "concurrent index builds need autocommit"
+        catalog.statements.append(query)
+        if query.startswith("SELECT indisvalid"):
+            valid = catalog.valid.get(params[0])
+            self.rows = [] if valid is None else [(valid,)]
+        elif query.startswith("DROP INDEX CONCURRENTLY"):
+            del catalog.valid[query.split()[-1]]
+        elif query.startswith("CREATE INDEX CONCURRENTLY"):
+            catalog.valid[query.split()[3]] = True
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+def test_binary_indexes_builds_missing_and_invalid_indexes():
+    """Test that the action builds absent indexes and rebuilds invalid ones."""
+    conn = IndexCatalog(
+        {
+            "video_segments_visual_text_clip_bq_idx": True,
+            "video_segments_audio_clip_bq_idx": False,
+        }
+    )
+
+    built = lambda_function.MIGRATION_ACTIONS["binary_indexes"](conn, {})
+
+    assert built == [
+        "video_segments_visual_text_video_bq_idx",
+        "video_segments_audio_clip_bq_idx",
+        "video_segments_audio_video_bq_idx",
+    ]
+    assert all(
+        conn.valid[name] for name in search_indexes.BINARY_PARTITION_INDEXES.values()
+    )
+    assert (
+        "DROP INDEX CONCURRENTLY video_segments_audio_clip_bq_idx" in conn.statements
+    )
+    assert not conn.autocommit
+    assert lambda_function.MIGRATION_ACTIONS["binary_indexes"](conn, {}) == []
+
+
+def test_projection_indexes_index_coarse_embedding():
+    """Test that the projection_indexes action indexes coarse_embedding."""
+    conn = IndexCatalog({})
+
+    built = lambda_function.MIGRATION_ACTIONS["projection_indexes"](conn, {})
+
+    creates = [sql for sql in conn.statements if sql.startswith("CREATE")]
+    assert len(built) == len(creates) == 4
+    assert all("(coarse_embedding vector_ip_ops)" in sql for sql in creates)
@@ -0,0 +1,47 @@
+import math
+import pytest
+from types import SimpleNamespace
+
+
+@pytest.fixture
+def embed_service(embed_service_layer):
+    return embed_service_layer("embed_service")
+
+
+def test_l2_normalize_scales_to_unit_length(embed_service):
+    """Test that a normalized embedding has unit length and the same direction."""
+    normalized = embed_service.l2_normalize([3.0, 4.0, 0.0])
+
+    assert normalized == pytest.approx([0.6, 0.8, 0.0])
+    assert math.fsum(value * value for value in normalized) == pytest.approx(1.0)
+
+
+def test_l2_normalize_keeps_zero_vector(embed_service):
+    """Test that a zero embedding is returned unchanged instead of dividing by zero."""
+    assert embed_service.l2_normalize([0.0, 0.0]) == [0.0, 0.0]
+
+
+def test_segments_are_stored_normalized(embed_service):
+    """Test that every stored segment embedding is scaled to unit length."""
+    service = embed_service.EmbedService("key", "model", clip_length=6)
+    segments = [
+        SimpleNamespace(
+            start_offset_sec=0.0,
+            end_offset_sec=6.0,
+            embedding_scope="clip",
+            embedding_option="visual-text",
+            float_=[2.0, 0.0],
+        ),
+        SimpleNamespace(
+            start_offset_sec=0.0,
+            end_offset_sec=60.0,
+            embedding_scope="video",
+            embedding_option="audio",
+            float_=[1.0, 1.0],
+        ),
+    ]
+
+    normalized = service.normalize_segments(segments)
+
+    assert normalized[0]["embedding"] == pytest.approx([1.0, 0.0])
+    assert normalized[1]["embedding"] == pytest.approx([math.sqrt(0.5)] * 2)
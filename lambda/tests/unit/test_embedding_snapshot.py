@@ -0,0 +1,261 @@
+import json
+import os
+import numpy as np
+import pytest
+
+import embedding_snapshot
+
+
+class FakeDatabase:
+    """The videos and video_segments rows the snapshot builder reads"""
+
+    def __init__(self):
+        self.video_ids = set()
+        self.segments = []
+
+    def add_video(self, video_id, embeddings, modality="visual-text", scope="clip"):
+        self.video_ids.add(video_id)
+        for index, embedding in enumerate(embeddings):
+            self.segments.append(
+                (
+                    len(self.segments) + 1,
+                    video_id,
+                    modality,
+                    scope,
+                    index * 6.0,
+                    (index + 1) * 6.0,
+                    "[" + ",".join(str(value) for value in embedding) + "]",
+                )
+            )
+
+    def delete_video(self, video_id):
+        self.video_ids.discard(video_id)
+        self.segments = [row for row in self.segments if row[1] != video_id]
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        if query.startswith("SET TRANSACTION"):
+            return
+        if "COUNT(*)" in query:
+            rows = [row for row in self.database.segments if row[0] > params[0]]
+            dimensions = {len(row[6].split(",")) for row in rows}
+            self.rows = [
+                (
+                    len(rows),
+                    max((row[0] for row in rows), default=None),
+                    max(dimensions, default=None),
+                )
+            ]
+        elif "FROM video_segments" in query:
+            watermark, max_id = params
+            self.rows = [
+                row for row in self.database.segments if watermark < row[0] <= max_id
+            ]
+        elif "FROM videos" in query:
+            existing = self.database.video_ids
+            self.rows = [(video_id,) for video_id in params[0] if video_id in existing]
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.add_video(1, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    database.add_video(2, [[0.0, 0.0, 1.0]], modality="audio")
+    return database
+
+
+def test_build_writes_every_segment_in_id_order(tmp_path, database):
+    """Test that build() writes the segments, columns and manifest of a snapshot."""
+    path = str(tmp_path / "snapshot")
+
+    result = embedding_snapshot.build(
+        FakeConnection(database), path, dtype="float16", batch_size=2
+    )
+    snapshot = embedding_snapshot.EmbeddingSnapshot(path)
+
+    assert result["rows"] == 3
+    assert result["watermark"] == 3
+    assert len(snapshot) == 3
+    assert snapshot.dtype == np.float16
+    assert snapshot.dimensions == 3
+    assert snapshot.partitions == [("visual-text", "clip"), ("audio", "clip")]
+    (part,) = snapshot.parts
+    assert part.embeddings.dtype == np.float16
+    np.testing.assert_array_equal(part.embeddings, np.eye(3))
+    np.testing.assert_array_equal(part.segment_id, [1, 2, 3])
+    np.testing.assert_array_equal(part.video_id, [1, 1, 2])
+    np.testing.assert_array_equal(part.partition, [0, 0, 1])
+    np.testing.assert_array_equal(part.start_time, [0.0, 6.0, 0.0])
+
+
+def test_build_refuses_unknown_dtypes_and_existing_snapshots(tmp_path, database):
+    """Test that build() validates the dtype and never overwrites a snapshot."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+
+    with pytest.raises(ValueError):
+        embedding_snapshot.build(conn, path, dtype="int8")
+
+    embedding_snapshot.build(conn, path)
+    with pytest.raises(ValueError):
+        embedding_snapshot.build(conn, path)
+
+
+def test_append_adds_a_delta_part_and_records_deleted_videos(tmp_path, database):
+    """Test that append() writes new segments and marks deleted videos dead."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+    embedding_snapshot.build(conn, path)
+    database.add_video(3, [[0.6, 0.8, 0.0]])
+    database.delete_video(1)
+
+    result = embedding_snapshot.append(conn, path)
+    snapshot = embedding_snapshot.EmbeddingSnapshot(path)
+
+    assert result["rows"] == 1
+    assert result["parts"] == 2
+    assert result["deleted_videos"] == 1
+    assert snapshot.watermark == 4
+    np.testing.assert_array_equal(snapshot.deleted_video_ids, [1])
+    first, delta = snapshot.parts
+    np.testing.assert_array_equal(delta.segment_id, [4])
+    np.testing.assert_array_equal(snapshot.alive(first), [False, False, True])
+    np.testing.assert_array_equal(snapshot.alive(delta), [True])
+
+
+def test_append_without_new_segments_keeps_the_parts(tmp_path, database):
+    """Test that append() with nothing above the watermark adds no empty part."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+    embedding_snapshot.build(conn, path)
+
+    result = embedding_snapshot.append(conn, path)
+
+    assert result["rows"] == 0
+    assert result["parts"] == 1
+    assert result["watermark"] == 3
+
+
+def test_append_rejects_segments_of_other_dimensions(tmp_path, database):
+    """Test that append() rolls back when new segments change the dimensions."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+    embedding_snapshot.build(conn, path)
+    database.add_video(3, [[1.0, 0.0]])
+
+    with pytest.raises(ValueError):
+        embedding_snapshot.append(conn, path)
+
+    assert conn.rollbacks == 1
+    assert embedding_snapshot.read_manifest(path)["watermark"] == 3
+
+
+def test_compact_merges_parts_without_deleted_videos(tmp_path, database):
+    """Test that compact() keeps only live rows in one part and retires the rest."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+    embedding_snapshot.build(conn, path)
+    database.add_video(3, [[0.6, 0.8, 0.0]])
+    database.delete_video(1)
+    embedding_snapshot.append(conn, path)
+
+    result = embedding_snapshot.compact(path)
+    snapshot = embedding_snapshot.EmbeddingSnapshot(path)
+
+    assert result["rows"] == 2
+    assert result["parts"] == 1
+    assert result["deleted_videos"] == 0
+    assert result["retired_parts"] == 2
+    (part,) = snapshot.parts
+    np.testing.assert_array_equal(part.segment_id, [3, 4])
+    np.testing.assert_array_equal(part.video_id, [2, 3])
+    np.testing.assert_allclose(part.embeddings, [[0.0, 0.0, 1.0], [0.6, 0.8, 0.0]])
+    assert snapshot.alive(part).all()
+
+
+def test_retired_parts_stay_on_disk_for_the_grace_period(tmp_path, database):
+    """Test that parts replaced by compact() are removed only after the grace period."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+    embedding_snapshot.build(conn, path)
+    # A reader that mapped the snapshot before the compaction
+    reader = embedding_snapshot.EmbeddingSnapshot(path)
+
+    embedding_snapshot.compact(path)
+    kept = embedding_snapshot.remove_retired_parts(path)
+
+    assert sorted(os.listdir(path)) == ["manifest.json", "part-00000", "part-00001"]
+    assert kept["retired_parts"][0]["name"] == "part-00000"
+    np.testing.assert_array_equal(reader.parts[0].segment_id, [1, 2, 3])
+
+    removed = embedding_snapshot.remove_retired_parts(path, grace_period=0)
+
+    assert removed["retired_parts"] == []
+    assert sorted(os.listdir(path)) == ["manifest.json", "part-00001"]
+    assert len(embedding_snapshot.EmbeddingSnapshot(path)) == 3
+
+
+def test_compact_removes_the_parts_of_an_earlier_compaction(tmp_path, database):
+    """Test that compact() removes parts retired longer than the grace period."""
+    path = str(tmp_path / "snapshot")
+    conn = FakeConnection(database)
+    embedding_snapshot.build(conn, path)
+    embedding_snapshot.compact(path)
+
+    result = embedding_snapshot.compact(path, grace_period=0)
+
+    assert result["retired_parts"] == 0
+    assert sorted(os.listdir(path)) == ["manifest.json", "part-00002"]
+
+
+def test_read_manifest_rejects_other_format_versions(tmp_path):
+    """Test that a snapshot of an unknown format version is not opened."""
+    path = str(tmp_path)
+    embedding_snapshot.write_manifest(path, {"format_version": 99})
+
+    with pytest.raises(ValueError):
+        embedding_snapshot.read_manifest(path)
+    with open(os.path.join(path, embedding_snapshot.MANIFEST_NAME)) as f:
+        assert json.load(f) == {"format_version": 99}
+    assert not os.path.exists(
+        os.path.join(path, f"{embedding_snapshot.MANIFEST_NAME}.tmp")
+    )
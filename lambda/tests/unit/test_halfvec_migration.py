@@ -0,0 +1,76 @@
+import halfvec_migration
+
+
+class SegmentTable:
+    """video_segments ids, and the ones whose embedding_half is filled"""
+
+    def __init__(self, ids, converted=()):
+        self.ids = sorted(ids)
+        self.converted = set(converted)
+        self.commits = 0
+
+    def cursor(self):
+        return SegmentTableCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+class SegmentTableCursor:
+    def __init__(self, table):
+        self.table = table
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        table = self.table
+        if query.startswith("ALTER TABLE video_segments ADD COLUMN IF NOT EXISTS"):
+            self.rows = []
+        elif query.startswith("SELECT COALESCE(MAX(id), 0)"):
+            self.rows = [(max(table.converted, default=0),)]
+        elif query.startswith("WITH batch"):
+            after = [id for id in table.ids if id > params["last_id"]]
+            batch = after[: params["batch_size"]]
+            table.converted.update(batch)
+            self.rows = [(id,) for id in batch]
+        elif query.startswith("SELECT COUNT(*)"):
+            self.rows = [(len(set(table.ids) - table.converted),)]
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_backfill_converts_in_batches_and_resumes():
+    """Test that backfill commits batch by batch and resumes after the last id."""
+    table = SegmentTable(range(1, 6), converted=[1])
+
+    first = halfvec_migration.backfill(table, batch_size=2, max_batches=1)
+    commits = table.commits
+    second = halfvec_migration.backfill(table, batch_size=2)
+
+    assert first == {"converted": 2, "last_id": 3, "remaining": 2}
+    assert second == {"converted": 2, "last_id": 5, "remaining": 0}
+    assert table.converted == {1, 2, 3, 4, 5}
+    # The schema change, the one batch left, the empty batch that ends the
+    # backfill and the count each commit
+    assert table.commits - commits == 4
+
+
+def test_backfill_of_a_converted_table_changes_nothing():
+    """Test that a finished backfill converts no rows when run again."""
+    table = SegmentTable(range(1, 4), converted=range(1, 4))
+
+    result = halfvec_migration.backfill(table, batch_size=2)
+
+    assert result == {"converted": 0, "last_id": 3, "remaining": 0}
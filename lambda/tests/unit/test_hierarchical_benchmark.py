@@ -0,0 +1,80 @@
+import hierarchical_benchmark
+
+# Sampled query clips, as (id, modality, embedding text)
+SAMPLES = [(1, "visual-text", "[1,0]"), (2, "audio", "[0,1]")]
+
+
+class BenchmarkConnection:
+    """
+    Answers each top-k query with the query clip itself followed by `k` hits:
+    the true ones for flat search, and one true and one missed neighbour for
+    hierarchical search
+    """
+
+    def __init__(self):
+        self.settings = {}
+
+    def cursor(self):
+        return BenchmarkCursor(self)
+
+    def commit(self):
+        pass
+
+
+class BenchmarkCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        if query.startswith("SELECT id, modality, embedding::text"):
+            self.rows = SAMPLES[: params[0]]
+        elif query.startswith("SELECT atttypid::regtype::text"):
+            self.rows = [("vector",)]
+        elif query.startswith("SELECT set_config('enable_indexscan'"):
+            self.connection.settings["enable_indexscan"] = params[0]
+        elif query.startswith("SELECT set_config"):
+            pass
+        else:
+            query_id = next(
+                id for id, _, embedding in SAMPLES if embedding == params["embedding"]
+            )
+            missed = 12 if "nearest_videos" in query else 11
+            self.rows = [(query_id,), (10,), (missed,)]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_compare_recall_reports_both_searches_against_exact_search():
+    """Test that recall and latency are reported for flat and hierarchical search."""
+    report = hierarchical_benchmark.compare_recall(
+        BenchmarkConnection(), sample_size=2, k=2, videos=5
+    )
+
+    assert report["queries"] == 2
+    assert (report["k"], report["videos"]) == (2, 5)
+    assert report["flat_recall"] == 1.0
+    assert report["hierarchical_recall"] == 0.5
+    for name in ["flat", "hierarchical"]:
+        assert report[f"{name}_mean_ms"] >= 0
+        assert report[f"{name}_p95_ms"] >= 0
+
+
+def test_compare_recall_of_an_empty_library_has_no_numbers():
+    """Test that without sampled clips the report holds no recall or latency."""
+    report = hierarchical_benchmark.compare_recall(BenchmarkConnection(), sample_size=0)
+
+    assert report["queries"] == 0
+    assert report["flat_recall"] is None
+    assert report["hierarchical_p95_ms"] is None
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+import projection_refresh
+from mock_data import RolloutDatabase
+from vector_adapter import to_vector_text
+
+EMBEDDINGS = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+
+
+@pytest.fixture
+def database():
+    """Three segments projected by active version 1, and a fitted version 2"""
+    database = RolloutDatabase()
+    database.add_projection(1, np.zeros(3), np.eye(3)[:2], active=True)
+    database.add_projection(2, np.zeros(3), np.eye(3)[1:])
+    for embedding in EMBEDDINGS:
+        database.add_segment(
+            embedding,
+            coarse_embedding=to_vector_text(embedding[:2]),
+            projection_version=1,
+        )
+    with patch.object(projection_refresh, "execute_values", database.execute_values):
+        yield database
+
+
+def test_backfill_stages_without_touching_the_active_projection(database):
+    """Test that backfill -> search -> activate keeps every segment searchable."""
+    conn = database.connect()
+
+    result = projection_refresh.backfill(conn, version=2, batch_size=2)
+
+    assert result == {"version": 2, "projected": 3, "last_id": 3, "done": True}
+    assert database.coarse_search_ids() == [1, 2, 3]
+    assert all(row["projection_version"] == 1 for row in database.segments.values())
+
+    # Stored by ingest with the active version between backfill and activate
+    database.add_segment(
+        [0.0, 0.6, 0.8],
+        coarse_embedding=to_vector_text([0.0, 0.6]),
+        projection_version=1,
+    )
+    result = projection_refresh.activate(conn, version=2)
+
+    assert result == {"version": 2, "activated_segments": 4, "late_segments": 1}
+    assert database.active_version(database.projections) == 2
+    assert database.coarse_search_ids() == [1, 2, 3, 4]
+    assert database.segments[4]["coarse_embedding"] == (
+        to_vector_text([0.6, 0.8])
+    )
+    assert database.lock_modes == ["SHARE ROW EXCLUSIVE MODE"]
+    assert all(
+        row["staged_coarse_embedding"] is None for row in database.segments.values()
+    )
+
+
+def test_activate_refuses_while_too_many_segments_are_unprojected(database):
+    """Test that activate changes nothing while the backfill is unfinished."""
+    conn = database.connect()
+    projection_refresh.backfill(conn, version=2, batch_size=1, max_batches=1)
+
+    with pytest.raises(ValueError):
+        projection_refresh.activate(conn, version=2, max_late_segments=1)
+
+    assert database.active_version(database.projections) == 1
+    assert database.coarse_search_ids() == [1, 2, 3]
+    assert database.segments[1]["staged_projection_version"] == 2
+    assert database.segments[2]["staged_projection_version"] is None
+
+
+def test_backfill_resumes_after_the_last_id(database):
+    """Test that a backfill cut short by max_batches resumes where it stopped."""
+    conn = database.connect()
+
+    first = projection_refresh.backfill(conn, version=2, batch_size=2, max_batches=1)
+    rest = projection_refresh.backfill(conn, version=2, after_id=first["last_id"])
+
+    assert first == {"version": 2, "projected": 2, "last_id": 2, "done": False}
+    assert rest == {"version": 2, "projected": 1, "last_id": 3, "done": True}
+
+
+def test_unknown_versions_are_rejected(database):
+    """Test that backfill and activate refuse a version that was never fitted."""
+    conn = database.connect()
+
+    with pytest.raises(ValueError):
+        projection_refresh.backfill(conn, version=9)
+    with pytest.raises(ValueError):
+        projection_refresh.activate(conn, version=9)
+
+
+def test_fit_streams_a_float32_sample_into_an_inactive_version(database):
+    """Test that fit() samples float32 embeddings and stores an inactive version."""
+    conn = database.connect()
+    sample = projection_refresh.sample_embeddings(conn, sample_size=2)
+
+    result = projection_refresh.fit(conn, sample_size=3, dimensions=2)
+
+    assert sample.dtype == np.float32
+    np.testing.assert_array_equal(sample, EMBEDDINGS[:2])
+    assert result["version"] == 3
+    assert result["sample_size"] == 3
+    assert database.projections[3]["activated_at"] is None
+    assert len(database.projections[3]["components"]) == 2
+    assert database.active_version(database.projections) == 1
+    with pytest.raises(ValueError):
+        projection_refresh.fit(conn, sample_size=3, dimensions=3)
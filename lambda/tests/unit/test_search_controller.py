@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import MagicMock
+from pydantic import ValidationError
+
+
+@pytest.fixture
+def controller(search_controller):
+    """A SearchController with an in-process search engine, on mock services"""
+    embed_service = MagicMock()
+    embed_service.extract_text_embedding.return_value = [0.1, 0.2, 0.3]
+    vector_db_service = MagicMock()
+    vector_db_service.create_search_session.return_value = ("database", 1)
+    vector_db_service.store_search_session.return_value = ("engine", 1)
+    search_engine = MagicMock()
+    search_engine.rank.return_value = {
+        "segment_ids": [1],
+        "similarities": [0.9],
+        "query_indexes": None,
+    }
+    return search_controller.SearchController(
+        embed_service, vector_db_service, search_engine=search_engine
+    )
+
+
+def test_search_engine_ranks_plain_searches(search_controller, controller):
+    """Test that a search without database-only parameters uses the engine."""
+    request = search_controller.SearchRequest(query_text="a cat", min_similarity=0.3)
+
+    session_token = controller.text_search(request)
+
+    assert session_token == "engine"
+    controller.search_engine.rank.assert_called_once_with(
+        embedding=[0.1, 0.2, 0.3], filter=None, min_similarity=0.3
+    )
+    controller.vector_db_service.create_search_session.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "field, value, param",
+    [
+        ("search_mode", "ivf", "search_mode"),
+        ("oversample", 4, "oversample"),
+        ("nprobe", 2, "nprobe"),
+        ("search_strategy", "exact", "strategy"),
+        ("group_by", "video", None),
+    ],
+)
+def test_database_only_parameters_bypass_the_search_engine(
+    search_controller, controller, field, value, param
+):
+    """Test that parameters the engine would ignore send the search to the database."""
+    request = search_controller.SearchRequest(query_text="a cat", **{field: value})
+
+    session_token = controller.text_search(request)
+
+    assert session_token == "database"
+    controller.search_engine.rank.assert_not_called()
+    if param:
+        create_search_session = controller.vector_db_service.create_search_session
+        assert create_search_session.call_args.kwargs[param] == value
+
+
+@pytest.mark.parametrize(
+    "filter",
+    [
+        {"modality": "video"},
+        {"scope": ["clip", "scene"]},
+        {"modality": ["audio"], "scope": "frame"},
+    ],
+)
+def test_filter_outside_the_partitions_is_rejected(search_controller, filter):
+    """Test that a modality or scope no partition holds fails validation."""
+    with pytest.raises(ValidationError, match="filter"):
+        search_controller.SearchRequest(query_text="a cat", filter=filter)
+
+
+def test_filter_within_the_partitions_is_accepted(search_controller):
+    """Test that known modalities and scopes, alone or in lists, pass validation."""
+    filter = {"modality": ["visual-text", "audio"], "scope": "clip", "video_id": [1]}
+
+    request = search_controller.SearchRequest(query_text="a cat", filter=filter)
+
+    assert request.get_search_params()["filter"] == filter
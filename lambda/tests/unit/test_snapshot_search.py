@@ -0,0 +1,332 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+
+
+class FakeDatabase:
+    """The videos and video_segments rows the snapshot engine reads"""
+
+    def __init__(self):
+        self.videos = {}
+        self.segments = []
+        self.deletions = []
+        self.last_deletion_id = 0
+        self.consumers = {}
+        self.queries = []
+        self.now = datetime(2024, 1, 2)
+
+    def add_video(self, video_id, embeddings, modality="visual-text", scope="clip"):
+        self.videos[video_id] = {
+            "video_id": video_id,
+            "s3_bucket": "bucket",
+            "s3_key": f"video-{video_id}.mp4",
+            "filename": f"video-{video_id}.mp4",
+            "duration": 60.0,
+            "created_at": datetime(2024, 1, 1),
+            "updated_at": datetime(2024, 1, 1),
+            "height": 720,
+            "width": 1280,
+        }
+        for index, embedding in enumerate(embeddings):
+            values = np.asarray(embedding, dtype=np.float32)
+            self.segments.append(
+                (
+                    len(self.segments) + 1,
+                    video_id,
+                    modality,
+                    scope,
+                    index * 6.0,
+                    (index + 1) * 6.0,
+                    values / np.linalg.norm(values),
+                )
+            )
+
+    def delete_video(self, video_id):
+        self.videos.pop(video_id)
+        self.segments = [row for row in self.segments if row[1] != video_id]
+        self.log_deletion(video_id, None)
+
+    def delete_segment(self, segment_id):
+        """A segment deleted while its video stays, as a re-ingest does"""
+        (row,) = [row for row in self.segments if row[0] == segment_id]
+        self.segments.remove(row)
+        self.log_deletion(row[1], segment_id)
+
+    def log_deletion(self, video_id, segment_id):
+        self.last_deletion_id += 1
+        self.deletions.append((self.last_deletion_id, video_id, segment_id))
+
+    def update_video(self, video_id, **columns):
+        self.now += timedelta(minutes=1)
+        self.videos[video_id].update(columns, updated_at=self.now)
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.closed = 0
+        self.commits = 0
+
+    def cursor(self, cursor_factory=None):
+        if self.closed:
+            raise RuntimeError("connection already closed")
+        return FakeCursor(self.database)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        if self.closed:
+            raise RuntimeError("connection already closed")
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        database = self.database
+        database.queries.append(query)
+        if query.startswith("DELETE FROM video_deletions"):
+            watermark = min(
+                (consumer[0] for consumer in database.consumers.values()),
+                default=None,
+            )
+            database.deletions = [
+                row
+                for row in database.deletions
+                if watermark is None or row[0] > watermark
+            ]
+        elif query.startswith("DELETE FROM snapshot_consumers"):
+            cutoff = database.now - timedelta(seconds=params[0])
+            database.consumers = {
+                consumer_id: consumer
+                for consumer_id, consumer in database.consumers.items()
+                if consumer[1] >= cutoff
+            }
+        elif query.startswith("INSERT INTO snapshot_consumers"):
+            consumer_id, watermark = params
+            database.consumers[consumer_id] = (watermark, database.now)
+        elif query.startswith("UPDATE snapshot_consumers"):
+            watermark, consumer_id = params
+            self.rowcount = int(consumer_id in database.consumers)
+            if self.rowcount:
+                database.consumers[consumer_id] = (watermark, database.now)
+        elif query.startswith("SELECT id FROM video_segments"):
+            self.rows = [(row[0],) for row in database.segments if row[0] <= params[0]]
+        elif "WHERE updated_at >" in query:
+            self.rows = [
+                dict(video)
+                for video in database.videos.values()
+                if video["updated_at"] > params[0]
+            ]
+        elif "FROM video_segments" in query:
+            watermark, limit = params
+            rows = [row for row in self.database.segments if row[0] > watermark]
+            self.rows = rows[:limit]
+        elif "FROM videos" in query:
+            video_ids = params[0] if params else list(self.database.videos)
+            self.rows = [
+                dict(self.database.videos[video_id])
+                for video_id in video_ids
+                if video_id in self.database.videos
+            ]
+        elif "MAX(id)" in query:
+            self.rows = [(self.database.last_deletion_id,)]
+        elif "FROM video_deletions" in query:
+            self.rows = [row for row in self.database.deletions if row[0] > params[0]]
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeService:
+    """The parts of VectorDBService the engine uses"""
+
+    default_page_limit = 10
+    default_min_similarity = 0.2
+    search_session_max_candidates = 200
+
+    def __init__(self, database):
+        self.database = database
+        self.conn = database.connect()
+        self.reconnects = 0
+
+    def reconnect_if_closed(self):
+        if self.conn.closed:
+            self.conn = self.database.connect()
+            self.reconnects += 1
+
+
+@pytest.fixture
+def snapshot_search(vector_database_layer):
+    return vector_database_layer("snapshot_search")
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.add_video(1, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    database.add_video(2, [[0.9, 0.1, 0.0]])
+    return database
+
+
+def test_engine_ranks_snapshot_segments(snapshot_search, database):
+    """Test that the engine loads every segment and ranks it like the database."""
+    engine = snapshot_search.SnapshotSearchEngine(FakeService(database))
+
+    results = engine.find_similar([1.0, 0.0, 0.0])
+
+    assert [result["id"] for result in results] == [1, 3]
+    assert results[0]["similarity"] == pytest.approx(1.0)
+    assert engine.last_search_plan["search_mode"] == "snapshot"
+
+
+def test_refresh_follows_reconnect(snapshot_search, database):
+    """Test that a refresh after a reconnect reads through the new connection."""
+    service = FakeService(database)
+    engine = snapshot_search.SnapshotSearchEngine(service, refresh_interval=0)
+    service.conn.closed = 2
+
+    database.add_video(3, [[0.0, 0.0, 1.0]])
+    results = engine.find_similar([0.0, 0.0, 1.0])
+
+    assert service.reconnects == 1
+    assert engine.conn is service.conn
+    assert [result["video"]["id"] for result in results] == [3]
+
+
+def test_failed_refresh_keeps_serving(snapshot_search, database):
+    """Test that a refresh failing on a dead connection does not fail the search."""
+    service = FakeService(database)
+    engine = snapshot_search.SnapshotSearchEngine(service, refresh_interval=0)
+    service.conn.closed = 2
+    service.reconnect_if_closed = lambda: None
+
+    results = engine.find_similar([1.0, 0.0, 0.0])
+
+    assert [result["id"] for result in results] == [1, 3]
+
+
+def test_refresh_tombstones_deleted_videos(snapshot_search, database):
+    """Test that segments of deleted videos stop matching after a refresh."""
+    engine = snapshot_search.SnapshotSearchEngine(
+        FakeService(database), refresh_interval=0
+    )
+
+    database.delete_video(2)
+    results = engine.find_similar([1.0, 0.0, 0.0])
+
+    assert [result["video"]["id"] for result in results] == [1]
+
+
+def test_refresh_reads_only_changed_videos(snapshot_search, database):
+    """Test that a refresh loads the metadata of new videos, not the whole table."""
+    engine = snapshot_search.SnapshotSearchEngine(
+        FakeService(database), refresh_interval=0
+    )
+    database.queries.clear()
+
+    database.add_video(3, [[0.0, 0.0, 1.0]])
+    database.delete_video(1)
+    results = engine.find_similar([0.0, 0.0, 1.0], min_similarity=-1.0)
+
+    video_queries = [query for query in database.queries if "FROM videos" in query]
+    assert video_queries and all("WHERE" in query for query in video_queries)
+    assert sorted(engine.videos) == [2, 3]
+    assert {result["video"]["id"] for result in results} == {2, 3}
+
+
+def test_refresh_tombstones_segments_of_videos_deleted_during_load(
+    snapshot_search, database
+):
+    """Test that new segments whose video is gone by the metadata read are dropped."""
+    engine = snapshot_search.SnapshotSearchEngine(
+        FakeService(database), refresh_interval=0
+    )
+
+    database.add_video(3, [[0.0, 0.0, 1.0]])
+    database.videos.pop(3)
+    results = engine.find_similar([0.0, 0.0, 1.0], min_similarity=-1.0)
+
+    assert 3 not in {result["video"]["id"] for result in results}
+
+
+def test_refresh_tombstones_deleted_segments(snapshot_search, database):
+    """Test that segments deleted while their video stays stop matching."""
+    engine = snapshot_search.SnapshotSearchEngine(
+        FakeService(database), refresh_interval=0
+    )
+
+    database.delete_segment(1)
+    results = engine.find_similar([1.0, 0.0, 0.0], min_similarity=-1.0)
+
+    assert [result["id"] for result in results] == [3, 2]
+    assert sorted(engine.videos) == [1, 2]
+
+
+def test_refresh_reloads_updated_videos(snapshot_search, database):
+    """Test that a refresh picks up the metadata of videos updated since the last."""
+    engine = snapshot_search.SnapshotSearchEngine(
+        FakeService(database), refresh_interval=0
+    )
+
+    database.update_video(2, filename="renamed.mp4")
+    results = engine.find_similar([0.9, 0.1, 0.0], limit=1)
+
+    assert results[0]["video"]["filename"] == "renamed.mp4"
+
+
+def test_refresh_prunes_deletions_every_engine_has_applied(snapshot_search, database):
+    """Test that video_deletions keeps the rows an engine has not applied yet."""
+    first, second = (
+        snapshot_search.SnapshotSearchEngine(FakeService(database)) for _ in range(2)
+    )
+    database.delete_video(2)
+
+    first.refresh(force=True)
+    first.refresh(force=True)
+
+    assert [row[1] for row in database.deletions] == [2]
+
+    second.refresh(force=True)
+    second.refresh(force=True)
+
+    assert database.deletions == []
+    assert first.deletion_watermark == second.deletion_watermark == 1
+
+
+def test_idle_engine_reloads_after_its_deletions_were_pruned(
+    snapshot_search, database
+):
+    """Test that an engine dropped from snapshot_consumers compares with the tables."""
+    idle, active = (
+        snapshot_search.SnapshotSearchEngine(FakeService(database)) for _ in range(2)
+    )
+    database.delete_segment(3)
+    database.now += timedelta(hours=2)
+    active.refresh(force=True)
+    active.refresh(force=True)
+
+    assert database.deletions == []
+    assert list(database.consumers) == [active.consumer_id]
+
+    idle.refresh(force=True)
+    results = idle.find_similar([1.0, 0.0, 0.0], min_similarity=-1.0)
+
+    assert [result["id"] for result in results] == [1, 2]
+    assert idle.consumer_id in database.consumers
@@ -0,0 +1,57 @@
+import numpy as np
+import psycopg2
+import pytest
+from psycopg2.extensions import adapt
+
+from vector_adapter import Vector, parse_vector, to_vector_text
+
+
+def test_vector_is_sent_as_untyped_literal():
+    """Test that a Vector becomes a quoted pgvector literal."""
+    vector = Vector([0.5, -0.25, 1.0])
+
+    assert adapt(vector).getquoted() == b"'[0.5,-0.25,1]'"
+
+
+def test_vector_text_round_trips_float32():
+    """Test that the literal keeps every float32 digit."""
+    values = np.random.default_rng(0).normal(size=64).astype(np.float32)
+
+    parsed = parse_vector(to_vector_text(values))
+
+    assert parsed.dtype == np.float32
+    np.testing.assert_array_equal(parsed, values)
+
+
+def test_vector_list_is_sent_as_array_of_literals():
+    """Test that a list of Vectors becomes an ARRAY for ::vector[] parameters."""
+    vectors = [Vector([1.0, 0.0]), Vector([0.0, 1.0])]
+
+    assert adapt(vectors).getquoted() == b"ARRAY['[1,0]','[0,1]']"
+
+
+def test_plain_arrays_keep_psycopg2_adaptation():
+    """Test that numpy arrays and lists are not turned into vector literals."""
+    assert adapt([1, 2]).getquoted() == b"ARRAY[1,2]"
+    with pytest.raises(psycopg2.ProgrammingError):
+        adapt(np.array([1, 2]))
+
+
+def test_vector_acts_as_array():
+    """Test that numpy code can use a Vector as the array it wraps."""
+    vector = Vector([3.0, 4.0])
+
+    assert np.linalg.norm(vector) == 5.0
+    assert np.asarray(vector, dtype=np.float64).dtype == np.float64
+    assert len(vector) == 2
+
+
+def test_vector_rejects_matrices():
+    """Test that only one-dimensional embeddings can be wrapped."""
+    with pytest.raises(ValueError):
+        Vector([[1.0, 0.0], [0.0, 1.0]])
+
+
+def test_parse_vector_handles_null():
+    """Test that NULL columns stay None."""
+    assert parse_vector(None) is None
@@ -0,0 +1,1178 @@
+import json
+import re
+import numpy as np
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from psycopg2.errors import InFailedSqlTransaction, InvalidSqlStatementName
+
+# Estimated rows per table and partition index, as get_table_stats returns them
+TABLE_STATS = {
+    "videos": 1000,
+    "video_segments": 400000,
+    "video_segments_visual_text_clip_ann_idx": 100000,
+    "video_segments_visual_text_video_ann_idx": 100000,
+    "video_segments_audio_clip_ann_idx": 100000,
+    "video_segments_audio_video_ann_idx": 100000,
+}
+
+
+@pytest.fixture
+def vector_db_service(vector_database_layer):
+    return vector_database_layer("vector_db_service")
+
+
+@pytest.fixture
+def service(vector_db_service):
+    """A VectorDBService on a mock connection, with fixed table statistics"""
+    with patch.object(
+        vector_db_service.VectorDBService,
+        "get_connection",
+        return_value=MagicMock(closed=0),
+    ):
+        service = vector_db_service.VectorDBService({}, scan_mode=None)
+    service.get_table_stats = lambda: TABLE_STATS
+    return service
+
+
+# The (modality, scope) partition predicates of a search's index scans
+PARTITION_PREDICATE = re.compile(r"modality = '([\w-]+)' AND scope = '(\w+)'")
+
+
+class SegmentDatabase:
+    """
+    In-memory videos and video_segments behind the service's connection.
+    Searches, search sessions and ingest are answered from the statements'
+    parameters, as Postgres would answer them; the partitions a search scans
+    are read from its partition predicates.
+    """
+
+    def __init__(self):
+        self.videos = {}
+        self.segments = []
+        self.sessions = {}
+        self.settings = {}
+        # Statements other than set_config, as (query, params)
+        self.statements = []
+        self.inserted_segments = []
+        # The projection and clustering versions ingest finds active
+        self.active_versions = (None, None)
+        self.rows = []
+
+    def add_segment(
+        self, video_id, embedding, modality="visual-text", scope="clip", start_time=0.0
+    ):
+        self.videos.setdefault(
+            video_id,
+            {
+                "video_id": video_id,
+                "s3_bucket": "bucket",
+                "s3_key": f"{video_id}.mp4",
+                "filename": f"{video_id}.mp4",
+                "duration": 60.0,
+                "created_at": datetime(2024, 1, 1),
+                "updated_at": datetime(2024, 1, 1),
+                "height": 720,
+                "width": 1280,
+            },
+        )
+        values = np.asarray(embedding, dtype=np.float32)
+        self.segments.append(
+            {
+                "segment_id": len(self.segments) + 1,
+                "video_id": video_id,
+                "modality": modality,
+                "scope": scope,
+                "start_time": start_time,
+                "end_time": start_time + 6.0,
+                "embedding": values / np.linalg.norm(values),
+            }
+        )
+
+    def execute(self, query, params=None):
+        if query.startswith("SELECT set_config"):
+            self.settings.update(zip(params[::2], params[1::2]))
+            return
+        self.statements.append((query, params))
+        named = params if isinstance(params, dict) else {}
+        statement = " ".join(query.split())
+        if "ttl" in named:
+            self.rows = [self._store_session(query, named)]
+        elif "session_token" in named:
+            self.rows = self._session_page(query, named)
+        elif "limit" in named:
+            ranked = self._rank(query, named)
+            self.rows = ranked[named["offset"] : named["offset"] + named["limit"]]
+        elif statement.startswith("INSERT INTO videos"):
+            self.rows = [{"id": max(self.videos, default=0) + 1}]
+        elif statement.startswith("LOCK TABLE"):
+            self.rows = []
+        else:
+            self.rows = [self.active_versions]
+
+    def executemany(self, query, rows):
+        self.statements.append((query, rows))
+        self.inserted_segments.extend(rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def _rank(self, query, params):
+        """The segments within the distance bound, nearest first"""
+        partitions = set(PARTITION_PREDICATE.findall(query))
+        video_ids = params.get("video_ids")
+        batch = "embeddings" in params
+        queries = (
+            enumerate(params["embeddings"]) if batch else [(0, params["embedding"])]
+        )
+        matches = {}
+        for query_index, embedding in queries:
+            candidates = sorted(
+                (-float(segment["embedding"] @ np.asarray(embedding)), index)
+                for index, segment in enumerate(self.segments)
+                if (segment["modality"], segment["scope"]) in partitions
+                and (video_ids is None or segment["video_id"] in video_ids)
+            )[: params["candidate_limit"]]
+            for distance, index in candidates:
+                if distance < params["max_distance"]:
+                    matches.setdefault(index, []).append((distance, query_index))
+
+        ranked = []
+        for index, hits in matches.items():
+            hits.sort()
+            segment = self.segments[index]
+            ranked.append(
+                (
+                    hits[0][0],
+                    segment["video_id"],
+                    self._result_row(
+                        segment,
+                        -hits[0][0],
+                        [query_index for _, query_index in hits] if batch else None,
+                    ),
+                )
+            )
+        return [row for _, _, row in sorted(ranked, key=lambda hit: hit[:2])]
+
+    def _store_session(self, query, params):
+        if "segment_ids" in params:
+            query_indexes = params["query_indexes"]
+            ranking = list(
+                zip(
+                    params["segment_ids"],
+                    params["similarities"],
+                    json.loads(query_indexes)
+                    if query_indexes
+                    else [None] * len(params["segment_ids"]),
+                )
+            )
+        else:
+            limit = params.get("max_candidates", params["candidate_limit"])
+            ranking = [
+                (row["segment_id"], row["similarity"], row["query_indexes"])
+                for row in self._rank(query, params)[:limit]
+            ]
+        session_token = f"session-{len(self.sessions) + 1}"
+        self.sessions[session_token] = ranking
+        return {"session_token": session_token, "total": len(ranking)}
+
+    def _session_page(self, query, params):
+        ranking = self.sessions.get(params["session_token"])
+        if ranking is None:
+            return []
+        if "AS grouped" in query:
+            return [{"grouped": False}]
+        page = ranking[params["offset"] : params["offset"] + params["limit"]]
+        if not page:
+            return [{"session_total": len(ranking), "segment_id": None}]
+        return [
+            {
+                **self._result_row(
+                    self.segments[segment_id - 1], similarity, query_indexes
+                ),
+                "fused_score": None,
+                "session_total": len(ranking),
+            }
+            for segment_id, similarity, query_indexes in page
+        ]
+
+    def _result_row(self, segment, similarity, query_indexes):
+        return {
+            **self.videos[segment["video_id"]],
+            **{
+                key: segment[key]
+                for key in ["segment_id", "modality", "scope", "start_time", "end_time"]
+            },
+            "similarity": similarity,
+            "query_indexes": query_indexes,
+        }
+
+
+@pytest.fixture
+def database(service):
+    """
+    A SegmentDatabase behind the service's connection, which sends its
+    statements as text as with prepared statements off
+    """
+    database = SegmentDatabase()
+    service.prepared_statements = False
+    service.conn.cursor.return_value.__enter__.return_value = database
+    return database
+
+
+def test_ann_search_for_no_videos_uses_smallest_scan(service):
+    """Test that an ANN plan for an empty video_id filter does not divide by zero."""
+    plan = service._plan_search({"video_id": []}, strategy="ann")
+
+    settings = service._search_settings(20, plan)
+
+    assert plan["selectivity"] == 0.0
+    assert settings == {"hnsw.ef_search": str(service.ef_search_min)}
+
+
+def test_plan_answers_narrow_filter_exactly(service):
+    """Test that auto plans an exact scan when the filter keeps a sliver of rows."""
+    plan = service._plan_search({"video_id": [1, 2]})
+
+    assert plan["strategy"] == "exact"
+    assert plan["search_mode"] == "hnsw"
+    assert service._search_settings(20, plan) == {"enable_indexscan": "off"}
+
+
+def test_plan_uses_index_for_unfiltered_search(service):
+    """Test that auto keeps the ANN index when every row can match."""
+    plan = service._plan_search(None)
+
+    assert plan["strategy"] == "ann"
+    assert plan["estimated_rows"] == 400000
+    assert service._search_settings(20, plan) == {
+        "hnsw.ef_search": str(service.ef_search_min)
+    }
+
+
+def test_ef_search_grows_with_filter_selectivity(service):
+    """Test that ef_search covers the rows a video_id filter discards, up to the cap."""
+    half = service._plan_search({"video_id": list(range(500))}, strategy="ann")
+    tenth = service._plan_search({"video_id": list(range(100))}, strategy="ann")
+
+    assert service._search_settings(100, half) == {"hnsw.ef_search": "200"}
+    assert service._search_settings(200, tenth) == {
+        "hnsw.ef_search": str(service.ef_search_max)
+    }
+
+
+def test_iterative_scan_mode_settings(service):
+    """Test that an iterative scan mode bounds the scan by max_scan_tuples."""
+    plan = service._plan_search(None)
+
+    settings = service._search_settings(20, plan, scan_mode="relaxed")
+
+    assert settings["hnsw.iterative_scan"] == "relaxed_order"
+    assert settings["hnsw.max_scan_tuples"] == str(service.max_scan_tuples)
+    with pytest.raises(ValueError):
+        service._search_settings(20, plan, scan_mode="unknown")
+
+
+def test_plan_rejects_unknown_strategy(service):
+    """Test that an unknown strategy is refused."""
+    with pytest.raises(ValueError):
+        service._plan_search(None, strategy="fastest")
+
+
+def test_min_similarity_bounds_candidates_outside_index_scan(service):
+    """Test that the threshold filters the ordered candidates, not the HNSW scan."""
+    query_params = {
+        "embedding": [1.0, 0.0],
+        "candidate_limit": 10,
+        "max_distance": service._similarity_to_distance(0.4),
+    }
+
+    ranked_query = service._ranked_segments_query(None, query_params, batch=False)
+    scan_query = service._nearest_segments_query(None, dict(query_params))
+
+    assert query_params["max_distance"] == -0.4
+    assert "max_distance" not in scan_query
+    lateral = ranked_query.index("CROSS JOIN LATERAL")
+    assert ranked_query.index("candidates.distance < %(max_distance)s") > lateral
+
+
+def test_min_similarity_leaves_scan_settings_unchanged(service):
+    """Test that a higher threshold only changes the bound, not the scan."""
+    with patch.object(service, "_fetch_ranked_page") as fetch_ranked_page:
+        service.find_similar([1.0, 0.0], min_similarity=0.2)
+        service.find_similar([1.0, 0.0], min_similarity=0.9)
+
+    (low, low_params, *_), _ = fetch_ranked_page.call_args_list[0]
+    (high, high_params, *_), _ = fetch_ranked_page.call_args_list[1]
+    assert low == high
+    assert low_params["index_scan_limit"] == high_params["index_scan_limit"]
+    assert (low_params["max_distance"], high_params["max_distance"]) == (-0.2, -0.9)
+
+
+def add_fan(database, angles, **segment):
+    """Add one unit-length segment per angle, each of its own video"""
+    for video_id, angle in enumerate(angles, start=1):
+        database.add_segment(video_id, [np.cos(angle), np.sin(angle)], **segment)
+
+
+def test_find_similar_pages_through_the_nearest_segments(service, database):
+    """Test that pages hold the nearest segments in order, joined to their video."""
+    add_fan(database, [0.0, 0.2, 0.4, 0.6, 1.4])
+
+    pages = [
+        service.find_similar([1.0, 0.0], page=page, limit=2, min_similarity=0.5)
+        for page in range(3)
+    ]
+
+    assert [[result["id"] for result in page] for page in pages] == [[1, 2], [3, 4], []]
+    third = pages[1][0]
+    assert third["similarity"] == pytest.approx(np.cos(0.4))
+    assert third["video"]["filename"] == "3.mp4"
+    assert "query_indexes" not in third
+
+
+def test_short_page_under_a_threshold_is_the_last(service, database):
+    """Test that a threshold only shortens the page where similar segments run out."""
+    add_fan(database, [0.0, 0.1, 0.2, 1.0, 1.2])
+
+    first = service.find_similar([1.0, 0.0], limit=4, min_similarity=0.9)
+    second = service.find_similar([1.0, 0.0], page=1, limit=4, min_similarity=0.9)
+    _, total = service.create_search_session(
+        embedding=[1.0, 0.0], min_similarity=0.9, max_candidates=4
+    )
+
+    assert [result["id"] for result in first] == [1, 2, 3]
+    assert second == []
+    assert total == 3
+
+
+def test_find_similar_batch_merges_hits_per_segment(service, database):
+    """Test that a batch is one statement reporting each segment once, at its best."""
+    database.add_segment(1, [1.0, 0.0])
+    database.add_segment(2, [0.0, 1.0])
+    database.add_segment(3, [0.6, 0.8])
+
+    results = service.find_similar_batch([[1.0, 0.0], [0.0, 1.0]], min_similarity=0.5)
+
+    assert len(database.statements) == 1
+    assert [(result["id"], result["query_indexes"]) for result in results] == [
+        (1, [0]),
+        (2, [1]),
+        (3, [1, 0]),
+    ]
+    assert results[2]["similarity"] == pytest.approx(0.8)
+
+
+def test_filtered_search_scans_only_its_partition(service, database):
+    """Test that a modality and scope filter searches that partition alone."""
+    database.add_segment(1, [1.0, 0.0])
+    database.add_segment(1, [1.0, 0.0], modality="audio")
+    database.add_segment(1, [1.0, 0.0], modality="audio", scope="video")
+
+    results = service.find_similar(
+        [1.0, 0.0], filter={"modality": "audio", "scope": "clip"}
+    )
+
+    assert [(result["modality"], result["scope"]) for result in results] == [
+        ("audio", "clip")
+    ]
+    assert service.last_search_plan["estimated_rows"] == 100000
+
+
+def test_scan_mode_runs_the_search_as_an_iterative_scan(service, database):
+    """Test that a scan mode is applied to the search's transaction."""
+    add_fan(database, [0.0, 0.3])
+
+    results = service.find_similar([1.0, 0.0], scan_mode="strict")
+
+    assert len(results) == 2
+    assert database.settings["hnsw.iterative_scan"] == "strict_order"
+    assert database.settings["hnsw.max_scan_tuples"] == str(service.max_scan_tuples)
+
+
+def test_narrow_filter_is_answered_by_an_exact_scan(service, database):
+    """Test that a filter keeping few rows turns the index scan off."""
+    add_fan(database, [0.0, 0.3, 0.6])
+
+    results = service.find_similar([1.0, 0.0], filter={"video_id": [2]})
+
+    assert [result["video"]["id"] for result in results] == [2]
+    assert database.settings == {"enable_indexscan": "off"}
+
+
+def test_unknown_embedding_storage_is_rejected(vector_db_service):
+    """Test that only the vector and halfvec column types can be configured."""
+    with pytest.raises(ValueError):
+        vector_db_service.VectorDBService({}, embedding_storage="float16")
+
+
+def test_binary_search_reranks_an_oversample_of_candidates(service, database):
+    """Test that binary mode takes oversample times the results as candidates."""
+    add_fan(database, [0.0, 0.3])
+
+    results = service.find_similar(
+        [1.0, 0.0], limit=5, search_mode="binary", strategy="ann"
+    )
+    service.find_similar(
+        [1.0, 0.0], limit=5, search_mode="binary", oversample=2, strategy="ann"
+    )
+
+    (_, default), (_, oversampled) = database.statements
+    assert default["index_scan_limit"] == 5 * service.default_oversample["binary"]
+    assert oversampled["index_scan_limit"] == 10
+    assert [result["id"] for result in results] == [1, 2]
+    assert service.last_search_plan["search_mode"] == "binary"
+
+
+def test_coarse_search_scans_by_the_projected_query(
+    vector_db_service, service, database
+):
+    """Test that coarse mode projects the query, and falls back without a projection."""
+    service.get_active_projection = lambda: vector_db_service.EmbeddingProjection(
+        2, np.array([0.5, 0.0]), np.array([[0.0, 1.0]])
+    )
+
+    service.find_similar([0.6, 0.8], search_mode="coarse", strategy="ann")
+    ((_, params),) = database.statements
+    service.get_active_projection = lambda: None
+    service.find_similar([0.6, 0.8], search_mode="coarse", strategy="ann")
+
+    assert np.asarray(params["coarse_embedding"]).tolist() == pytest.approx([0.8])
+    assert service.last_search_plan["search_mode"] == "hnsw"
+
+
+def test_ingest_stores_the_active_projection_of_each_segment(
+    vector_db_service, service, database
+):
+    """Test that stored segments carry their projection and its version."""
+    service.get_active_projection = lambda: vector_db_service.EmbeddingProjection(
+        2, np.array([0.5, 0.0]), np.array([[1.0, 0.0]])
+    )
+    service.get_active_clustering = lambda: None
+    database.active_versions = (2, None)
+
+    service.store(
+        {
+            "s3_bucket": "bucket",
+            "s3_key": "a.mp4",
+            "filename": "a.mp4",
+            "duration": 6.0,
+        },
+        [
+            {
+                "modality": "visual-text",
+                "scope": "clip",
+                "start_time": 0.0,
+                "end_time": 6.0,
+                "embedding": [0.6, 0.8],
+            }
+        ],
+    )
+
+    ((video_id, *_, embedding, coarse_embedding, version, _, _),) = (
+        database.inserted_segments
+    )
+    assert video_id == 1
+    assert np.asarray(embedding).tolist() == pytest.approx([0.6, 0.8])
+    assert np.asarray(coarse_embedding).tolist() == pytest.approx([0.1])
+    assert version == 2
+
+
+def test_hierarchical_search_scans_enough_candidates_for_its_videos(
+    service, database
+):
+    """Test that hierarchical mode sizes its scan for the prefiltered videos."""
+    for hierarchical_videos in [5, 50]:
+        service.hierarchical_videos = hierarchical_videos
+        service.find_similar(
+            [1.0, 0.0], limit=10, search_mode="hierarchical", strategy="ann"
+        )
+
+    scans = [
+        (params["hierarchical_videos"], params["index_scan_limit"])
+        for _, params in database.statements
+    ]
+    assert scans == [(5, 10), (50, 50)]
+
+
+def test_page_cursor_round_trips(vector_db_service):
+    """Test that a cursor decodes to the keyset position it was made from."""
+    row = {"created_at": datetime(2024, 5, 1, 12, 30, 15, 250), "id": 42}
+
+    cursor = vector_db_service.encode_page_cursor(row)
+
+    assert vector_db_service.decode_page_cursor(cursor) == (row["created_at"], 42)
+
+
+@pytest.mark.parametrize("cursor", ["bad", "e30=", "bm90IGpzb24=", "WzEsIDJd"])
+def test_malformed_page_cursor_is_rejected(vector_db_service, cursor):
+    """Test that cursors which are not an encoded position raise ValueError."""
+    with pytest.raises(ValueError):
+        vector_db_service.decode_page_cursor(cursor)
+
+
+def test_keyset_page_starts_after_cursor(vector_db_service, service):
+    """Test that a cursor replaces the offset and the next cursor marks the last row."""
+    service.prepared_statements = False
+    db_cursor = service.conn.cursor.return_value.__enter__.return_value
+    rows = [
+        {"id": row_id, "created_at": datetime(2024, 1, row_id)} for row_id in (3, 2, 1)
+    ]
+    db_cursor.fetchall.return_value = rows
+    db_cursor.fetchone.return_value = {"total": 3}
+    cursor = vector_db_service.encode_page_cursor(
+        {"id": 4, "created_at": datetime(2024, 1, 4)}
+    )
+
+    page, total, next_cursor = service._fetch_keyset_page(
+        "videos", "*", page=5, limit=2, cursor=cursor
+    )
+
+    query, params = db_cursor.execute.call_args_list[0].args
+    assert "WHERE (created_at, id) < (%(created_at)s, %(id)s)" in query
+    assert params == {
+        "limit": 3,
+        "offset": 0,
+        "created_at": datetime(2024, 1, 4),
+        "id": 4,
+    }
+    assert (page, total) == (rows[:2], 3)
+    assert vector_db_service.decode_page_cursor(next_cursor) == (
+        datetime(2024, 1, 2),
+        2,
+    )
+
+
+class KeysetCursor:
+    """A table of `count` rows, newest first, whose planner estimate is `estimate`"""
+
+    def __init__(self, count, estimate):
+        self.ids = list(range(count, 0, -1))
+        self.estimate = estimate
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        if "reltuples" in query:
+            self.rows = [{"total": self.estimate}]
+        elif "COUNT(*)" in query:
+            self.rows = [{"total": len(self.ids)}]
+        else:
+            start, stop = params["offset"], params["offset"] + params["limit"]
+            self.rows = [
+                {"id": row_id, "created_at": datetime(2024, 1, 1)}
+                for row_id in self.ids[start:stop]
+            ]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.mark.parametrize(
+    "estimate, page, expected_total",
+    [
+        # Trusted as is when the page does not contradict it
+        (100, 0, 100),
+        # Never below the rows paged past plus the rows of this page
+        (3, 2, 7),
+        # Never analyzed: -1, or 0 on older servers, fall back to COUNT
+        (-1, 0, 10),
+        (0, 0, 10),
+    ],
+)
+def test_keyset_page_total(service, estimate, page, expected_total):
+    """Test that the estimated total is raised to the rows a page shows exist."""
+    service.prepared_statements = False
+    service.conn.cursor.return_value = KeysetCursor(10, estimate)
+
+    rows, total, _ = service._fetch_keyset_page("videos", "*", page=page, limit=2)
+
+    assert total == expected_total
+    assert len(rows) == 2
+
+
+def test_hybrid_session_gates_each_list_separately(
+    vector_db_service, service, database
+):
+    """Test that vector hits need min_similarity and lexical hits the trigram match."""
+    service.create_search_session(
+        embedding=[1.0, 0.0],
+        min_similarity=0.5,
+        options=vector_db_service.SessionOptions(query_text="beach"),
+    )
+
+    settings = database.settings
+    ((query, params),) = database.statements
+    vector_list = query[: query.index("lexical_videos AS")]
+    assert "candidates.distance < %(max_distance)s" in vector_list
+    assert params["max_distance"] == -0.5
+    assert "%(query_text)s <%% filename" in query
+    assert "SUM(1.0 / (%(rrf_k)s + rank)) AS rrf_score" in query
+    assert params["rrf_k"] == service.session_settings.rrf_k
+    assert settings["pg_trgm.word_similarity_threshold"] == str(
+        service.session_settings.hybrid_lexical_threshold
+    )
+
+
+def test_modality_fusion_keeps_best_similarity(service):
+    """Test that fusion ranks by the weighted sum but keeps the best cosine."""
+    query_params = {}
+
+    query = service._modality_fusion_query(
+        {"visual-text": 0.7, "audio": 0.3}, query_params
+    )
+
+    assert "LEAST(visual.distance, MIN(audio.distance)) AS distance" in query
+    assert "%(audio_weight)s * audio.distance AS rank_distance" in query
+    assert (query_params["visual_text_weight"], query_params["audio_weight"]) == (
+        0.7,
+        0.3,
+    )
+    with pytest.raises(ValueError):
+        service._modality_fusion_query({"visual-text": 1.0, "audio": -0.5}, {})
+
+
+def test_fused_session_stores_fused_scores(vector_db_service, service, database):
+    """Test that a fused session is ordered by and stores the fused score."""
+    service.create_search_session(
+        embedding=[1.0, 0.0],
+        options=vector_db_service.SessionOptions(fuse_modalities=True),
+    )
+
+    ((query, params),) = database.statements
+    assert params["fused"] is True
+    assert "array_agg(-distance ORDER BY rank_distance, video_id)" in query
+    assert "array_agg(-rank_distance ORDER BY rank_distance, video_id)" in query
+
+
+def test_fused_score_is_reported_next_to_similarity(service):
+    """Test that page rows report a stored fused score and omit a missing one."""
+    row = {
+        "segment_id": 1,
+        "modality": "visual-text",
+        "scope": "clip",
+        "start_time": 0.0,
+        "end_time": 6.0,
+        "similarity": 0.9,
+        "fused_score": 0.6,
+        "query_indexes": None,
+        "video_id": 7,
+        "s3_bucket": "bucket",
+        "s3_key": "key",
+        "filename": "video.mp4",
+        "duration": 60.0,
+        "created_at": datetime(2024, 1, 1),
+        "updated_at": datetime(2024, 1, 1),
+        "height": 720,
+        "width": 1280,
+    }
+
+    fused, plain = service._normalize_find_similar_results(
+        [row, {**row, "fused_score": None}]
+    )
+
+    assert (fused["similarity"], fused["fused_score"]) == (0.9, 0.6)
+    assert "fused_score" not in plain
+
+
+def test_diversified_fused_session_weighs_fused_score(service):
+    """Test that MMR over fused candidates ranks by fused score and stores it."""
+    cursor = MagicMock()
+    candidates = [
+        {
+            "segment_id": segment_id,
+            "similarity": similarity,
+            "fused_score": fused_score,
+            "query_indexes": None,
+            "embedding": embedding,
+        }
+        for segment_id, similarity, fused_score, embedding in [
+            (1, 0.9, 0.4, [1.0, 0.0]),
+            (2, 0.8, 0.7, [0.0, 1.0]),
+        ]
+    ]
+
+    service._store_diversified_session(cursor, candidates, 0.0, 2, 60, False)
+
+    params = cursor.execute.call_args.args[1]
+    assert params["segment_ids"] == [2, 1]
+    assert params["similarities"] == [0.8, 0.9]
+    assert params["fused_scores"] == [0.7, 0.4]
+
+
+def test_session_settings_size_the_rankings(vector_db_service, service, database):
+    """Test that session options fall back to the service's session settings."""
+    service.session_settings = vector_db_service.SessionSettings(
+        segments_per_video=2, mmr_oversample=5
+    )
+
+    service.create_search_session(
+        embedding=[1.0, 0.0],
+        max_candidates=10,
+        options=vector_db_service.SessionOptions(group_by="video"),
+    )
+    service.create_search_session(
+        embedding=[1.0, 0.0],
+        max_candidates=10,
+        options=vector_db_service.SessionOptions(
+            group_by="video", segments_per_video=4
+        ),
+    )
+
+    (_, grouped), (_, overridden) = database.statements
+
+    assert (grouped["segments_per_video"], grouped["candidate_limit"]) == (2, 20)
+    assert overridden["candidate_limit"] == 40
+
+
+def test_session_options_are_validated(vector_db_service, service):
+    """Test that conflicting or unknown session options are refused."""
+    invalid_options = [
+        vector_db_service.SessionOptions(group_by="scene"),
+        vector_db_service.SessionOptions(video_score="median"),
+        vector_db_service.SessionOptions(diversity=1.5),
+        vector_db_service.SessionOptions(group_by="video", diversity=0.5),
+    ]
+
+    for options in invalid_options:
+        with pytest.raises(ValueError):
+            service.create_search_session(embedding=[1.0, 0.0], options=options)
+    with pytest.raises(ValueError):
+        service.create_search_session(
+            embeddings=[[1.0, 0.0]],
+            options=vector_db_service.SessionOptions(query_text="beach"),
+        )
+
+
+def test_search_session_pages_are_served_from_the_stored_ranking(
+    vector_db_service, service, database
+):
+    """Test that a session ranks once and serves every page from its stored list."""
+    add_fan(database, [0.0, 0.2, 0.4])
+
+    session_token, total = service.create_search_session(embedding=[1.0, 0.0])
+    first = service.fetch_search_session_page(session_token, limit=2)
+    second = service.fetch_search_session_page(session_token, page=1, limit=2)
+    past_the_end = service.fetch_search_session_page(session_token, page=5, limit=2)
+
+    assert total == 3
+    assert [result["id"] for result in first.items] == [1, 2]
+    assert [result["id"] for result in second.items] == [3]
+    assert second.items[0]["similarity"] == pytest.approx(np.cos(0.4))
+    assert (first.total, second.total) == (3, 3)
+    assert past_the_end == vector_db_service.PaginatedResult(items=[], total=3)
+    # Only the first request searched
+    searches = [params for _, params in database.statements if "embedding" in params]
+    assert len(searches) == 1
+    assert service.fetch_search_session_page("expired-session") is None
+
+
+def test_hybrid_session_takes_its_sizes_from_the_session_settings(
+    vector_db_service, service, database
+):
+    """Test that a hybrid session runs with the configured lexical settings."""
+    service.session_settings = vector_db_service.SessionSettings(
+        hybrid_lexical_limit=5, hybrid_lexical_threshold=0.4, rrf_k=30
+    )
+
+    service.create_search_session(
+        embedding=[1.0, 0.0],
+        max_candidates=20,
+        options=vector_db_service.SessionOptions(query_text="beach"),
+    )
+
+    ((_, params),) = database.statements
+    assert params["query_text"] == "beach"
+    assert params["lexical_limit"] == 5
+    assert params["rrf_k"] == 30
+    assert params["max_candidates"] == 20
+    assert database.settings["pg_trgm.word_similarity_threshold"] == "0.4"
+
+
+def test_fusion_weights_override_the_configured_weight_of_their_modality(
+    vector_db_service, service, database
+):
+    """Test that request weights replace only the configured weights they name."""
+    service.create_search_session(
+        embedding=[1.0, 0.0],
+        options=vector_db_service.SessionOptions(
+            fuse_modalities=True, modality_weights={"audio": 0.8}
+        ),
+    )
+    with pytest.raises(ValueError):
+        service.create_search_session(
+            embedding=[1.0, 0.0],
+            options=vector_db_service.SessionOptions(
+                fuse_modalities=True, modality_weights={"audio": -1.0}
+            ),
+        )
+
+    ((_, params),) = database.statements
+    configured = service.session_settings.modality_weights
+    assert params["visual_text_weight"] == configured["visual-text"]
+    assert params["audio_weight"] == 0.8
+
+
+def clip_result(
+    segment_id,
+    video_id,
+    start_time,
+    similarity,
+    modality="visual-text",
+    scope="clip",
+    query_indexes=None,
+):
+    """A normalized search result for a 6 second clip"""
+    result = {
+        "id": segment_id,
+        "modality": modality,
+        "scope": scope,
+        "start_time": start_time,
+        "end_time": start_time + 6.0,
+        "similarity": similarity,
+        "video": {"id": video_id},
+    }
+    if query_indexes is not None:
+        result["query_indexes"] = query_indexes
+    return result
+
+
+def test_merge_joins_touching_clips_of_a_video(vector_db_service):
+    """Test that back-to-back clips become one range ranked by its best clip."""
+    results = [
+        clip_result(2, 1, 6.0, 0.9),
+        clip_result(9, 2, 0.0, 0.8),
+        clip_result(1, 1, 0.0, 0.7),
+        clip_result(3, 1, 12.0, 0.5),
+    ]
+
+    merged = vector_db_service.merge_adjacent_results(results)
+
+    assert [result["segment_ids"] for result in merged] == [[1, 2, 3], [9]]
+    assert (merged[0]["start_time"], merged[0]["end_time"]) == (0.0, 18.0)
+    assert merged[0]["id"] == 2
+    assert merged[0]["similarity"] == 0.9
+    assert merged[0]["mean_similarity"] == pytest.approx(0.7)
+
+
+def test_merge_keeps_gaps_modalities_and_video_scope_apart(vector_db_service):
+    """Test that only same-modality clips within max_gap are merged."""
+    results = [
+        clip_result(1, 1, 0.0, 0.9),
+        clip_result(2, 1, 8.0, 0.8),
+        clip_result(3, 1, 6.0, 0.7, modality="audio"),
+        clip_result(4, 1, 0.0, 0.6, scope="video"),
+    ]
+
+    separate = vector_db_service.merge_adjacent_results(results)
+    bridged = vector_db_service.merge_adjacent_results(results, max_gap=2.0)
+
+    assert [result["segment_ids"] for result in separate] == [[1], [2], [3], [4]]
+    assert [result["segment_ids"] for result in bridged] == [[1, 2], [3], [4]]
+
+
+def test_merge_unions_query_indexes(vector_db_service):
+    """Test that a merged batch range reports every query that matched a clip."""
+    results = [
+        clip_result(1, 1, 0.0, 0.9, query_indexes=[2]),
+        clip_result(2, 1, 6.0, 0.8, query_indexes=[0, 2]),
+    ]
+
+    (merged,) = vector_db_service.merge_adjacent_results(results)
+
+    assert merged["query_indexes"] == [0, 2]
+
+
+def test_mmr_without_diversity_keeps_relevance_order(vector_db_service):
+    """Test that diversity 0 orders candidates by similarity alone."""
+    similarities = np.array([0.5, 0.9, 0.7])
+    embeddings = np.eye(3)
+
+    order = vector_db_service.mmr_order(similarities, embeddings, 0.0, 3)
+
+    assert order == [1, 2, 0]
+
+
+def test_mmr_skips_near_duplicates(vector_db_service):
+    """Test that diversity promotes a distinct candidate over a near duplicate."""
+    similarities = np.array([0.9, 0.88, 0.6])
+    embeddings = np.array([[1.0, 0.0], [0.995, 0.0999], [0.0, 1.0]])
+
+    order = vector_db_service.mmr_order(similarities, embeddings, 0.5, 2)
+
+    assert order == [0, 2]
+
+
+def test_mmr_handles_empty_and_short_candidate_lists(vector_db_service):
+    """Test that MMR returns at most the candidates it was given."""
+    assert vector_db_service.mmr_order(np.array([]), np.empty((0, 2)), 0.5, 3) == []
+    assert vector_db_service.mmr_order(np.array([0.4]), np.eye(1), 0.5, 3) == [0]
+    assert vector_db_service.mmr_order(np.array([0.4]), np.eye(1), 0.5, 0) == []
+
+
+def test_clustering_assigns_and_probes_nearest_centroids(vector_db_service):
+    """Test that a clustering assigns the nearest centroid and probes the top nprobe."""
+    clustering = vector_db_service.EmbeddingClustering(
+        version=3, centroids=np.eye(3, dtype=np.float32)
+    )
+
+    assert clustering.assign([0.2, 0.9, 0.1]) == 1
+    assert sorted(clustering.nearest([0.6, 0.1, 0.8], nprobe=2)) == [0, 2]
+    assert sorted(clustering.nearest([0.6, 0.1, 0.8], nprobe=10)) == [0, 1, 2]
+
+
+def test_ivf_search_scans_only_probed_clusters(vector_db_service, service):
+    """Test that an ivf search compares the rows of its nearest clusters only."""
+    service.get_active_clustering = lambda: vector_db_service.EmbeddingClustering(
+        version=3, centroids=np.eye(3, dtype=np.float32)
+    )
+    query_params = {"embedding": [0.6, 0.1, 0.8], "candidate_limit": 10}
+
+    query = service._ranked_segments_query(
+        None, query_params, batch=False, search_mode="ivf", nprobe=2
+    )
+    plan = service._plan_search(None, search_mode="ivf", strategy="ann")
+
+    assert sorted(query_params["cluster_ids"]) == [0, 2]
+    assert "cluster_id = ANY(query_embeddings.cluster_ids)" in query
+    # Rows are compared under the version the database holds active, not the
+    # cached one
+    assert "clustering_version" not in query_params
+    assert vector_db_service.ACTIVE_CLUSTERING_VERSION in query
+    assert plan["search_mode"] == "ivf"
+    assert service._search_settings(20, plan) == {"enable_indexscan": "off"}
+
+
+def test_ivf_search_falls_back_to_hnsw_without_clustering(service):
+    """Test that ivf searches use hnsw until a clustering is activated."""
+    service.get_active_clustering = lambda: None
+    query_params = {"embedding": [1.0, 0.0, 0.0], "candidate_limit": 10}
+
+    query = service._ranked_segments_query(
+        None, query_params, batch=False, search_mode="ivf"
+    )
+
+    assert "cluster_ids" not in query_params
+    assert "cluster_id" not in query
+    assert service._plan_search(None, search_mode="ivf")["search_mode"] == "hnsw"
+
+
+def test_prepared_query_numbers_named_parameters_once(vector_db_service):
+    """Test that a repeated named parameter becomes one $n with its cast."""
+    query, parameters = vector_db_service.to_prepared_query(
+        "SELECT %(embedding)s::vector, %(limit)s, %(embedding)s::vector"
+    )
+
+    assert query == "SELECT $1::vector, $2, $1::vector"
+    assert parameters == [("embedding", "::vector"), ("limit", "")]
+
+
+def test_prepared_query_numbers_positional_parameters_in_turn(vector_db_service):
+    """Test that each %s is its own parameter and %% stays a literal %."""
+    query, parameters = vector_db_service.to_prepared_query(
+        "SELECT %s::int[], %s WHERE name LIKE 'a%%' AND q <%% name"
+    )
+
+    assert query == "SELECT $1::int[], $2 WHERE name LIKE 'a%' AND q <% name"
+    assert parameters == [(0, "::int[]"), (1, "")]
+
+
+def prepared_cursor(connection):
+    return MagicMock(connection=connection)
+
+
+def executed(cursor):
+    return [call.args[0] for call in cursor.execute.call_args_list]
+
+
+def test_statement_is_prepared_once_per_connection(service):
+    """Test that a query is PREPAREd on first use and only EXECUTEd after."""
+    cursor = prepared_cursor(service.conn)
+    query = "SELECT * FROM videos WHERE id = %s::int AND s3_key = %s"
+
+    service._execute_prepared(cursor, query, (1, "a.mp4"))
+    service._execute_prepared(cursor, query, (2, "b.mp4"))
+
+    prepare, first, second = executed(cursor)
+    name = prepare.split()[1]
+    assert prepare == (
+        f"PREPARE {name} AS SELECT * FROM videos WHERE id = $1::int AND s3_key = $2"
+    )
+    assert first == second == f"EXECUTE {name}(%s::int, %s)"
+    assert cursor.execute.call_args.args[1] == [2, "b.mp4"]
+
+
+def test_plan_settings_prepare_a_statement_of_their_own(service):
+    """Test that the same query under other planner settings is prepared again."""
+    cursor = prepared_cursor(service.conn)
+    query = "SELECT %(limit)s"
+
+    service._execute_prepared(cursor, query, {"limit": 1})
+    service._execute_prepared(
+        cursor, query, {"limit": 1}, {"enable_indexscan": "off"}
+    )
+
+    prepares = [sql for sql in executed(cursor) if sql.startswith("PREPARE")]
+    assert len(prepares) == 2
+    assert prepares[0].split()[1] != prepares[1].split()[1]
+
+
+def test_statements_are_prepared_again_after_a_reconnect(service):
+    """Test that a new connection starts with no prepared statements."""
+    query = "SELECT %s"
+    service._execute_prepared(prepared_cursor(service.conn), query, (1,))
+
+    reconnected = prepared_cursor(MagicMock(closed=0))
+    service._execute_prepared(reconnected, query, (1,))
+
+    assert executed(reconnected)[0].startswith("PREPARE")
+
+
+def test_statement_limit_deallocates_all(service):
+    """Test that preparing past the limit deallocates the connection's statements."""
+    service.prepared_statement_limit = 2
+    cursor = prepared_cursor(service.conn)
+
+    for value in range(3):
+        service._execute_prepared(cursor, f"SELECT %s + {value}", (value,))
+
+    assert executed(cursor).count("DEALLOCATE ALL") == 1
+    assert len(service._prepared_statements) == 1
+
+
+class PoolerConnection:
+    """
+    A connection whose prepared statements can be dropped, as a pooler's
+    DISCARD ALL does, and whose transaction aborts on an error
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.settings = {}
+        self.aborted = False
+        # False drops each statement as soon as it is prepared
+        self.keep_statements = True
+
+    def discard_all(self):
+        self.statements.clear()
+
+    def rollback(self):
+        self.settings.clear()
+        self.aborted = False
+
+    def cursor(self):
+        return PoolerCursor(self)
+
+
+class PoolerCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.queries = []
+
+    def execute(self, query, params=None):
+        connection = self.connection
+        self.queries.append(query)
+        if connection.aborted:
+            raise InFailedSqlTransaction()
+        if query.startswith("SELECT set_config"):
+            connection.settings.update(zip(params[::2], params[1::2]))
+        elif query.startswith("PREPARE"):
+            name, _, statement = query.split(" ", 3)[1:]
+            if connection.keep_statements:
+                connection.statements[name] = statement
+        elif query.startswith("EXECUTE"):
+            name = query.split()[1].split("(")[0]
+            if name not in connection.statements:
+                connection.aborted = True
+                raise InvalidSqlStatementName()
+            # Each statement in these tests selects its parameters
+            self.rows = [(*params, dict(connection.settings))]
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchone(self):
+        return self.rows[0]
+
+
+def test_deallocated_statement_is_prepared_again_and_retried(service):
+    """Test that a statement dropped behind the service's back is retried once."""
+    connection = PoolerConnection()
+    cursor = connection.cursor()
+    settings = {"enable_seqscan": "off"}
+    service._apply_settings(cursor, settings)
+    service._execute_prepared(cursor, "SELECT %s", (1,), settings, settings)
+    connection.discard_all()
+
+    service._execute_prepared(cursor, "SELECT %s", (2,), settings, settings)
+
+    assert cursor.fetchone() == (2, settings)
+    # The transaction is usable again for a second query
+    service._execute_prepared(cursor, "SELECT %s, %s", (3, 4))
+    assert cursor.fetchone() == (3, 4, settings)
+    assert len(connection.statements) == 2
+
+
+def test_a_second_failure_is_raised(service):
+    """Test that a statement deallocated again during its retry is not retried."""
+    connection = PoolerConnection()
+    cursor = connection.cursor()
+    service._execute_prepared(cursor, "SELECT %s", (1,))
+    connection.discard_all()
+    connection.keep_statements = False
+
+    with pytest.raises(InvalidSqlStatementName):
+        service._execute_prepared(cursor, "SELECT %s", (2,))
+
+
+def test_search_settings_are_applied_in_one_statement(service):
+    """Test that every search setting is set with a single round trip."""
+    cursor = PoolerConnection().cursor()
+    settings = {"hnsw.ef_search": "80", "enable_seqscan": "off", "jit": "off"}
+
+    service._apply_settings(cursor, settings)
+    service._apply_settings(cursor, {})
+
+    assert cursor.connection.settings == settings
+    assert len(cursor.queries) == 1
+
+
+def test_prepared_statements_can_be_disabled(service):
+    """Test that with prepared statements off the query is sent as text."""
+    service.prepared_statements = False
+    cursor = prepared_cursor(service.conn)
+
+    service._execute_prepared(cursor, "SELECT %s", (1,))
+
+    cursor.execute.assert_called_once_with("SELECT %s", (1,))
+
+
+def test_ingest_rereads_models_replaced_by_an_activation(vector_db_service, service):
+    """Test that segments are stored with the version active under the lock."""
+    old, new = (
+        vector_db_service.EmbeddingProjection(version, np.zeros(3), np.eye(3))
+        for version in (1, 2)
+    )
+    service.get_active_projection = MagicMock(side_effect=[old, new])
+    service.get_active_clustering = MagicMock(return_value=None)
+    cursor = service.conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = (2, None)
+
+    projection, clustering = service._lock_segment_models()
+
+    assert (projection, clustering) == (new, None)
+    assert service.conn.rollback.call_count == 1
+    assert cursor.execute.call_args_list[0].args == (
+        "LOCK TABLE video_segments IN ROW EXCLUSIVE MODE",
+    )
@@ -0,0 +1,205 @@
+import numpy as np
+import pytest
+from mock_data import TestDataBuilder
+
+
+def segment(embedding, modality="visual-text", scope="clip", start_time=0.0):
+    values = np.asarray(embedding, dtype=np.float32)
+    return {
+        "embedding": values / np.linalg.norm(values),
+        "modality": modality,
+        "scope": scope,
+        "start_time": start_time,
+        "end_time": start_time + 6.0,
+    }
+
+
+@pytest.fixture
+def vector_store(vector_database_layer):
+    return vector_database_layer("vector_store")
+
+
+@pytest.fixture
+def store(vector_store):
+    store = vector_store.NumpyVectorStore(min_similarity=-1.0)
+    store.upsert_segments(
+        1,
+        [segment([1.0, 0.0, 0.0]), segment([0.0, 1.0, 0.0], start_time=6.0)],
+        video={"filename": "first.mp4"},
+    )
+    store.upsert_segments(2, [segment([0.8, 0.6, 0.0], modality="audio")])
+    store.upsert_segments(3, [segment([0.6, 0.8, 0.0], scope="video")])
+    return store
+
+
+def test_numpy_store_implements_the_vector_store_protocol(vector_store, store):
+    """Test that NumpyVectorStore satisfies the VectorStore protocol."""
+    assert isinstance(store, vector_store.VectorStore)
+
+
+def test_find_similar_returns_the_top_k_best_first(store):
+    """Test that results are the most similar segments, in similarity order."""
+    results = store.find_similar([1.0, 0.0, 0.0], limit=3)
+
+    assert [result["id"] for result in results] == [1, 3, 4]
+    assert [result["video"]["id"] for result in results] == [1, 2, 3]
+    assert results[0]["similarity"] == pytest.approx(1.0)
+    assert results[1]["similarity"] == pytest.approx(0.8)
+    assert results[0]["video"]["filename"] == "first.mp4"
+    assert results[1]["modality"] == "audio"
+    assert "query_indexes" not in results[0]
+
+
+def test_find_similar_pages_and_applies_the_min_similarity(store):
+    """Test that pages continue the ranking and weak matches are left out."""
+    second_page = store.find_similar([1.0, 0.0, 0.0], page=1, limit=2)
+    strong = store.find_similar([1.0, 0.0, 0.0], min_similarity=0.7)
+
+    assert [result["id"] for result in second_page] == [4, 2]
+    assert [result["id"] for result in strong] == [1, 3]
+
+
+@pytest.mark.parametrize(
+    "filter, expected_ids",
+    [
+        ({"modality": "audio"}, [3]),
+        ({"scope": "video"}, [4]),
+        ({"modality": "visual-text", "scope": "clip"}, [1, 2]),
+        ({"video_id": [1, 3]}, [1, 4, 2]),
+        ({"video_id": 2}, [3]),
+    ],
+)
+def test_find_similar_applies_the_filter(store, filter, expected_ids):
+    """Test that modality, scope and video_id filters restrict the results."""
+    results = store.find_similar([1.0, 0.0, 0.0], filter=filter)
+
+    assert [result["id"] for result in results] == expected_ids
+
+
+def test_find_similar_batch_keeps_each_segments_best_query(store):
+    """Test that batch results keep the best similarity and every matching query."""
+    results = store.find_similar_batch([[0.0, 1.0, 0.0], [1.0, 0.0, 0.0]], limit=2)
+
+    assert [result["id"] for result in results] == [1, 2]
+    assert results[0]["query_indexes"] == [1]
+    assert results[1]["query_indexes"] == [0]
+    assert results[0]["similarity"] == pytest.approx(1.0)
+
+
+def test_delete_tombstones_and_compacts_dead_rows(store):
+    """Test that deleted segments stop matching and are compacted away."""
+    deleted = store.delete_video_segments(1)
+
+    results = store.find_similar([1.0, 0.0, 0.0])
+
+    assert deleted == 2
+    assert [result["id"] for result in results] == [3, 4]
+    assert 1 not in store.videos
+    # Two of four rows were dead, above the compaction threshold
+    assert store.segment_ids.tolist() == [3, 4]
+    assert store.alive.all()
+    assert sum(len(block) for block in store.embedding_blocks) == 2
+
+
+def test_upsert_replaces_a_videos_segments(store):
+    """Test that upserting a video replaces its segments and keeps its metadata."""
+    store.upsert_segments(1, [segment([0.0, 0.0, 1.0])])
+
+    results = store.find_similar([0.0, 0.0, 1.0], limit=1)
+
+    assert results[0]["id"] == 5
+    assert results[0]["video"]["filename"] == "first.mp4"
+    assert [
+        result["id"]
+        for result in store.find_similar([0.0, 1.0, 0.0], filter={"video_id": 1})
+    ] == [5]
+
+
+def test_float16_store_matches_float32(vector_store, store):
+    """Test that a float16 store ranks like a float32 one."""
+    half = vector_store.NumpyVectorStore(min_similarity=0.0, dtype="float16")
+    for video_id in store.videos:
+        rows = store.video_ids == video_id
+        half.upsert_segments(
+            video_id,
+            [
+                segment(embedding, *store.partition_keys[partition])
+                for embedding, partition in zip(
+                    store.embedding_blocks[0][rows], store.partitions[rows]
+                )
+            ],
+        )
+
+    query = [0.6, 0.8, 0.0]
+    assert [result["id"] for result in half.find_similar(query)] == [
+        result["id"] for result in store.find_similar(query)
+    ]
+    with pytest.raises(ValueError):
+        vector_store.NumpyVectorStore(dtype="int8")
+
+
+def test_ivf_search_only_scores_the_probed_lists(vector_store):
+    """Test that after build_ivf a search only returns rows of the nearest lists."""
+    store = vector_store.NumpyVectorStore(min_similarity=-1.0, nprobe=1)
+    store.upsert_segments(
+        1,
+        [segment([1.0, 0.1 * index, 0.0]) for index in range(4)]
+        + [segment([0.0, 0.1 * index, 1.0]) for index in range(4)],
+    )
+
+    info = store.build_ivf(lists=2, seed=0)
+    results = store.find_similar([1.0, 0.0, 0.0], limit=8)
+
+    assert info == {"lists": 2, "sample_size": 8, "max_list_size": 4}
+    assert store.last_search_plan["strategy"] == "ivf"
+    assert [result["id"] for result in results] == [1, 2, 3, 4]
+
+    store.nprobe = 2
+    results = store.find_similar([1.0, 0.0, 0.0], limit=8)
+    assert store.last_search_plan["strategy"] == "exact"
+    assert len(results) == 8
+
+
+def test_ivf_assigns_lists_to_appended_rows(vector_store):
+    """Test that segments added after build_ivf are assigned an inverted list."""
+    store = vector_store.NumpyVectorStore(min_similarity=0.0, nprobe=1)
+    store.upsert_segments(1, [segment([1.0, 0.0, 0.0]), segment([0.0, 0.0, 1.0])])
+    store.build_ivf(lists=2)
+
+    store.upsert_segments(2, [segment([0.9, 0.1, 0.0])])
+    results = store.find_similar([1.0, 0.0, 0.0])
+
+    assert len(store.list_ids) == len(store.segment_ids)
+    assert [result["id"] for result in results] == [1, 3]
+
+
+def test_build_ivf_needs_a_row_per_list(vector_store, store):
+    """Test that build_ivf refuses more lists than live segments."""
+    with pytest.raises(ValueError):
+        store.build_ivf(lists=5)
+
+
+def test_minibatch_kmeans_finds_separated_clusters(vector_store):
+    """Test that k-means puts one unit centroid on each group of embeddings."""
+    centers = np.eye(4)[:3]
+    sample = TestDataBuilder.unit_rows(centers, 50)
+
+    centroids = vector_store.minibatch_kmeans(
+        sample, 3, iterations=50, batch_size=32
+    )
+
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0)
+    # Every center is matched by its own centroid
+    nearest = np.argmax(centers @ centroids.T, axis=1)
+    assert sorted(nearest.tolist()) == [0, 1, 2]
+    assert (centers @ centroids.T).max(axis=1).min() > 0.95
+
+
+def test_minibatch_kmeans_is_deterministic_for_a_seed(vector_store):
+    """Test that the same seed fits the same centroids."""
+    sample = TestDataBuilder.unit_rows(np.eye(3), 20)
+
+    first = vector_store.minibatch_kmeans(sample, 3, iterations=10, seed=7)
+    second = vector_store.minibatch_kmeans(sample, 3, iterations=10, seed=7)
+
+    np.testing.assert_array_equal(first, second)
@@ -8,19 +8,43 @@ locals {
   }
 
   # Application configuration defaults
-  embedding_model             = "Marengo-retrieval-2.7"
-  clip_length                 = 6
-  min_similarity              = 0.2
-  page_limit                  = 5
-  query_media_file_size_limit = 6000000
-  default_task_limit          = 10
-  max_task_limit              = 50
-  default_task_page           = 0
-  presigned_url_expiry        = 86400
-  presigned_url_ttl           = 600
-  file_check_retries          = 2
-  file_check_delay_sec        = 2.0
-  video_embedding_scopes      = ["clip", "video"]
+  embedding_model               = "Marengo-retrieval-2.7"
+  clip_length                   = 6
+  min_similarity                = 0.2
+  page_limit                    = 5
+  query_media_file_size_limit   = 6000000
+  default_task_limit            = 10
+  max_task_limit                = 50
+  default_task_page             = 0
+  presigned_url_expiry          = 86400
+  presigned_url_ttl             = 600
+  file_check_retries            = 2
+  file_check_delay_sec          = 2.0
+  video_embedding_scopes        = ["clip", "video"]
+  hnsw_ef_search_min            = 40
+  hnsw_ef_search_max            = 1000
+  hnsw_iterative_scan           = ""
+  hnsw_max_scan_tuples          = 20000
+  search_session_ttl            = 900
+  search_session_max_candidates = 200
+  embedding_storage             = "vector"
+  search_mode                   = "hnsw"
+  binary_oversample             = 10
+  coarse_oversample             = 4
+  segments_per_video            = 3
+  mmr_oversample                = 3
+  hybrid_lexical_limit          = 50
+  hybrid_lexical_threshold      = 0.6
+  rrf_k                         = 60
+  visual_text_weight            = 0.5
+  audio_weight                  = 0.5
+  hierarchical_videos           = 100
+  exact_search_max_rows         = 20000
+  search_engine                 = "database"
+  snapshot_dtype                = "float32"
+  snapshot_path                 = ""
+  ivf_nprobe                    = 8
+  db_bootstrap_memory_size      = 2048
 
   azs = data.aws_availability_zones.available.names
 }
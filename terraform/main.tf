@@ -94,6 +94,30 @@ module "lambda" {
   secret_name                                       = var.secret_name
   aws_profile                                       = var.aws_profile
   embedding_cache_table_name                        = module.dynamodb.table_name
+  hnsw_ef_search_min                                = local.hnsw_ef_search_min
+  hnsw_ef_search_max                                = local.hnsw_ef_search_max
+  hnsw_iterative_scan                               = local.hnsw_iterative_scan
+  hnsw_max_scan_tuples                              = local.hnsw_max_scan_tuples
+  search_session_ttl                                = local.search_session_ttl
+  search_session_max_candidates                     = local.search_session_max_candidates
+  embedding_storage                                 = local.embedding_storage
+  search_mode                                       = local.search_mode
+  binary_oversample                                 = local.binary_oversample
+  coarse_oversample                                 = local.coarse_oversample
+  segments_per_video                                = local.segments_per_video
+  mmr_oversample                                    = local.mmr_oversample
+  hybrid_lexical_limit                              = local.hybrid_lexical_limit
+  hybrid_lexical_threshold                          = local.hybrid_lexical_threshold
+  rrf_k                                             = local.rrf_k
+  visual_text_weight                                = local.visual_text_weight
+  audio_weight                                      = local.audio_weight
+  hierarchical_videos                               = local.hierarchical_videos
+  exact_search_max_rows                             = local.exact_search_max_rows
+  search_engine                                     = local.search_engine
+  snapshot_dtype                                    = local.snapshot_dtype
+  snapshot_path                                     = local.snapshot_path
+  ivf_nprobe                                        = local.ivf_nprobe
+  db_bootstrap_memory_size                          = local.db_bootstrap_memory_size
 }
 
 module "sqs" {
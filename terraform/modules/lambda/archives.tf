@@ -55,9 +55,13 @@ resource "terraform_data" "build_s3_utils_layer" {
 
 resource "terraform_data" "build_vector_database_layer" {
   triggers_replace = {
-    exists      = fileexists("${local.base_path}/layers/vector_database_layer/package.zip")
-    deps_hash   = filemd5("${local.base_path}/layers/vector_database_layer/pyproject.toml")
-    source_hash = filemd5("${local.base_path}/layers/vector_database_layer/vector_db_service.py")
+    exists        = fileexists("${local.base_path}/layers/vector_database_layer/package.zip")
+    deps_hash     = filemd5("${local.base_path}/layers/vector_database_layer/pyproject.toml")
+    source_hash   = filemd5("${local.base_path}/layers/vector_database_layer/vector_db_service.py")
+    snapshot_hash = filemd5("${local.base_path}/layers/vector_database_layer/snapshot_search.py")
+    format_hash   = filemd5("${local.base_path}/layers/vector_database_layer/embedding_snapshot.py")
+    store_hash    = filemd5("${local.base_path}/layers/vector_database_layer/vector_store.py")
+    adapter_hash  = filemd5("${local.base_path}/layers/vector_database_layer/vector_adapter.py")
   }
 
   provisioner "local-exec" {
@@ -68,10 +72,15 @@ resource "terraform_data" "build_vector_database_layer" {
 
 resource "terraform_data" "build_db_bootstrap" {
   triggers_replace = {
-    exists      = fileexists("${local.base_path}/db_bootstrap/package.zip")
-    deps_hash   = filemd5("${local.base_path}/db_bootstrap/pyproject.toml")
-    source_hash = filemd5("${local.base_path}/db_bootstrap/lambda_function.py")
-    schema_hash = filemd5("${local.base_path}/db_bootstrap/schema.sql")
+    exists         = fileexists("${local.base_path}/db_bootstrap/package.zip")
+    deps_hash      = filemd5("${local.base_path}/db_bootstrap/pyproject.toml")
+    source_hash    = filemd5("${local.base_path}/db_bootstrap/lambda_function.py")
+    schema_hash    = filemd5("${local.base_path}/db_bootstrap/schema.sql")
+    halfvec_hash   = filemd5("${local.base_path}/db_bootstrap/halfvec_migration.py")
+    normalize_hash = filemd5("${local.base_path}/db_bootstrap/normalize_migration.py")
+    pca_hash       = filemd5("${local.base_path}/db_bootstrap/projection_refresh.py")
+    kmeans_hash    = filemd5("${local.base_path}/db_bootstrap/cluster_refresh.py")
+    benchmark_hash = filemd5("${local.base_path}/db_bootstrap/hierarchical_benchmark.py")
   }
 
   provisioner "local-exec" {
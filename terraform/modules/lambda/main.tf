@@ -72,13 +72,15 @@ resource "aws_lambda_function" "kubrick_db_bootstrap" {
 
   layers = [
     aws_lambda_layer_version.config_layer.arn,
+    aws_lambda_layer_version.vector_database_layer.arn,
   ]
 
   environment {
     variables = {
-      DB_HOST     = var.db_host
-      SECRET_NAME = var.secret_name
-      LOG_LEVEL   = "INFO"
+      DB_HOST       = var.db_host
+      SECRET_NAME   = var.secret_name
+      SNAPSHOT_PATH = var.snapshot_path
+      LOG_LEVEL     = "INFO"
     }
   }
 
@@ -88,6 +90,10 @@ resource "aws_lambda_function" "kubrick_db_bootstrap" {
   }
 
   timeout = 300 # 5 minutes timeout
+
+  # projection_fit and clustering_fit sample up to 50000 embeddings of 4 KB
+  # each, plus the SVD or k-means work on them
+  memory_size = var.db_bootstrap_memory_size
 }
 
 resource "null_resource" "invoke_db_bootstrap" {
@@ -129,16 +135,39 @@ resource "aws_lambda_function" "kubrick_api_search_handler" {
 
   environment {
     variables = {
-      DB_HOST                     = var.db_host
-      DB_PASSWORD                 = var.db_password
-      DEFAULT_CLIP_LENGTH         = var.clip_length
-      DEFAULT_MIN_SIMILARITY      = var.min_similarity
-      DEFAULT_PAGE_LIMIT          = var.page_limit
-      EMBEDDING_MODEL_NAME        = var.embedding_model
-      QUERY_MEDIA_FILE_SIZE_LIMIT = var.query_media_file_size_limit
-      SECRET_NAME                 = var.secret_name
-      EMBEDDING_CACHE_TABLE_NAME  = var.embedding_cache_table_name
-      LOG_LEVEL                   = "INFO"
+      DB_HOST                       = var.db_host
+      DB_PASSWORD                   = var.db_password
+      DEFAULT_CLIP_LENGTH           = var.clip_length
+      DEFAULT_MIN_SIMILARITY        = var.min_similarity
+      DEFAULT_PAGE_LIMIT            = var.page_limit
+      EMBEDDING_MODEL_NAME          = var.embedding_model
+      QUERY_MEDIA_FILE_SIZE_LIMIT   = var.query_media_file_size_limit
+      SECRET_NAME                   = var.secret_name
+      EMBEDDING_CACHE_TABLE_NAME    = var.embedding_cache_table_name
+      HNSW_EF_SEARCH_MIN            = var.hnsw_ef_search_min
+      HNSW_EF_SEARCH_MAX            = var.hnsw_ef_search_max
+      HNSW_ITERATIVE_SCAN           = var.hnsw_iterative_scan
+      HNSW_MAX_SCAN_TUPLES          = var.hnsw_max_scan_tuples
+      SEARCH_SESSION_TTL            = var.search_session_ttl
+      SEARCH_SESSION_MAX_CANDIDATES = var.search_session_max_candidates
+      EMBEDDING_STORAGE             = var.embedding_storage
+      SEARCH_MODE                   = var.search_mode
+      BINARY_OVERSAMPLE             = var.binary_oversample
+      COARSE_OVERSAMPLE             = var.coarse_oversample
+      SEGMENTS_PER_VIDEO            = var.segments_per_video
+      MMR_OVERSAMPLE                = var.mmr_oversample
+      HYBRID_LEXICAL_LIMIT          = var.hybrid_lexical_limit
+      HYBRID_LEXICAL_THRESHOLD      = var.hybrid_lexical_threshold
+      RRF_K                         = var.rrf_k
+      VISUAL_TEXT_WEIGHT            = var.visual_text_weight
+      AUDIO_WEIGHT                  = var.audio_weight
+      HIERARCHICAL_VIDEOS           = var.hierarchical_videos
+      EXACT_SEARCH_MAX_ROWS         = var.exact_search_max_rows
+      SEARCH_ENGINE                 = var.search_engine
+      SNAPSHOT_DTYPE                = var.snapshot_dtype
+      SNAPSHOT_PATH                 = var.snapshot_path
+      IVF_NPROBE                    = var.ivf_nprobe
+      LOG_LEVEL                     = "INFO"
     }
   }
 
@@ -149,6 +178,9 @@ resource "aws_lambda_function" "kubrick_api_search_handler" {
 
   timeout = 900 # 15 minutes timeout
 
+  # The in-memory engine holds every segment embedding in the execution environment
+  memory_size = var.search_engine == "memory" ? 3008 : 128
+
 }
 
 # kubrick_s3_delete_handler
@@ -344,6 +376,7 @@ resource "aws_lambda_function" "kubrick_sqs_embedding_task_consumer" {
       SECRET_NAME                    = var.secret_name
       QUEUE_URL                      = var.queue_url
       SQS_MESSAGE_VISIBILITY_TIMEOUT = var.sqs_message_visibility_timeout
+      EMBEDDING_STORAGE              = var.embedding_storage
       LOG_LEVEL                      = "INFO"
     }
   }
@@ -176,3 +176,122 @@ variable "embedding_cache_table_name" {
   type        = string
 }
 
+variable "hnsw_ef_search_min" {
+  description = "Lower bound for the per-query HNSW ef_search"
+  type        = number
+}
+
+variable "hnsw_ef_search_max" {
+  description = "Upper bound for the per-query HNSW ef_search"
+  type        = number
+}
+
+variable "hnsw_iterative_scan" {
+  description = "HNSW iterative scan mode for filtered searches: strict, relaxed or empty to disable"
+  type        = string
+}
+
+variable "hnsw_max_scan_tuples" {
+  description = "Maximum tuples an iterative HNSW scan may visit"
+  type        = number
+}
+
+variable "search_session_ttl" {
+  description = "Seconds a search session keeps its ranked candidates"
+  type        = number
+}
+
+variable "search_session_max_candidates" {
+  description = "Number of ranked candidates stored per search session"
+  type        = number
+}
+
+variable "embedding_storage" {
+  description = "Column type of video_segments.embedding: vector, or halfvec after the halfvec migration swap"
+  type        = string
+}
+
+variable "search_mode" {
+  description = "Default vector search mode: hnsw, binary / coarse for a binary-quantized / PCA-projected candidate scan with exact rerank (after the binary_indexes / projection_indexes db_bootstrap actions), hierarchical for a video-scope prefilter, or ivf to scan only the nearest k-means clusters"
+  type        = string
+}
+
+variable "binary_oversample" {
+  description = "Candidates fetched per result by the binary search mode before the exact rerank"
+  type        = number
+}
+
+variable "coarse_oversample" {
+  description = "Candidates fetched per result by the coarse search mode before the exact rerank"
+  type        = number
+}
+
+variable "segments_per_video" {
+  description = "Top segments kept per video when search results are grouped by video"
+  type        = number
+}
+
+variable "mmr_oversample" {
+  description = "Candidates ranked per stored result when search results are diversified with MMR"
+  type        = number
+}
+
+variable "hybrid_lexical_limit" {
+  description = "Videos matched by filename or S3 key that take part in a hybrid search"
+  type        = number
+}
+
+variable "hybrid_lexical_threshold" {
+  description = "pg_trgm word similarity a filename or S3 key needs to match a hybrid search"
+  type        = number
+}
+
+variable "rrf_k" {
+  description = "Rank offset k of reciprocal rank fusion in hybrid search"
+  type        = number
+}
+
+variable "visual_text_weight" {
+  description = "Weight of visual-text similarity when search fuses modalities"
+  type        = number
+}
+
+variable "audio_weight" {
+  description = "Weight of audio similarity when search fuses modalities"
+  type        = number
+}
+
+variable "hierarchical_videos" {
+  description = "Videos prefiltered by video-scope embedding in hierarchical search"
+  type        = number
+}
+
+variable "exact_search_max_rows" {
+  description = "Searches expected to compare at most this many segments use an exact scan instead of HNSW"
+  type        = number
+}
+
+variable "search_engine" {
+  description = "Backend that ranks new search sessions: database or memory (in-process embedding snapshot)"
+  type        = string
+}
+
+variable "snapshot_dtype" {
+  description = "Element type of the in-memory embedding snapshot: float32 or float16"
+  type        = string
+}
+
+variable "snapshot_path" {
+  description = "Directory of an embedding_snapshot the in-memory search engine memory-maps, e.g. an EFS mount; empty loads embeddings from the database"
+  type        = string
+}
+
+variable "ivf_nprobe" {
+  description = "Clusters scanned per query vector in ivf search mode"
+  type        = number
+}
+
+variable "db_bootstrap_memory_size" {
+  description = "Memory in MB of the db_bootstrap lambda, sized for the float32 samples projection_fit and clustering_fit hold in memory"
+  type        = number
+}